@@ -2,11 +2,12 @@
 from __future__ import annotations
 
 import asyncio
-import json
+from http import HTTPStatus
 import logging
 import secrets
+import time
 
-from aiohttp.web import Request
+from aiohttp.web import Request, Response
 
 from homeassistant.components import cloud, persistent_notification, webhook
 from homeassistant.components.webhook import (
@@ -20,27 +21,42 @@ from homeassistant.const import (
     EVENT_HOMEASSISTANT_STOP,
     Platform,
 )
-from homeassistant.core import CoreState, Event, HomeAssistant
+from homeassistant.core import CoreState, Event, HomeAssistant, callback
+from homeassistant.exceptions import ConfigEntryNotReady
 from homeassistant.helpers import (
     aiohttp_client,
     config_entry_oauth2_flow,
     issue_registry as ir,
 )
-from homeassistant.helpers.dispatcher import async_dispatcher_send
 from homeassistant.helpers.network import NoURLAvailableError
+from homeassistant.util.json import json_loads
 
 from .api import TTLockApi
 from .const import (
+    CONF_ACCOUNT_CONCURRENCY,
+    CONF_BULK_CONCURRENCY,
+    CONF_GATEWAY_CONCURRENCY,
+    CONF_OPTIMISTIC,
+    CONF_REQUESTS_PER_SECOND,
     CONF_WEBHOOK_STATUS,
     CONF_WEBHOOK_URL,
+    DEFAULT_ACCOUNT_CONCURRENCY,
+    DEFAULT_GATEWAY_CONCURRENCY,
+    DEFAULT_OPTIMISTIC,
+    DEFAULT_REQUESTS_PER_SECOND,
     DOMAIN,
-    SIGNAL_NEW_DATA,
+    TT_ACCOUNT,
     TT_API,
     TT_LOCKS,
+    TT_OPTIONS,
+    TT_WEBHOOK_QUEUE,
 )
-from .coordinator import LockUpdateCoordinator
+from .coordinator import AccountUpdateCoordinator, LockUpdateCoordinator, startup_window
+from .ingest import WebhookQueue
+from .metrics import Metrics
 from .models import WebhookEvent
 from .services import Services
+from .storage import LockCache
 
 PLATFORMS: list[Platform] = [
     Platform.LOCK,
@@ -69,26 +85,124 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     )
 
     session = config_entry_oauth2_flow.OAuth2Session(hass, entry, implementation)
-    client = TTLockApi(aiohttp_client.async_get_clientsession(hass), session)
-
-    hass.data.setdefault(DOMAIN, {})[entry.entry_id] = {TT_API: client}
-
-    locks = [
-        LockUpdateCoordinator(hass, client, lock_id)
-        for lock_id in await client.get_locks()
-    ]
-    await asyncio.gather(
-        *[coordinator.async_config_entry_first_refresh() for coordinator in locks]
+    client = TTLockApi(
+        aiohttp_client.async_get_clientsession(hass),
+        session,
+        gateway_concurrency=entry.options.get(
+            CONF_GATEWAY_CONCURRENCY, DEFAULT_GATEWAY_CONCURRENCY
+        ),
+        account_concurrency=entry.options.get(
+            CONF_ACCOUNT_CONCURRENCY, DEFAULT_ACCOUNT_CONCURRENCY
+        ),
+        bulk_concurrency=entry.options.get(CONF_BULK_CONCURRENCY),
+        requests_per_second=entry.options.get(
+            CONF_REQUESTS_PER_SECOND, DEFAULT_REQUESTS_PER_SECOND
+        ),
     )
+
+    hass.data.setdefault(DOMAIN, {})[entry.entry_id] = {
+        TT_API: client,
+        TT_OPTIONS: dict(entry.options),
+    }
+
+    account = AccountUpdateCoordinator(hass, client)
+    hass.data[DOMAIN][entry.entry_id][TT_ACCOUNT] = account
+
+    optimistic = entry.options.get(CONF_OPTIMISTIC, DEFAULT_OPTIMISTIC)
+    cache = LockCache(hass, entry.entry_id)
+    if cached := await cache.async_load():
+        # Start from what we knew last time, the cloud is caught up with once
+        # setup has finished so a slow or unreachable API doesn't hold up startup.
+        locks = [
+            LockUpdateCoordinator(hass, client, lock_id, account, optimistic)
+            for lock_id in cached
+        ]
+        for coordinator in locks:
+            coordinator.async_restore(cached[coordinator.lock_id])
+    else:
+        # Only what's needed to create the entities is waited on here, the
+        # lock state follows as each lock is refreshed.
+        await account.async_config_entry_first_refresh()
+        locks = [
+            LockUpdateCoordinator(hass, client, lock_id, account, optimistic)
+            for lock_id in account.data
+        ]
+        try:
+            await asyncio.gather(
+                *[coordinator.async_load_metadata() for coordinator in locks]
+            )
+        except Exception as err:
+            # As the first refresh would, let Home Assistant retry setup later
+            raise ConfigEntryNotReady(f"Unable to load lock details: {err}") from err
     hass.data[DOMAIN][entry.entry_id][TT_LOCKS] = locks
 
-    await WebhookHandler(hass, entry).setup()
+    entry.async_on_unload(cache.async_track(locks))
+    cache.async_schedule_save()
+
+    queue = WebhookQueue(hass)
+    hass.data[DOMAIN][entry.entry_id][TT_WEBHOOK_QUEUE] = queue
+    entry.async_create_background_task(
+        hass, queue.run(), f"{DOMAIN} webhook queue {entry.entry_id}"
+    )
+    await WebhookHandler(hass, entry, queue, client.metrics).setup()
 
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
 
+    entry.async_on_unload(entry.add_update_listener(async_reload_entry))
+
+    if cached:
+        entry.async_create_background_task(
+            hass,
+            async_reconcile_locks(hass, entry, account, locks, cache),
+            f"{DOMAIN} reconcile {entry.entry_id}",
+        )
+    else:
+        async_schedule_initial_refresh(locks)
+
     return True
 
 
+async def async_reconcile_locks(
+    hass: HomeAssistant,
+    entry: ConfigEntry,
+    account: AccountUpdateCoordinator,
+    locks: list[LockUpdateCoordinator],
+    cache: LockCache,
+) -> None:
+    """Refresh locks that were restored from the cache."""
+    await account.async_refresh()
+    if not account.last_update_success:
+        # Keep showing the cached state, each lock still gets its first refresh
+        # soon and the co-ordinators retry on their own from there
+        async_schedule_initial_refresh(locks)
+        return
+
+    if set(account.data) != {coordinator.lock_id for coordinator in locks}:
+        _LOGGER.info("Locks in the account have changed, reloading")
+        # Otherwise the reload would start from the same stale set of locks
+        await cache.async_clear()
+        hass.config_entries.async_schedule_reload(entry.entry_id)
+        return
+
+    async_schedule_initial_refresh(locks)
+
+
+@callback
+def async_schedule_initial_refresh(locks: list[LockUpdateCoordinator]) -> None:
+    """Spread the first refresh of each lock out rather than all at once."""
+    window = startup_window(len(locks))
+    for coordinator in locks:
+        coordinator.async_schedule_initial_refresh(window)
+
+
+async def async_reload_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Reload the config entry when the options change."""
+    # Listeners are also called for changes to entry.data, like a refreshed token
+    if entry.options == hass.data[DOMAIN][entry.entry_id][TT_OPTIONS]:
+        return
+    await hass.config_entries.async_reload(entry.entry_id)
+
+
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload a config entry."""
     if unload_ok := await hass.config_entries.async_unload_platforms(entry, PLATFORMS):
@@ -97,13 +211,26 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     return unload_ok
 
 
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Remove the lock cache along with the config entry."""
+    await LockCache(hass, entry.entry_id).async_remove()
+
+
 class WebhookHandler:
     """Responsible for setting up/processing webhook data."""
 
-    def __init__(self, hass: HomeAssistant, entry: ConfigEntry) -> None:
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        entry: ConfigEntry,
+        queue: WebhookQueue,
+        metrics: Metrics,
+    ) -> None:
         """Init the thing."""
         self.hass = hass
         self.entry = entry
+        self.queue = queue
+        self.metrics = metrics
 
     async def setup(self) -> None:
         """Actually register the webhook."""
@@ -180,29 +307,57 @@ class WebhookHandler:
 
     async def handle_webhook(
         self, hass: HomeAssistant, webhook_id: str, request: Request
-    ) -> None:
-        """Handle webhook callback."""
+    ) -> Response | None:
+        """Handle webhook callback.
 
-        success = False
+        Events are only validated and queued here, so the request is answered
+        without waiting for them to be processed.
+        """
+
+        start = time.monotonic()
+        self.metrics.inc("webhook_requests")
+        events: list[WebhookEvent] = []
         try:
             # {'lockId': ['7252408'], 'notifyType': ['1'], 'records': ['[{"lockId":7252408,"electricQuantity":93,"serverDate":1680810180029,"recordTypeFromLock":17,"recordType":7,"success":1,"lockMac":"16:72:4C:CC:01:C4","keyboardPwd":"<digits>","lockDate":1680810186000,"username":"Jonas"}]'], 'admin': ['jonas@lemon.nz'], 'lockMac': ['16:72:4C:CC:01:C4']}
             if data := await request.post():
                 _LOGGER.debug("Got webhook data: %s", data)
                 for raw_records in data.getall("records", []):
-                    for record in json.loads(raw_records):
-                        async_dispatcher_send(
-                            hass, SIGNAL_NEW_DATA, WebhookEvent.parse_obj(record)
-                        )
-                        success = True
+                    events.extend(
+                        WebhookEvent.from_record(record)
+                        for record in json_loads(raw_records)
+                    )
             else:
                 _LOGGER.debug("handle_webhook, empty payload: %s", await request.text())
         except ValueError as ex:
+            self.metrics.inc("webhook_parse_failures")
             _LOGGER.exception("Exception parsing webhook data: %s", ex)
-            return
+            return None
+        finally:
+            self.metrics.observe(
+                "webhook_parse_seconds", None, time.monotonic() - start
+            )
+
+        if not events:
+            return None
+
+        self.metrics.inc("webhook_records", amount=len(events))
+        if not self.queue.async_put(events):
+            _LOGGER.warning(
+                "Webhook queue is full, turning away %s events", len(events)
+            )
+            # Tell the sender the events weren't taken rather than losing them quietly
+            return Response(status=HTTPStatus.SERVICE_UNAVAILABLE)
+
+        entry_data = self.hass.data.get(DOMAIN, {}).get(self.entry.entry_id, {})
+        if account := entry_data.get(TT_ACCOUNT):
+            # Lets the locks poll less often while push is working
+            account.async_push_received()
 
-        if success and CONF_WEBHOOK_STATUS not in self.entry.data:
+        if CONF_WEBHOOK_STATUS not in self.entry.data:
             self.async_dismiss_setup_message()
 
+        return None
+
     async def unregister_webhook(self, event: Event | None = None) -> None:
         """Remove the webhook (before stop)."""
         webhook_unregister(self.hass, self.entry.data[CONF_WEBHOOK_ID])
@@ -1,38 +1,98 @@
 """API for TTLock bound to Home Assistant OAuth."""
 import asyncio
-from collections.abc import Mapping
+from collections.abc import AsyncIterator, Awaitable, Callable, Hashable, Mapping
+from dataclasses import dataclass
+from functools import partial
 from hashlib import md5
 import json
 import logging
+import random
 from secrets import token_hex
 import time
 from typing import Any, cast
 from urllib.parse import urljoin
 
-from aiohttp import ClientResponse, ClientSession
+from aiohttp import ClientError, ClientResponse, ClientResponseError, ClientSession
 
 from homeassistant.components.application_credentials import AuthImplementation
 from homeassistant.helpers import config_entry_oauth2_flow
+from homeassistant.util.json import json_loads
 
+from .cache import SingleFlight, TTLCache
+from .const import (
+    DEFAULT_ACCOUNT_CONCURRENCY,
+    DEFAULT_GATEWAY_CONCURRENCY,
+    DEFAULT_REQUESTS_PER_SECOND,
+)
+from .metrics import Metrics
 from .models import (
     AddPasscodeConfig,
     Features,
     Lock,
     LockRecord,
     LockState,
+    LockSummary,
     PassageModeConfig,
     Passcode,
     Sensor,
 )
+from .scheduler import LANE_BULK, UNKNOWN_GATEWAY, GatewayScheduler, TokenBucket
 
 _LOGGER = logging.getLogger(__name__)
-GW_LOCK = asyncio.Lock()
+
+# -3003: the gateway is busy, the request never reached the lock
+BUSY_ERRCODES = {-3003}
+# 90000: internal server error, the request may have been applied already
+SERVER_ERRCODES = {90000}
+MAX_ATTEMPTS = 4
+RETRY_BACKOFF_BASE = 0.5
+RETRY_BACKOFF_MAX = 8.0
+# Every successful request earns back a fraction of a retry, so a cloud outage
+# can't turn into a retry storm once the budget has been spent.
+RETRY_BUDGET = 10.0
+RETRY_BUDGET_RATIO = 0.2
+# The most records lockRecord/list returns in one page
+MAX_RECORDS_PAGE_SIZE = 200
+# How many pages of a list are fetched at once once the page count is known
+PAGE_PREFETCH = 4
+# Commands sent with GET, every call has to reach the lock and a server error
+# may come back after the lock has already acted on it
+COMMAND_PATHS = {"lock/lock", "lock/unlock"}
+# Seconds to reuse the response of reads that rarely change, per lock
+CACHE_TTL = {
+    "lock/detail": 30 * 60,
+    "lock/getPassageModeConfig": 6 * 60 * 60,
+    "lock/listKeyboardPwd": 10 * 60,
+}
+# The cached reads each of our own commands makes stale
+CACHE_INVALIDATES = {
+    "lock/configPassageMode": ("lock/getPassageModeConfig",),
+    "keyboardPwd/add": ("lock/listKeyboardPwd",),
+    "keyboardPwd/delete": ("lock/listKeyboardPwd",),
+    "lock/setAutoLockTime": ("lock/detail",),
+    "lock/updateSetting": ("lock/detail",),
+}
 
 
 class RequestFailed(Exception):
     """Exception when TTLock API returns an error."""
 
-    pass
+    def __init__(self, message: str, errcode: int | None = None) -> None:
+        """Initialize with the errcode returned by the API (if any)."""
+        super().__init__(message)
+        self.errcode = errcode
+
+
+@dataclass
+class ApiStats:
+    """Counters for calls that were paced, retried or given up on."""
+
+    throttled: int = 0
+    retried: int = 0
+    dropped: int = 0
+    coalesced: int = 0
+    cache_hits: int = 0
+    cache_misses: int = 0
 
 
 class TTLockAuthImplementation(
@@ -75,10 +135,24 @@ class TTLockApi:
         self,
         websession: ClientSession,
         oauth_session: config_entry_oauth2_flow.OAuth2Session,
+        gateway_concurrency: int = DEFAULT_GATEWAY_CONCURRENCY,
+        account_concurrency: int = DEFAULT_ACCOUNT_CONCURRENCY,
+        bulk_concurrency: int | None = None,
+        requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND,
+        metrics: Metrics | None = None,
     ) -> None:
         """Initialize TTLock auth."""
         self._web_session = websession
         self._oauth_session = oauth_session
+        self.metrics = metrics or Metrics()
+        self.scheduler = GatewayScheduler(
+            gateway_concurrency, account_concurrency, self.metrics, bulk_concurrency
+        )
+        self.stats = ApiStats()
+        self._limiter = TokenBucket(requests_per_second)
+        self._retry_budget = RETRY_BUDGET
+        self._reads: SingleFlight[Mapping[str, Any]] = SingleFlight()
+        self._cache: TTLCache[Mapping[str, Any]] = TTLCache()
 
     async def async_get_access_token(self) -> str:
         """Return a valid access token."""
@@ -95,63 +169,236 @@ class TTLockApi:
 
     async def _parse_resp(self, resp: ClientResponse, log_id: str) -> Mapping[str, Any]:
         if resp.status >= 400:
-            body = await resp.text()
-            _LOGGER.debug(
-                "[%s] Request failed: status=%s, body=%s", log_id, resp.status, body
-            )
-        else:
-            body = await resp.json()
-            _LOGGER.debug(
-                "[%s] Received response: status=%s: body=%s", log_id, resp.status, body
-            )
-
-        resp.raise_for_status()
+            if _LOGGER.isEnabledFor(logging.DEBUG):
+                _LOGGER.debug(
+                    "[%s] Request failed: status=%s, body=%s",
+                    log_id,
+                    resp.status,
+                    await resp.text(),
+                )
+            resp.raise_for_status()
+
+        # Decode the body exactly once, json_loads uses orjson under the hood
+        res = cast(dict, json_loads(await resp.read()))
+        _LOGGER.debug(
+            "[%s] Received response: status=%s: body=%s", log_id, resp.status, res
+        )
 
-        res = cast(dict, await resp.json())
         if res.get("errcode", 0) != 0:
             _LOGGER.debug("[%s] API returned: %s", log_id, res)
-            raise RequestFailed(f"API returned: {res}")
+            raise RequestFailed(f"API returned: {res}", res.get("errcode"))
+
+        return res
+
+    def _should_retry(self, err: Exception, server_errors: bool) -> bool:
+        if isinstance(err, RequestFailed):
+            return err.errcode in BUSY_ERRCODES or (
+                server_errors and err.errcode in SERVER_ERRCODES
+            )
+        if isinstance(err, ClientResponseError):
+            return err.status == 429 or (server_errors and err.status >= 500)
+        return False
 
-        return cast(dict, await resp.json())
+    async def _send(
+        self,
+        log_id: str,
+        request: Callable[[], Awaitable[Mapping[str, Any]]],
+        server_errors: bool,
+    ) -> Mapping[str, Any]:
+        """Send a request paced by the rate limiter, retrying transient failures.
+
+        Server errors are only retried when server_errors is set, since the
+        request may have been applied before the error was returned.
+        """
+        attempt = 1
+        while True:
+            if await self._limiter.acquire():
+                self.stats.throttled += 1
+
+            try:
+                res = await request()
+            except (RequestFailed, ClientResponseError) as err:
+                if not self._should_retry(err, server_errors):
+                    raise
+                if attempt >= MAX_ATTEMPTS or self._retry_budget < 1:
+                    _LOGGER.debug("[%s] Giving up after %s attempts", log_id, attempt)
+                    self.stats.dropped += 1
+                    raise
+
+                self._retry_budget -= 1
+                self.stats.retried += 1
+                delay = min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2 ** (attempt - 1))
+                delay *= random.uniform(0.5, 1)
+                _LOGGER.debug("[%s] Retrying in %.2fs: %s", log_id, delay, err)
+                await asyncio.sleep(delay)
+                attempt += 1
+            else:
+                self._retry_budget = min(
+                    RETRY_BUDGET, self._retry_budget + RETRY_BUDGET_RATIO
+                )
+                return res
 
     async def get(self, path: str, **kwargs: Any) -> Mapping[str, Any]:
-        """Make GET request to the API with kwargs as query params."""
+        """Make GET request to the API with kwargs as query params.
+
+        Reads share the response of an identical request that is in flight, and
+        the endpoints in CACHE_TTL reuse their last response for a while.
+        """
+        if (ttl := CACHE_TTL.get(path)) is None:
+            return await self._coalesce(
+                path, kwargs, partial(self._get, path, **kwargs)
+            )
+
+        group = (path, kwargs.get("lockId"))
+        key = tuple(sorted(kwargs.items()))
+        if (res := self._cache.get(group, key)) is not None:
+            self.stats.cache_hits += 1
+            return res
+
+        self.stats.cache_misses += 1
+        generation = self._cache.generation(group)
+        res = await self._coalesce(path, kwargs, partial(self._get, path, **kwargs))
+        self._cache.set(group, key, res, ttl, generation)
+        return res
+
+    async def _coalesce(
+        self,
+        path: str,
+        params: Mapping[str, Any],
+        request: Callable[[], Awaitable[Mapping[str, Any]]],
+    ) -> Mapping[str, Any]:
+        if path in COMMAND_PATHS:
+            return await request()
+
+        key = (path, tuple(sorted(params.items())))
+        if key in self._reads:
+            self.stats.coalesced += 1
+        return await self._reads.run(key, request)
+
+    async def _get(self, path: str, **kwargs: Any) -> Mapping[str, Any]:
         log_id = token_hex(2)
 
         url = urljoin(self.BASE, path)
         _LOGGER.debug("[%s] Sending request to %s with args=%s", log_id, url, kwargs)
-        resp = await self._web_session.get(
-            url,
-            params=await self._add_auth(**kwargs),
-            headers={"Content-Type": "application/x-www-form-urlencoded"},
-        )
-        return await self._parse_resp(resp, log_id)
+
+        async def request() -> Mapping[str, Any]:
+            resp = await self._web_session.get(
+                url,
+                params=await self._add_auth(**kwargs),
+                headers={"Content-Type": "application/x-www-form-urlencoded"},
+            )
+            return await self._parse_resp(resp, log_id)
+
+        with self.metrics.timed("api_request_seconds", path):
+            return await self._send(
+                log_id, request, server_errors=path not in COMMAND_PATHS
+            )
 
     async def post(self, path: str, **kwargs: Any) -> Mapping[str, Any]:
-        """Make GET request to the API with kwargs as query params."""
+        """Make POST request to the API with kwargs as form data.
+
+        A successful command drops the cached reads it has made stale.
+        """
         log_id = token_hex(2)
 
         url = urljoin(self.BASE, path)
         _LOGGER.debug("[%s] Sending request to %s with args=%s", log_id, url, kwargs)
-        resp = await self._web_session.post(
-            url,
-            params=await self._add_auth(),
-            data=kwargs,
-        )
-        return await self._parse_resp(resp, log_id)
 
-    async def get_locks(self) -> list[int]:
-        """Enumerate all locks in the account."""
-        res = await self.get("lock/list", pageNo=1, pageSize=1000)
-
-        def lock_connectable(lock) -> bool:
-            has_gateway = lock.get("hasGateway") != 0
-            has_wifi = Features.wifi in Features.from_feature_value(
-                lock.get("featureValue")
+        async def request() -> Mapping[str, Any]:
+            resp = await self._web_session.post(
+                url,
+                params=await self._add_auth(),
+                data=kwargs,
+            )
+            return await self._parse_resp(resp, log_id)
+
+        with self.metrics.timed("api_request_seconds", path):
+            res = await self._send(log_id, request, server_errors=False)
+        for stale in CACHE_INVALIDATES.get(path, ()):
+            self._cache.invalidate((stale, kwargs.get("lockId")))
+        return res
+
+    async def get_all_pages(
+        self, path: str, page_size: int, **kwargs: Any
+    ) -> list[Mapping[str, Any]]:
+        """Fetch every page of a paginated list endpoint and join the items.
+
+        The first page tells us how many there are, the rest are then fetched
+        concurrently (at most PAGE_PREFETCH at a time) and joined in order.
+        """
+        res = await self.get(path, pageNo=1, pageSize=page_size, **kwargs)
+        items = list(res["list"])
+
+        if (pages := res.get("pages")) is None:
+            # No page count to go on, keep going until a short page
+            page_no = 1
+            while len(res["list"]) >= page_size:
+                page_no += 1
+                res = await self.get(path, pageNo=page_no, pageSize=page_size, **kwargs)
+                items.extend(res["list"])
+            return items
+
+        semaphore = asyncio.Semaphore(PAGE_PREFETCH)
+
+        async def fetch(page_no: int) -> list[Mapping[str, Any]]:
+            async with semaphore:
+                page = await self.get(
+                    path, pageNo=page_no, pageSize=page_size, **kwargs
+                )
+            return page["list"]
+
+        for page in await asyncio.gather(*[fetch(n) for n in range(2, pages + 1)]):
+            items.extend(page)
+        return items
+
+    async def list_locks(self) -> list[LockSummary]:
+        """List all connectable locks in the account with their summary fields."""
+        locks = [
+            lock
+            for lock in (
+                LockSummary.parse_obj(lock)
+                for lock in await self.get_all_pages("lock/list", page_size=1000)
             )
-            return has_gateway or has_wifi
+            if lock.has_gateway or Features.wifi in lock.features
+        ]
 
-        return [lock["lockId"] for lock in res["list"] if lock_connectable(lock)]
+        # Wifi locks talk to the cloud directly, so each one is its own "gateway"
+        lock_gateway: dict[int, Hashable] = {
+            lock.id: f"wifi-{lock.id}" for lock in locks if not lock.has_gateway
+        }
+        if any(
+            lock.has_gateway and self.scheduler.gateway_for(lock.id) == UNKNOWN_GATEWAY
+            for lock in locks
+        ):
+            try:
+                lock_gateway.update(await self.get_gateway_locks())
+            except (RequestFailed, ClientError) as err:
+                _LOGGER.warning(
+                    "Unable to list gateways, commands will be serialized: %s", err
+                )
+        self.scheduler.update_gateways(lock_gateway)
+
+        return locks
+
+    async def get_gateway_locks(self) -> dict[int, int]:
+        """Map each lock to the gateway its commands are relayed through."""
+        gateway_ids = [
+            gateway["gatewayId"]
+            for gateway in await self.get_all_pages("gateway/list", page_size=100)
+        ]
+        gateway_locks = await asyncio.gather(
+            *[
+                self.get("gateway/listLock", gatewayId=gateway_id)
+                for gateway_id in gateway_ids
+            ]
+        )
+
+        lock_gateway: dict[int, int] = {}
+        for gateway_id, locks in zip(gateway_ids, gateway_locks):
+            for lock in locks["list"]:
+                # A lock in range of several gateways is pinned to the first one
+                lock_gateway.setdefault(lock["lockId"], gateway_id)
+        return lock_gateway
 
     async def get_lock(self, lock_id: int) -> Lock:
         """Get a lock by ID."""
@@ -168,10 +415,21 @@ class TTLockApi:
             # Janky but the API doesn't return different errors if the sensor is missing or there's some other problem
             return None
 
-    async def get_lock_state(self, lock_id: int) -> LockState:
-        """Get the state of a lock."""
-        async with GW_LOCK:
-            res = await self.get("lock/queryOpenState", lockId=lock_id)
+    async def get_lock_state(self, lock_id: int, lane: str = LANE_BULK) -> LockState:
+        """Get the state of a lock.
+
+        Polls go in the bulk lane, pass LANE_INTERACTIVE when someone is waiting.
+        """
+
+        # Waiting for the gateway is part of the read that gets shared, so it's
+        # only shared within a lane
+        async def request() -> Mapping[str, Any]:
+            async with self.scheduler.slot(lock_id, lane):
+                return await self._get("lock/queryOpenState", lockId=lock_id)
+
+        res = await self._coalesce(
+            "lock/queryOpenState", {"lockId": lock_id, "lane": lane}, request
+        )
         return LockState.parse_obj(res)
 
     async def get_lock_passage_mode_config(self, lock_id: int) -> PassageModeConfig:
@@ -181,7 +439,7 @@ class TTLockApi:
 
     async def lock(self, lock_id: int) -> bool:
         """Try to lock the lock."""
-        async with GW_LOCK:
+        async with self.scheduler.slot(lock_id):
             res = await self.get("lock/lock", lockId=lock_id)
 
         if "errcode" in res and res["errcode"] != 0:
@@ -192,7 +450,7 @@ class TTLockApi:
 
     async def unlock(self, lock_id: int) -> bool:
         """Try to unlock the lock."""
-        async with GW_LOCK:
+        async with self.scheduler.slot(lock_id):
             res = await self.get("lock/unlock", lockId=lock_id)
 
         if "errcode" in res and res["errcode"] != 0:
@@ -204,7 +462,7 @@ class TTLockApi:
     async def set_passage_mode(self, lock_id: int, config: PassageModeConfig) -> bool:
         """Configure passage mode."""
 
-        async with GW_LOCK:
+        async with self.scheduler.slot(lock_id, LANE_BULK):
             res = await self.post(
                 "lock/configPassageMode",
                 lockId=lock_id,
@@ -226,7 +484,7 @@ class TTLockApi:
     async def add_passcode(self, lock_id: int, config: AddPasscodeConfig) -> bool:
         """Add new passcode."""
 
-        async with GW_LOCK:
+        async with self.scheduler.slot(lock_id, LANE_BULK):
             res = await self.post(
                 "keyboardPwd/add",
                 lockId=lock_id,
@@ -246,18 +504,26 @@ class TTLockApi:
 
         return True
 
-    async def list_passcodes(self, lock_id: int) -> list[Passcode]:
-        """Get currently configured passcodes from lock."""
+    async def list_passcodes(self, lock_id: int, fresh: bool = False) -> list[Passcode]:
+        """Get currently configured passcodes from lock.
 
-        res = await self.get(
-            "lock/listKeyboardPwd", lockId=lock_id, pageNo=1, pageSize=100
-        )
-        return [Passcode.parse_obj(passcode) for passcode in res["list"]]
+        With fresh, a cached listing isn't used, it can miss passcodes that
+        were changed outside of Home Assistant.
+        """
+        if fresh:
+            self._cache.invalidate(("lock/listKeyboardPwd", lock_id))
+
+        return [
+            Passcode.parse_obj(passcode)
+            for passcode in await self.get_all_pages(
+                "lock/listKeyboardPwd", page_size=100, lockId=lock_id
+            )
+        ]
 
     async def delete_passcode(self, lock_id: int, passcode_id: int) -> bool:
         """Delete a passcode from lock."""
 
-        async with GW_LOCK:
+        async with self.scheduler.slot(lock_id, LANE_BULK):
             resDel = await self.post(
                 "keyboardPwd/delete",
                 lockId=lock_id,
@@ -278,7 +544,7 @@ class TTLockApi:
     async def set_auto_lock(self, lock_id: int, seconds: int) -> bool:
         """Set the AutoLock feature of the lock."""
 
-        async with GW_LOCK:
+        async with self.scheduler.slot(lock_id, LANE_BULK):
             res = await self.post(
                 "lock/setAutoLockTime",
                 lockId=lock_id,
@@ -299,7 +565,7 @@ class TTLockApi:
     async def set_lock_sound(self, lock_id: int, value: int) -> bool:
         """Set the LockSound feature of the lock."""
 
-        async with GW_LOCK:
+        async with self.scheduler.slot(lock_id, LANE_BULK):
             res = await self.post(
                 "lock/updateSetting",
                 lockId=lock_id,
@@ -318,19 +584,18 @@ class TTLockApi:
 
         return True
 
-    async def get_lock_records(
+    async def _get_lock_records_page(
         self,
         lock_id: int,
-        start_date: int | None = None,
-        end_date: int | None = None,
-        page_no: int = 1,
-        page_size: int = 20,
-    ) -> list[LockRecord]:
-        """Get the operation records for a lock."""
+        start_date: int | None,
+        end_date: int | None,
+        page_no: int,
+        page_size: int,
+    ) -> Mapping[str, Any]:
         params = {
             "lockId": lock_id,
             "pageNo": page_no,
-            "pageSize": min(page_size, 200),
+            "pageSize": min(page_size, MAX_RECORDS_PAGE_SIZE),
             "date": str(round(time.time() * 1000)),
         }
 
@@ -339,7 +604,67 @@ class TTLockApi:
         if end_date is not None:
             params["endDate"] = end_date
 
-        res = await self.get("lockRecord/list", **params)
+        return await self.get("lockRecord/list", **params)
+
+    async def get_lock_records(
+        self,
+        lock_id: int,
+        start_date: int | None = None,
+        end_date: int | None = None,
+        page_no: int = 1,
+        page_size: int = 20,
+    ) -> list[LockRecord]:
+        """Get the operation records for a lock."""
+        res = await self._get_lock_records_page(
+            lock_id, start_date, end_date, page_no, page_size
+        )
 
         # Serialize each record to ensure datetime objects are handled
         return [LockRecord.parse_obj(record) for record in res["list"]]
+
+    async def iter_lock_record_pages(
+        self,
+        lock_id: int,
+        start_date: int | None = None,
+        end_date: int | None = None,
+        page_size: int = MAX_RECORDS_PAGE_SIZE,
+    ) -> AsyncIterator[list[LockRecord]]:
+        """Walk every page of operation records in the given window.
+
+        The next page is requested while the caller is busy with the current
+        one, so only one page is waited on at a time and at most two are held.
+        """
+        page_size = min(page_size, MAX_RECORDS_PAGE_SIZE)
+        page_no = 1
+        pending: asyncio.Future[Mapping[str, Any]] | None = asyncio.ensure_future(
+            self._get_lock_records_page(
+                lock_id, start_date, end_date, page_no, page_size
+            )
+        )
+        try:
+            while pending is not None:
+                res = await pending
+                pending = None
+
+                records = res["list"]
+                # Without a page count in the response, a short page is the last
+                if (pages := res.get("pages")) is not None:
+                    more = page_no < pages
+                else:
+                    more = len(records) >= page_size
+
+                if more:
+                    page_no += 1
+                    pending = asyncio.ensure_future(
+                        self._get_lock_records_page(
+                            lock_id, start_date, end_date, page_no, page_size
+                        )
+                    )
+
+                yield [LockRecord.parse_obj(record) for record in records]
+        finally:
+            if pending is not None:
+                if pending.done() and not pending.cancelled():
+                    pending.exception()  # the caller stopped, drop the error
+                else:
+                    pending.cancel()
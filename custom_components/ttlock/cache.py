@@ -0,0 +1,73 @@
+"""Avoid repeating API reads that are already answered or in flight."""
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable
+import time
+from typing import Generic, TypeVar
+
+_T = TypeVar("_T")
+
+
+class SingleFlight(Generic[_T]):
+    """Share one in-flight call between everyone asking for the same key."""
+
+    def __init__(self) -> None:
+        """Initialize with nothing in flight."""
+        self._inflight: dict[Hashable, asyncio.Task[_T]] = {}
+
+    def __contains__(self, key: Hashable) -> bool:
+        """Return True if a call for key is in flight."""
+        return key in self._inflight
+
+    async def run(self, key: Hashable, call: Callable[[], Awaitable[_T]]) -> _T:
+        """Await call(), or the call already running for key."""
+        if (task := self._inflight.get(key)) is None:
+            task = self._inflight[key] = asyncio.ensure_future(call())
+            task.add_done_callback(lambda done: self._finished(key, done))
+
+        # One caller being cancelled mustn't cancel the call for the others
+        return await asyncio.shield(task)
+
+    def _finished(self, key: Hashable, task: asyncio.Task[_T]) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # every waiter may have gone, don't log it as lost
+
+
+class TTLCache(Generic[_T]):
+    """Keep values for a while, grouped so related entries are dropped together."""
+
+    def __init__(self) -> None:
+        """Initialize an empty cache."""
+        self._groups: dict[Hashable, dict[Hashable, tuple[float, _T]]] = {}
+        self._generations: dict[Hashable, int] = {}
+
+    def get(self, group: Hashable, key: Hashable) -> _T | None:
+        """Return the value stored for key, unless it has expired."""
+        entry = self._groups.get(group, {}).get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires <= time.monotonic():
+            del self._groups[group][key]
+            return None
+        return value
+
+    def generation(self, group: Hashable) -> int:
+        """Return a token that changes every time group is invalidated."""
+        return self._generations.get(group, 0)
+
+    def set(
+        self, group: Hashable, key: Hashable, value: _T, ttl: float, generation: int
+    ) -> None:
+        """Store a value fetched at generation, unless the group went stale since."""
+        if generation != self.generation(group):
+            return
+        self._groups.setdefault(group, {})[key] = (time.monotonic() + ttl, value)
+
+    def invalidate(self, group: Hashable) -> None:
+        """Drop every entry in group, including any fetch still in flight."""
+        self._groups.pop(group, None)
+        self._generations[group] = self.generation(group) + 1
@@ -4,11 +4,24 @@ from typing import Any
 
 import voluptuous as vol
 
+from homeassistant.config_entries import ConfigEntry, OptionsFlow
 from homeassistant.const import CONF_PASSWORD, CONF_USERNAME
+from homeassistant.core import callback
 from homeassistant.data_entry_flow import FlowResult
 from homeassistant.helpers import config_entry_oauth2_flow
 
-from .const import DOMAIN
+from .const import (
+    CONF_ACCOUNT_CONCURRENCY,
+    CONF_BULK_CONCURRENCY,
+    CONF_GATEWAY_CONCURRENCY,
+    CONF_OPTIMISTIC,
+    CONF_REQUESTS_PER_SECOND,
+    DEFAULT_ACCOUNT_CONCURRENCY,
+    DEFAULT_GATEWAY_CONCURRENCY,
+    DEFAULT_OPTIMISTIC,
+    DEFAULT_REQUESTS_PER_SECOND,
+    DOMAIN,
+)
 
 
 class TTLockAuthFlowHandler(
@@ -23,6 +36,12 @@ class TTLockAuthFlowHandler(
         """Return logger."""
         return logging.getLogger(__name__)
 
+    @staticmethod
+    @callback
+    def async_get_options_flow(config_entry: ConfigEntry) -> OptionsFlow:
+        """Create the options flow."""
+        return TTLockOptionsFlowHandler()
+
     async def async_step_auth(
         self, user_input: dict[str, Any] | None = None
     ) -> FlowResult:
@@ -49,3 +68,51 @@ class TTLockAuthFlowHandler(
             ),
             errors=errors,
         )
+
+
+class TTLockOptionsFlowHandler(OptionsFlow):
+    """Handle TTLock options."""
+
+    async def async_step_init(
+        self, user_input: dict[str, Any] | None = None
+    ) -> FlowResult:
+        """Manage the options."""
+        if user_input is not None:
+            return self.async_create_entry(data=user_input)
+
+        options = self.config_entry.options
+        account_concurrency = options.get(
+            CONF_ACCOUNT_CONCURRENCY, DEFAULT_ACCOUNT_CONCURRENCY
+        )
+        return self.async_show_form(
+            step_id="init",
+            data_schema=vol.Schema(
+                {
+                    vol.Required(
+                        CONF_GATEWAY_CONCURRENCY,
+                        default=options.get(
+                            CONF_GATEWAY_CONCURRENCY, DEFAULT_GATEWAY_CONCURRENCY
+                        ),
+                    ): vol.All(vol.Coerce(int), vol.Range(min=1, max=10)),
+                    vol.Required(
+                        CONF_ACCOUNT_CONCURRENCY, default=account_concurrency
+                    ): vol.All(vol.Coerce(int), vol.Range(min=1, max=50)),
+                    vol.Required(
+                        CONF_BULK_CONCURRENCY,
+                        default=options.get(
+                            CONF_BULK_CONCURRENCY, max(1, account_concurrency - 1)
+                        ),
+                    ): vol.All(vol.Coerce(int), vol.Range(min=1, max=50)),
+                    vol.Required(
+                        CONF_REQUESTS_PER_SECOND,
+                        default=options.get(
+                            CONF_REQUESTS_PER_SECOND, DEFAULT_REQUESTS_PER_SECOND
+                        ),
+                    ): vol.All(vol.Coerce(float), vol.Range(min=0.1, max=50)),
+                    vol.Required(
+                        CONF_OPTIMISTIC,
+                        default=options.get(CONF_OPTIMISTIC, DEFAULT_OPTIMISTIC),
+                    ): bool,
+                }
+            ),
+        )
@@ -3,12 +3,27 @@
 DOMAIN = "ttlock"
 TT_API = "api"
 TT_LOCKS = "locks"
+TT_ACCOUNT = "account"
+TT_ENTITY_INDEX = "entity_index"
+TT_WEBHOOK_QUEUE = "webhook_queue"
+TT_OPTIONS = "options"
 
 OAUTH2_TOKEN = "https://euapi.ttlock.com/oauth2/token"
 CONF_WEBHOOK_URL = "webhook_url"
 CONF_WEBHOOK_STATUS = "webhook_status"
 
-SIGNAL_NEW_DATA = f"{DOMAIN}.data_received"
+# Formatted with the lockId so each event only wakes the co-ordinator it is for
+SIGNAL_NEW_DATA = f"{DOMAIN}.data_received.{{lock_id}}"
+
+CONF_GATEWAY_CONCURRENCY = "gateway_concurrency"
+CONF_ACCOUNT_CONCURRENCY = "account_concurrency"
+CONF_BULK_CONCURRENCY = "bulk_concurrency"
+DEFAULT_GATEWAY_CONCURRENCY = 1
+DEFAULT_ACCOUNT_CONCURRENCY = 4
+CONF_REQUESTS_PER_SECOND = "requests_per_second"
+DEFAULT_REQUESTS_PER_SECOND = 5.0
+CONF_OPTIMISTIC = "optimistic"
+DEFAULT_OPTIMISTIC = False
 
 
 CONF_AUTO_UNLOCK = "auto_unlock"
@@ -24,3 +39,5 @@ SVC_CREATE_PASSCODE = "create_passcode"
 SVC_CLEANUP_PASSCODES = "cleanup_passcodes"
 SVC_LIST_PASSCODES = "list_passcodes"
 SVC_LIST_RECORDS = "list_records"
+SVC_EXPORT_RECORDS = "export_records"
+SVC_SYNC_PASSCODES = "sync_passcodes"
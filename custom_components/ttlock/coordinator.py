@@ -2,28 +2,62 @@
 from __future__ import annotations
 
 import asyncio
+from collections.abc import Callable
 from contextlib import contextmanager
-from copy import deepcopy
-from dataclasses import dataclass
-from datetime import datetime, timedelta
+from dataclasses import dataclass, replace
+from datetime import datetime, time, timedelta
 import logging
-from typing import TypeGuard
+from typing import Any, TypeGuard
+import zlib
 
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant, callback
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers import device_registry as dr
 from homeassistant.helpers.dispatcher import async_dispatcher_connect
 from homeassistant.helpers.entity import DeviceInfo, Entity
+from homeassistant.helpers.event import async_call_later, async_track_point_in_time
 from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
 from homeassistant.util import dt
 
 from .api import TTLockApi
-from .const import DOMAIN, SIGNAL_NEW_DATA, TT_LOCKS
-from .models import Features, PassageModeConfig, SensorState, State, WebhookEvent
+from .const import DOMAIN, SIGNAL_NEW_DATA, TT_ENTITY_INDEX, TT_LOCKS
+from .models import (
+    Features,
+    LockSummary,
+    PassageModeConfig,
+    SensorState,
+    State,
+    WebhookEvent,
+)
+from .scheduler import LANE_INTERACTIVE
 
 _LOGGER = logging.getLogger(__name__)
 
-
-@dataclass
+# lock/list refreshes the fields it carries for every lock in a single call,
+# so the per-lock detail calls only need to happen on a much slower cadence.
+ACCOUNT_UPDATE_INTERVAL = timedelta(minutes=15)
+LOCK_UPDATE_INTERVAL = timedelta(hours=1)
+# Once webhooks are known to be arriving they keep lock state current, polling
+# is then only a safety net. Locks in an unknown state are polled more often.
+PUSH_HEALTHY_WINDOW = timedelta(hours=12)
+PUSH_HEALTHY_UPDATE_INTERVAL = timedelta(hours=6)
+UNKNOWN_STATE_UPDATE_INTERVAL = timedelta(minutes=5)
+# Each lock's interval is scaled by a fixed factor in this range, so the locks
+# in an account don't all come due at the same moment.
+UPDATE_INTERVAL_SPREAD = 0.2
+# At startup each lock's first full refresh is placed at a fixed offset into a
+# window that grows with the number of locks (up to a limit).
+STARTUP_SECONDS_PER_LOCK = 1.0
+STARTUP_WINDOW_MAX = 120.0
+# In optimistic mode, how long to wait for the webhook to confirm a lock or
+# unlock before asking the lock for its state instead.
+OPTIMISTIC_CONFIRM_TIMEOUT = timedelta(seconds=20)
+# TTLock retries webhook deliveries, this many recent events per lock are
+# remembered so a repeat isn't applied twice.
+WEBHOOK_DEDUP_WINDOW = 64
+
+
+@dataclass(frozen=True, slots=True)
 class SensorData:
     """Internal state of the optional door sensor."""
 
@@ -37,9 +71,13 @@ class SensorData:
         return self.battery is not None
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class LockState:
-    """Internal state of the lock as managed by the co-oridinator."""
+    """Internal state of the lock as managed by the co-oridinator.
+
+    Instances are immutable, updates are made with dataclasses.replace so the
+    fields that didn't change are shared with the previous state.
+    """
 
     name: str
     mac: str
@@ -57,8 +95,11 @@ class LockState:
     auto_lock_seconds: int | None = None
     passage_mode_config: PassageModeConfig | None = None
 
-    def passage_mode_active(self, current_date: datetime = dt.now()) -> bool:
+    def passage_mode_active(self, current_date: datetime | None = None) -> bool:
         """Check if passage mode is currently active."""
+        if current_date is None:
+            current_date = dt.now()
+
         if self.passage_mode_config and self.passage_mode_config.enabled:
             current_day = current_date.isoweekday()
 
@@ -76,6 +117,37 @@ class LockState:
                     return True
         return False
 
+    def next_passage_mode_change(
+        self, current_date: datetime | None = None
+    ) -> datetime | None:
+        """Return when passage mode next turns on or off, None if it never does."""
+        if not self.passage_mode_config or not self.passage_mode_config.enabled:
+            return None
+        if current_date is None:
+            current_date = dt.now()
+
+        # The schedule repeats weekly, so a change (if any) happens within the
+        # next 8 days at midnight or at the start/end minute of one of them.
+        config = self.passage_mode_config
+        boundaries = []
+        for days in range(9):
+            day_start = datetime.combine(
+                current_date.date() + timedelta(days=days),
+                time(),
+                tzinfo=current_date.tzinfo,
+            )
+            boundaries += [
+                day_start,
+                day_start + timedelta(minutes=config.start_minute),
+                day_start + timedelta(minutes=config.end_minute),
+            ]
+
+        active = self.passage_mode_active(current_date)
+        for boundary in sorted(boundaries):
+            if boundary > current_date and self.passage_mode_active(boundary) != active:
+                return boundary
+        return None
+
     def auto_lock_delay(self, current_date: datetime) -> int | None:
         """Return the auto-lock delay in seconds, or None if auto-lock is currently disabled."""
         if self.auto_lock_seconds is None or self.auto_lock_seconds <= 0:
@@ -87,6 +159,16 @@ class LockState:
         return self.auto_lock_seconds
 
 
+def lock_phase(lock_id: int) -> float:
+    """Return a fixed fraction in [0, 1) for a lock, used to spread out work."""
+    return zlib.crc32(str(lock_id).encode()) / 2**32
+
+
+def startup_window(locks: int) -> float:
+    """Seconds over which the first refresh of this many locks is spread."""
+    return min(STARTUP_WINDOW_MAX, locks * STARTUP_SECONDS_PER_LOCK)
+
+
 def sensor_present(instance: SensorData | None) -> TypeGuard[SensorData]:
     """Check if a sensor is present."""
     return instance is not None and instance.present
@@ -96,13 +178,11 @@ def sensor_present(instance: SensorData | None) -> TypeGuard[SensorData]:
 def lock_action(controller: LockUpdateCoordinator):
     """Wrap a lock action so that in-progress state is managed correctly."""
 
-    controller.data.action_pending = True
-    controller.async_update_listeners()
+    controller.async_update_state(action_pending=True)
     try:
         yield
     finally:
-        controller.data.action_pending = False
-        controller.async_update_listeners()
+        controller.async_update_state(action_pending=False)
 
 
 def lock_coordinators(hass: HomeAssistant, entry: ConfigEntry):
@@ -113,128 +193,419 @@ def lock_coordinators(hass: HomeAssistant, entry: ConfigEntry):
     yield from coordinators
 
 
+class EntityIndex:
+    """Maps entity_id and unique_id to the co-ordinator that owns the entity."""
+
+    def __init__(self) -> None:
+        """Initialize an empty index."""
+        self._by_entity_id: dict[str, LockUpdateCoordinator] = {}
+        self._by_unique_id: dict[str, LockUpdateCoordinator] = {}
+        self._entities: dict[Entity, tuple[str, str | None]] = {}
+
+    def __len__(self) -> int:
+        """Return the number of indexed entities."""
+        return len(self._entities)
+
+    def add(self, entity: Entity, coordinator: LockUpdateCoordinator) -> None:
+        """Index an entity that was added to hass."""
+        self.remove(entity)
+        self._entities[entity] = (entity.entity_id, entity.unique_id)
+        self._by_entity_id[entity.entity_id] = coordinator
+        if entity.unique_id:
+            self._by_unique_id[entity.unique_id] = coordinator
+
+    def remove(self, entity: Entity) -> None:
+        """Forget an entity that is being removed from hass."""
+        if (keys := self._entities.pop(entity, None)) is None:
+            return
+        entity_id, unique_id = keys
+        self._by_entity_id.pop(entity_id, None)
+        if unique_id:
+            self._by_unique_id.pop(unique_id, None)
+
+    def get(self, entity_id: str) -> LockUpdateCoordinator | None:
+        """Return the co-ordinator for an entity_id."""
+        return self._by_entity_id.get(entity_id)
+
+    def get_by_unique_id(self, unique_id: str) -> LockUpdateCoordinator | None:
+        """Return the co-ordinator for an entity unique_id."""
+        return self._by_unique_id.get(unique_id)
+
+
+def entity_index(hass: HomeAssistant) -> EntityIndex:
+    """Return the entity index shared by all config entries."""
+    return hass.data.setdefault(DOMAIN, {}).setdefault(TT_ENTITY_INDEX, EntityIndex())
+
+
 def coordinator_for(
     hass: HomeAssistant, entity_id: str
 ) -> LockUpdateCoordinator | None:
     """Given an entity_id, return the coordinator for that entity."""
-    for entry in hass.config_entries.async_entries(DOMAIN):
-        for coordinator in lock_coordinators(hass, entry):
-            for entity in coordinator.entities:
-                if entity.entity_id == entity_id:
-                    return coordinator
-    return None
+    return entity_index(hass).get(entity_id)
+
+
+class AccountUpdateCoordinator(DataUpdateCoordinator[dict[int, LockSummary]]):
+    """Refreshes the fields lock/list returns for every lock in the account."""
+
+    def __init__(self, hass: HomeAssistant, api: TTLockApi) -> None:
+        """Initialize the update co-ordinator for the account."""
+        self.api = api
+        self.last_push: datetime | None = None
+
+        super().__init__(
+            hass, _LOGGER, name=DOMAIN, update_interval=ACCOUNT_UPDATE_INTERVAL
+        )
+
+    async def _async_update_data(self) -> dict[int, LockSummary]:
+        try:
+            with self.api.metrics.timed("refresh_seconds", "account"):
+                return {lock.id: lock for lock in await self.api.list_locks()}
+        except Exception as err:
+            raise UpdateFailed(err) from err
+
+    @callback
+    def async_push_received(self) -> None:
+        """Record that the webhook delivered an event for the account."""
+        self.last_push = dt.utcnow()
+
+    @property
+    def push_healthy(self) -> bool:
+        """If the webhook has delivered anything recently."""
+        return (
+            self.last_push is not None
+            and dt.utcnow() - self.last_push < PUSH_HEALTHY_WINDOW
+        )
 
 
 class LockUpdateCoordinator(DataUpdateCoordinator[LockState]):
     """Class to manage fetching Toon data from single endpoint."""
 
-    def __init__(self, hass: HomeAssistant, api: TTLockApi, lock_id: int) -> None:
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        api: TTLockApi,
+        lock_id: int,
+        account: AccountUpdateCoordinator | None = None,
+        optimistic: bool = False,
+    ) -> None:
         """Initialize the update co-ordinator for a single lock."""
         self.api = api
         self.lock_id = lock_id
+        self.account = account
+        self.optimistic = optimistic
+        self._optimistic_task: asyncio.Task[None] | None = None
+        self._optimistic_previous: bool | None = None
+        self._optimistic_target: bool | None = None
+        # Whether the lock took the pending command, and whether a superseded one may have
+        self._optimistic_sent = False
+        self._optimistic_uncertain = False
+        self._optimistic_confirmed = asyncio.Event()
+        self._entities: list[Entity] = []
+        self._auto_lock_cancel: CALLBACK_TYPE | None = None
+        self._passage_mode_cancel: CALLBACK_TYPE | None = None
+        self._passage_mode_scheduled: PassageModeConfig | None = None
+
+        self._phase = lock_phase(lock_id)
+        # A fixed factor in [1 - spread/2, 1 + spread/2)
+        self._interval_scale = 1 + UPDATE_INTERVAL_SPREAD * (self._phase - 0.5)
+        self._initial_refresh_cancel: CALLBACK_TYPE | None = None
+        # Recent events (in arrival order) and the newest lock time applied
+        self._recent_events: dict[tuple[datetime, datetime, int], None] = {}
+        self._last_lock_ts: datetime | None = None
 
         super().__init__(
-            hass, _LOGGER, name=DOMAIN, update_interval=timedelta(minutes=15)
+            hass,
+            _LOGGER,
+            name=DOMAIN,
+            # Nothing is known about the lock yet
+            update_interval=self._adaptive_interval(None),
+        )
+
+        self._unsubscribe: list[CALLBACK_TYPE] = [
+            async_dispatcher_connect(
+                self.hass,
+                SIGNAL_NEW_DATA.format(lock_id=lock_id),
+                self._process_webhook_events,
+            )
+        ]
+        if account:
+            self._unsubscribe.append(
+                account.async_add_listener(self._process_account_data)
+            )
+
+    async def async_shutdown(self) -> None:
+        """Stop listening for account and webhook updates."""
+        await super().async_shutdown()
+        if self._initial_refresh_cancel is not None:
+            self._initial_refresh_cancel()
+            self._initial_refresh_cancel = None
+        self._cancel_auto_lock()
+        self._cancel_passage_mode_change()
+        if self._optimistic_task is not None:
+            self._optimistic_task.cancel()
+            self._optimistic_task = None
+        while self._unsubscribe:
+            self._unsubscribe.pop()()
+
+    @callback
+    def async_restore(self, data: LockState) -> None:
+        """Start out from a previously saved state, without notifying anyone."""
+        self.data = data
+        self.update_interval = self._adaptive_interval(data)
+
+    async def async_load_metadata(self) -> None:
+        """Fill in what entity setup needs from the account's lock/list data.
+
+        Only the door sensor needs its own call, since whether it's installed
+        decides which entities are created. Everything else arrives with the
+        first full refresh.
+        """
+        assert self.account and self.account.data
+        lock = self.account.data[self.lock_id]
+
+        sensor = None
+        if Features.door_sensor in lock.features:
+            sensor_details = await self.api.get_sensor(self.lock_id)
+            sensor = SensorData(
+                battery=sensor_details.battery_level if sensor_details else None,
+                last_fetched=dt.now(),
+            )
+
+        self.data = LockState(
+            name=lock.name,
+            mac=lock.mac,
+            battery_level=lock.battery_level,
+            features=lock.features,
+            sensor=sensor,
         )
 
-        async_dispatcher_connect(self.hass, SIGNAL_NEW_DATA, self._process_webhook_data)
+    @callback
+    def async_schedule_initial_refresh(self, window: float) -> None:
+        """Run the first full refresh at this lock's fixed offset into window."""
+
+        @callback
+        def _refresh(_now: datetime) -> None:
+            self._initial_refresh_cancel = None
+            self.hass.async_create_task(
+                self.async_refresh(), f"{DOMAIN} initial refresh {self.lock_id}"
+            )
+
+        self._initial_refresh_cancel = async_call_later(
+            self.hass, window * self._phase, _refresh
+        )
 
     async def _async_update_data(self) -> LockState:
+        with self.api.metrics.timed("refresh_seconds", self.lock_id):
+            return await self._async_fetch_lock()
+
+    async def _async_fetch_lock(self) -> LockState:
         try:
             details = await self.api.get_lock(self.lock_id)
 
-            new_data = deepcopy(self.data) or LockState(
+            current = self.data or LockState(
                 name=details.name,
                 mac=details.mac,
                 model=details.model,
+                battery_level=details.battery_level,
                 features=Features.from_feature_value(details.featureValue),
             )
 
-            # update mutable attributes
-            new_data.name = details.name
-            new_data.battery_level = details.battery_level
-            new_data.hardware_version = details.hardwareRevision
-            new_data.firmware_version = details.firmwareRevision
-
-            if Features.door_sensor in new_data.features:
+            sensor = None
+            if Features.door_sensor in current.features:
                 # make sure we have a placeholder for sensor state if the lock supports it
-                if new_data.sensor is None:
-                    new_data.sensor = SensorData()
+                sensor = current.sensor or SensorData()
 
                 # only fetch sensor metadata once a day
                 if (
-                    new_data.sensor.last_fetched is None
-                    or new_data.sensor.last_fetched < dt.now() - timedelta(days=1)
+                    sensor.last_fetched is None
+                    or sensor.last_fetched < dt.now() - timedelta(days=1)
                 ):
-                    sensor = await self.api.get_sensor(self.lock_id)
-                    new_data.sensor.last_fetched = dt.now()
-                    if sensor:
-                        new_data.sensor.battery = sensor.battery_level
-            else:
-                new_data.sensor = None
-
-            if new_data.locked is None:
+                    sensor_details = await self.api.get_sensor(self.lock_id)
+                    sensor = replace(
+                        sensor,
+                        last_fetched=dt.now(),
+                        battery=(
+                            sensor_details.battery_level
+                            if sensor_details
+                            else sensor.battery
+                        ),
+                    )
+
+            locked = current.locked
+            if locked is None:
                 try:
                     state = await self.api.get_lock_state(self.lock_id)
-                    new_data.locked = state.locked == State.locked
-                    if sensor_present(new_data.sensor):
-                        new_data.sensor.opened = state.opened == SensorState.opened
+                    locked = state.locked == State.locked
+                    if sensor_present(sensor):
+                        sensor = replace(
+                            sensor, opened=state.opened == SensorState.opened
+                        )
                 except Exception:
                     pass
 
-            new_data.auto_lock_seconds = details.autoLockTime
-            new_data.lock_sound = bool(details.lockSound)
-
-            new_data.passage_mode_config = await self.api.get_lock_passage_mode_config(
+            passage_mode_config = await self.api.get_lock_passage_mode_config(
                 self.lock_id
             )
 
-            return new_data
+            # lock/list owns these once the account is loaded, and is fresher
+            # than a lock/detail response that may have come from the cache
+            if self.account and self.account.data and self.lock_id in self.account.data:
+                shared = {}
+            else:
+                shared = {"name": details.name, "battery_level": details.battery_level}
+
+            new_data = replace(
+                current,
+                **shared,
+                model=details.model,
+                hardware_version=details.hardwareRevision,
+                firmware_version=details.firmwareRevision,
+                sensor=sensor,
+                locked=locked,
+                auto_lock_seconds=details.autoLockTime,
+                lock_sound=bool(details.lockSound),
+                passage_mode_config=passage_mode_config,
+            )
         except Exception as err:
+            self.update_interval = self._adaptive_interval(None)
             raise UpdateFailed(err) from err
 
+        self.update_interval = self._adaptive_interval(new_data)
+        self._async_update_device(new_data)
+        return new_data
+
     @callback
-    def _process_webhook_data(self, event: WebhookEvent):
-        """Update data."""
-        if event.id != self.lock_id:
+    def _async_update_device(self, data: LockState) -> None:
+        """Fill in device details that lock/list doesn't have."""
+        if self.data and (
+            self.data.model,
+            self.data.firmware_version,
+            self.data.hardware_version,
+        ) == (data.model, data.firmware_version, data.hardware_version):
             return
 
-        _LOGGER.debug("Lock %s received %s", self.unique_id, event)
+        registry = dr.async_get(self.hass)
+        if device := registry.async_get_device(identifiers={(DOMAIN, data.mac)}):
+            registry.async_update_device(
+                device.id,
+                model=data.model,
+                sw_version=data.firmware_version,
+                hw_version=data.hardware_version,
+            )
 
-        if not event.success:
+    def _adaptive_interval(self, data: LockState | None) -> timedelta:
+        """Pick how long to wait before polling the lock again."""
+        if data is None or data.locked is None:
+            interval = UNKNOWN_STATE_UPDATE_INTERVAL
+        elif self.account and self.account.push_healthy:
+            interval = PUSH_HEALTHY_UPDATE_INTERVAL
+        else:
+            interval = LOCK_UPDATE_INTERVAL
+        return interval * self._interval_scale
+
+    @callback
+    def _process_account_data(self) -> None:
+        """Apply the fields refreshed by the account co-ordinator."""
+        if not self.data or not self.account or not self.account.data:
+            return
+
+        if (lock := self.account.data.get(self.lock_id)) is None:
+            return
+
+        features = lock.features
+        if (
+            self.data.name == lock.name
+            and self.data.battery_level == lock.battery_level
+            and self.data.features == features
+        ):
             return
 
+        self.async_update_state(
+            name=lock.name, battery_level=lock.battery_level, features=features
+        )
+
+    @callback
+    def _process_webhook_events(self, events: list[WebhookEvent]):
+        """Apply a batch of events in order, listeners are updated once."""
         if not self.data:
             return
 
-        new_data = deepcopy(self.data)
-        new_data.battery_level = event.battery_level
+        data = self.data
+        for event in events:
+            data = self._apply_webhook_event(data, event)
+        if data is self.data:
+            return
+
+        # The webhook is working, the next poll can wait longer
+        self.update_interval = self._adaptive_interval(data)
+        self.async_set_updated_data(data)
+
+    @callback
+    def _apply_webhook_event(self, data: LockState, event: WebhookEvent) -> LockState:
+        """Return data with a single event applied."""
+        if event.id != self.lock_id:
+            return data
+
+        _LOGGER.debug("Lock %s received %s", self.unique_id, event)
+
+        if not self._is_new_event(event):
+            return data
+
+        if not event.success:
+            return data
+
+        changes: dict[str, Any] = {"battery_level": event.battery_level}
 
         if state := event.state:
             if state.locked == State.locked:
-                new_data.locked = True
+                changes["locked"] = True
+                self._cancel_auto_lock()
             elif state.locked == State.unlocked:
-                new_data.locked = False
+                changes["locked"] = False
                 self._handle_auto_lock(event.lock_ts, event.server_ts)
 
             if state.locked is not None:
-                new_data.last_user = event.user
-                new_data.last_reason = event.event.description
+                changes["last_user"] = event.user
+                changes["last_reason"] = event.event.description
+                if changes["locked"] == self._optimistic_target:
+                    self._optimistic_confirmed.set()
 
-        if new_data.sensor and new_data.sensor.present and event.sensorState:
+        sensor = data.sensor
+        if sensor and sensor.present and event.sensorState:
             if event.sensorState.opened == SensorState.opened:
-                new_data.sensor.opened = True
+                changes["sensor"] = replace(sensor, opened=True)
             if event.sensorState.opened == SensorState.closed:
-                new_data.sensor.opened = False
-                new_data.locked = True
-                new_data.last_reason = "Door Closed"
+                changes["sensor"] = replace(sensor, opened=False)
+                changes["locked"] = True
+                changes["last_reason"] = "Door Closed"
+                self._cancel_auto_lock()
 
                 _LOGGER.debug("Assuming auto-locked via sensor")
-        self.async_set_updated_data(new_data)
+        return replace(data, **changes)
+
+    @callback
+    def _is_new_event(self, event: WebhookEvent) -> bool:
+        """Check an event is neither a repeat nor older than one already applied."""
+        key = (event.lock_ts, event.server_ts, event.event.value)
+        if key in self._recent_events:
+            _LOGGER.debug("Lock %s ignoring repeated event", self.unique_id)
+            return False
+        if self._last_lock_ts is not None and event.lock_ts < self._last_lock_ts:
+            _LOGGER.debug("Lock %s ignoring out of order event", self.unique_id)
+            return False
+
+        self._recent_events[key] = None
+        if len(self._recent_events) > WEBHOOK_DEDUP_WINDOW:
+            del self._recent_events[next(iter(self._recent_events))]
+        self._last_lock_ts = event.lock_ts
+        return True
 
     def _handle_auto_lock(self, lock_ts: datetime, server_ts: datetime):
         """Handle auto-locking the lock."""
 
+        # Each unlock restarts the countdown rather than adding another one
+        self._cancel_auto_lock()
+
         auto_lock_delay = self.data.auto_lock_delay(lock_ts)
         computed_msg_delay = max(0, (server_ts - lock_ts).total_seconds())
 
@@ -243,18 +614,85 @@ class LockUpdateCoordinator(DataUpdateCoordinator[LockState]):
 
             return
 
-        async def _auto_locked(seconds: int, offset: float = 0):
-            if seconds > 0 and (seconds - offset) > 0:
-                await asyncio.sleep(seconds - offset)
+        @callback
+        def _auto_locked(_now: datetime) -> None:
+            self._auto_lock_cancel = None
+            _LOGGER.debug("Assuming lock auto locked after %s seconds", auto_lock_delay)
+            self.async_set_updated_data(
+                replace(self.data, locked=True, last_reason="Auto Lock")
+            )
+
+        self._auto_lock_cancel = async_call_later(
+            self.hass, max(0, auto_lock_delay - computed_msg_delay), _auto_locked
+        )
+
+    @callback
+    def _cancel_auto_lock(self) -> None:
+        """Forget a pending auto-lock, the lock is already locked."""
+        if self._auto_lock_cancel is not None:
+            self._auto_lock_cancel()
+            self._auto_lock_cancel = None
+
+    @callback
+    def async_update_listeners(self) -> None:
+        """Update all registered listeners, keeping the passage mode timer current."""
+        self._schedule_passage_mode_change()
+        super().async_update_listeners()
+
+    @callback
+    def async_add_listener(
+        self, update_callback: CALLBACK_TYPE, context: Any = None
+    ) -> Callable[[], None]:
+        """Listen for data updates, the passage mode timer starts with the first."""
+        remove_listener = super().async_add_listener(update_callback, context)
+        self._schedule_passage_mode_change()
+        return remove_listener
+
+    @callback
+    def _schedule_passage_mode_change(self) -> None:
+        """Wake listeners when passage mode is next due to turn on or off."""
+        if not self._listeners:
+            # Nobody to tell, the timer is set up again when someone listens
+            self._cancel_passage_mode_change()
+            self._passage_mode_scheduled = None
+            return
+
+        config = self.data.passage_mode_config if self.data else None
+        if config is self._passage_mode_scheduled and (
+            self._passage_mode_cancel is not None or config is None
+        ):
+            # Still waiting on the timer for this config
+            return
 
-            new_data = deepcopy(self.data)
-            new_data.locked = True
-            new_data.last_reason = "Auto Lock"
+        self._cancel_passage_mode_change()
+        self._passage_mode_scheduled = config
+        if (change := self.data.next_passage_mode_change()) is None:
+            return
 
-            _LOGGER.debug("Assuming lock auto locked after %s seconds", auto_lock_delay)
-            self.async_set_updated_data(new_data)
+        @callback
+        def _passage_mode_changed(_now: datetime) -> None:
+            self._passage_mode_cancel = None
+            _LOGGER.debug("Passage mode schedule changed for %s", self.lock_id)
+            self.async_update_listeners()
 
-        self.hass.create_task(_auto_locked(auto_lock_delay, computed_msg_delay))
+        self._passage_mode_cancel = async_track_point_in_time(
+            self.hass, _passage_mode_changed, change
+        )
+
+    @callback
+    def _cancel_passage_mode_change(self) -> None:
+        if self._passage_mode_cancel is not None:
+            self._passage_mode_cancel()
+            self._passage_mode_cancel = None
+
+    @callback
+    def async_update_state(self, **changes: Any) -> None:
+        """Apply changes to the lock state and notify listeners.
+
+        Unlike async_set_updated_data this doesn't push back the next refresh.
+        """
+        self.data = replace(self.data, **changes)
+        self.async_update_listeners()
 
     @property
     def unique_id(self) -> str:
@@ -276,11 +714,20 @@ class LockUpdateCoordinator(DataUpdateCoordinator[LockState]):
     @property
     def entities(self) -> list[Entity]:
         """Entities belonging to this co-ordinator."""
-        return [
-            callback.__self__
-            for callback, _ in list(self._listeners.values())
-            if isinstance(callback.__self__, Entity)
-        ]
+        return list(self._entities)
+
+    @callback
+    def async_add_entity(self, entity: Entity) -> None:
+        """Track an entity once it has been added to hass."""
+        self._entities.append(entity)
+        entity_index(self.hass).add(entity, self)
+
+    @callback
+    def async_remove_entity(self, entity: Entity) -> None:
+        """Stop tracking an entity that is being removed from hass."""
+        if entity in self._entities:
+            self._entities.remove(entity)
+        entity_index(self.hass).remove(entity)
 
     def as_dict(self) -> dict:
         """Serialize for diagnostics."""
@@ -295,30 +742,127 @@ class LockUpdateCoordinator(DataUpdateCoordinator[LockState]):
 
     async def lock(self) -> None:
         """Try to lock the lock."""
+        if self.optimistic:
+            self._cancel_auto_lock()
+            self._async_act_optimistically(True)
+            return
+
         with lock_action(self):
             res = await self.api.lock(self.lock_id)
             if res:
-                self.data.locked = True
+                # Listeners are told when the action is no longer pending
+                self.data = replace(self.data, locked=True)
+                self._cancel_auto_lock()
 
     async def unlock(self) -> None:
         """Try to unlock the lock."""
+        if self.optimistic:
+            self._async_act_optimistically(False)
+            return
+
         with lock_action(self):
             res = await self.api.unlock(self.lock_id)
             if res:
-                self.data.locked = False
+                self.data = replace(self.data, locked=False)
+
+    @callback
+    def _async_act_optimistically(self, locked: bool) -> None:
+        """Show the lock in its new state now, confirming it in the background."""
+        if self._optimistic_task is not None:
+            self._optimistic_task.cancel()
+            if self._optimistic_sent:
+                # The lock took the superseded command, a failure goes back to it
+                self._optimistic_previous = self._optimistic_target
+            else:
+                # Still in flight, it may or may not reach the lock
+                self._optimistic_uncertain = True
+        else:
+            self._optimistic_previous = self.data.locked
+            self._optimistic_uncertain = False
+        self._optimistic_sent = False
+        self._optimistic_target = locked
+        self._optimistic_confirmed.clear()
+        self.async_update_state(locked=locked)
+        self._optimistic_task = task = self.hass.async_create_background_task(
+            self._async_confirm(locked),
+            f"{DOMAIN} confirm {'lock' if locked else 'unlock'} {self.lock_id}",
+        )
+        if task.done():
+            # Started eagerly and already finished
+            self._optimistic_finished(task)
+        else:
+            task.add_done_callback(self._optimistic_finished)
+
+    @callback
+    def _optimistic_finished(self, task: asyncio.Task[None]) -> None:
+        if self._optimistic_task is task:
+            self._optimistic_task = None
+            self._optimistic_target = None
+
+    async def _async_confirm(self, locked: bool) -> None:
+        """Send the command, then wait for the lock to report the new state.
+
+        The webhook usually confirms it, failing that the state is queried once.
+        Anything else rolls the state back, with the reason as the last trigger.
+        """
+        action = "Lock" if locked else "Unlock"
+        try:
+            sent = await (self.api.lock if locked else self.api.unlock)(self.lock_id)
+        except Exception as err:
+            _LOGGER.warning("%s of %s failed: %s", action, self.lock_id, err)
+            sent = False
+        if not sent:
+            await self._async_roll_back_failed(f"{action} failed")
+            return
+        self._optimistic_sent = True
+
+        try:
+            async with asyncio.timeout(OPTIMISTIC_CONFIRM_TIMEOUT.total_seconds()):
+                await self._optimistic_confirmed.wait()
+            return
+        except TimeoutError:
+            pass
+
+        try:
+            state = await self.api.get_lock_state(self.lock_id, LANE_INTERACTIVE)
+        except Exception as err:
+            _LOGGER.warning("Unable to confirm %s of %s: %s", action, self.lock_id, err)
+            self._roll_back(self._optimistic_previous, f"{action} not confirmed")
+            return
+
+        if state.locked not in (State.locked, State.unlocked):
+            self._roll_back(self._optimistic_previous, f"{action} not confirmed")
+        elif (state.locked == State.locked) != locked:
+            self._roll_back(state.locked == State.locked, f"{action} not confirmed")
+
+    async def _async_roll_back_failed(self, reason: str) -> None:
+        """Roll back a command the lock didn't take."""
+        locked = self._optimistic_previous
+        if self._optimistic_uncertain:
+            # Whether a superseded command got through decides what to go back to
+            try:
+                state = await self.api.get_lock_state(self.lock_id, LANE_INTERACTIVE)
+                if state.locked in (State.locked, State.unlocked):
+                    locked = state.locked == State.locked
+            except Exception as err:
+                _LOGGER.warning("Unable to query %s: %s", self.lock_id, err)
+        self._roll_back(locked, reason)
+
+    @callback
+    def _roll_back(self, locked: bool | None, reason: str) -> None:
+        _LOGGER.warning("Lock %s: %s, rolling back", self.lock_id, reason)
+        self.async_update_state(locked=locked, last_reason=reason)
 
     async def set_auto_lock(self, on: bool) -> None:
         """Turn on/off Autolock."""
         seconds = 10 if on else 0
         res = await self.api.set_auto_lock(self.lock_id, seconds)
         if res:
-            self.data.auto_lock_seconds = seconds
-            self.async_update_listeners()
+            self.async_update_state(auto_lock_seconds=seconds)
 
     async def set_lock_sound(self, on: bool) -> None:
         """Turn on/off lock sound."""
         value = 1 if on else 2
         res = await self.api.set_lock_sound(self.lock_id, value)
         if res:
-            self.data.lock_sound = on
-            self.async_update_listeners()
+            self.async_update_state(lock_sound=on)
@@ -9,7 +9,7 @@ from homeassistant.components.diagnostics import async_redact_data
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.core import HomeAssistant
 
-from .const import DOMAIN, TT_LOCKS
+from .const import DOMAIN, TT_API, TT_LOCKS, TT_WEBHOOK_QUEUE
 from .models import BaseModel
 
 TO_REDACT = {
@@ -41,10 +41,15 @@ async def async_get_config_entry_diagnostics(
     hass: HomeAssistant, config_entry: ConfigEntry
 ) -> dict[str, Any]:
     """Return diagnostics for a config entry."""
+    api = hass.data[DOMAIN][config_entry.entry_id][TT_API]
+    queue = hass.data[DOMAIN][config_entry.entry_id][TT_WEBHOOK_QUEUE]
 
     diagnostics_data = async_redact_data(
         {
             "config_entry": config_entry.as_dict(),
+            "api": asdict(api.stats),
+            "metrics": api.metrics.as_dict(),
+            "webhook_queue": {**asdict(queue.stats), "depth": queue.depth},
             "locks": [
                 build_diagnostics_dict(coordinator.as_dict())
                 for coordinator in hass.data[DOMAIN][config_entry.entry_id][TT_LOCKS]
@@ -2,6 +2,8 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
+import asyncio
+from typing import Any
 
 from homeassistant.core import callback
 from homeassistant.helpers.update_coordinator import CoordinatorEntity
@@ -20,6 +22,8 @@ class BaseLockEntity(CoordinatorEntity[LockUpdateCoordinator], ABC):
     ) -> None:
         """Initialize."""
         super().__init__(coordinator)
+        self._write_handle: asyncio.Handle | None = None
+        self._last_written: tuple[Any, ...] | None = None
         self._attr_device_info = coordinator.device_info
         self._attr_unique_id = (
             f"{coordinator.unique_id}-{self.__class__.__name__.lower()}"
@@ -28,12 +32,50 @@ class BaseLockEntity(CoordinatorEntity[LockUpdateCoordinator], ABC):
 
         # self.entity_description = description
 
+    async def async_added_to_hass(self) -> None:
+        """Register with the co-ordinator so services can find this entity."""
+        await super().async_added_to_hass()
+        self.coordinator.async_add_entity(self)
+
+    async def async_will_remove_from_hass(self) -> None:
+        """Unregister from the co-ordinator."""
+        if self._write_handle is not None:
+            self._write_handle.cancel()
+            self._write_handle = None
+        self.coordinator.async_remove_entity(self)
+        await super().async_will_remove_from_hass()
+
     @abstractmethod
     def _update_from_coordinator(self) -> None:
         pass
 
+    def _fingerprint(self) -> tuple[Any, ...]:
+        """Everything the written state is derived from."""
+        # Entity keeps most _attr_ values in a matching __attr_ slot
+        return (
+            self.available,
+            *(
+                value
+                for key, value in vars(self).items()
+                if key.startswith(("_attr_", "__attr_"))
+            ),
+        )
+
     @callback
     def _handle_coordinator_update(self) -> None:
-        """Handle updated data from the coordinator."""
+        """Handle updated data from the coordinator.
+
+        Updates in the same pass of the event loop are written out once, and
+        not at all if nothing this entity shows has changed.
+        """
+        if self._write_handle is None:
+            self._write_handle = self.hass.loop.call_soon(self._async_write_update)
+
+    @callback
+    def _async_write_update(self) -> None:
+        self._write_handle = None
         self._update_from_coordinator()
+        if (fingerprint := self._fingerprint()) == self._last_written:
+            return
+        self._last_written = fingerprint
         self.async_write_ha_state()
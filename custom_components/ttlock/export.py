@@ -0,0 +1,77 @@
+"""Write lock records to a file one page at a time."""
+from __future__ import annotations
+
+import csv
+import os
+from typing import IO, Any
+
+from homeassistant.helpers.json import json_dumps
+
+from .models import LockRecord
+
+EXPORT_DIR = "ttlock_exports"
+EXPORT_FORMATS = ("jsonl", "csv")
+
+RECORD_FIELDS = (
+    "id",
+    "lock_id",
+    "record_type",
+    "success",
+    "username",
+    "keyboard_pwd",
+    "lock_date",
+    "server_date",
+)
+
+
+def record_row(record: LockRecord) -> dict[str, Any]:
+    """Flatten a record into the fields that are exported."""
+    return {
+        "id": record.id,
+        "lock_id": record.lock_id,
+        "record_type": record.record_type.name if record.record_type else None,
+        "success": record.success,
+        "username": record.username,
+        "keyboard_pwd": record.keyboard_pwd,
+        "lock_date": record.lock_date.isoformat() if record.lock_date else None,
+        "server_date": record.server_date.isoformat() if record.server_date else None,
+    }
+
+
+class RecordFileWriter:
+    """Appends pages of records to a JSONL or CSV file.
+
+    All methods do blocking I/O and must be run in the executor.
+    """
+
+    def __init__(self, path: str, file_format: str) -> None:
+        """Initialize the writer, the file isn't created until open()."""
+        self.path = path
+        self.file_format = file_format
+        self.count = 0
+        self._file: IO[str] | None = None
+        self._csv: csv.DictWriter | None = None
+
+    def open(self) -> None:
+        """Create the file (and export directory) and write any header."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._file = open(self.path, "w", encoding="utf-8", newline="")
+        if self.file_format == "csv":
+            self._csv = csv.DictWriter(self._file, fieldnames=RECORD_FIELDS)
+            self._csv.writeheader()
+
+    def write(self, records: list[LockRecord]) -> None:
+        """Append a page of records."""
+        assert self._file is not None
+        rows = [record_row(record) for record in records]
+        if self._csv is not None:
+            self._csv.writerows(rows)
+        else:
+            self._file.writelines(f"{json_dumps(row)}\n" for row in rows)
+        self.count += len(rows)
+
+    def close(self) -> None:
+        """Flush and close the file."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
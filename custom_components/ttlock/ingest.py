@@ -0,0 +1,87 @@
+"""Queue webhook events so requests are answered before they are processed."""
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+from dataclasses import dataclass
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.dispatcher import async_dispatcher_send
+
+from .const import SIGNAL_NEW_DATA
+from .models import WebhookEvent
+
+# Events waiting to be processed, a request that doesn't fit is turned away
+WEBHOOK_QUEUE_SIZE = 2000
+
+
+@dataclass
+class QueueStats:
+    """Counters for the webhook queue."""
+
+    received: int = 0
+    dropped: int = 0
+    overflows: int = 0
+    batches: int = 0
+    lock_updates: int = 0
+    peak_depth: int = 0
+
+
+class WebhookQueue:
+    """Buffer webhook events and hand them to the co-ordinators in batches.
+
+    Everything queued since the last batch is processed together, with the
+    events for each lock delivered in one go and in the order they arrived.
+    """
+
+    def __init__(self, hass: HomeAssistant, maxsize: int = WEBHOOK_QUEUE_SIZE) -> None:
+        """Initialize an empty queue."""
+        self.hass = hass
+        self.maxsize = maxsize
+        self.stats = QueueStats()
+        self._pending: deque[WebhookEvent] = deque()
+        self._ready = asyncio.Event()
+
+    @property
+    def depth(self) -> int:
+        """Return the number of events waiting to be processed."""
+        return len(self._pending)
+
+    @callback
+    def async_put(self, events: list[WebhookEvent]) -> bool:
+        """Queue the events of one request, all or none. False if they don't fit."""
+        if self.depth + len(events) > self.maxsize:
+            self.stats.overflows += 1
+            self.stats.dropped += len(events)
+            return False
+
+        self._pending.extend(events)
+        self.stats.received += len(events)
+        self.stats.peak_depth = max(self.stats.peak_depth, self.depth)
+        self._ready.set()
+        return True
+
+    async def run(self) -> None:
+        """Process batches as events arrive, until cancelled."""
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            self.async_process()
+
+    @callback
+    def async_process(self) -> None:
+        """Deliver every queued event, grouped by lock."""
+        if not self._pending:
+            return
+
+        by_lock: dict[int, list[WebhookEvent]] = {}
+        while self._pending:
+            event = self._pending.popleft()
+            by_lock.setdefault(event.id, []).append(event)
+
+        for lock_id, events in by_lock.items():
+            async_dispatcher_send(
+                self.hass, SIGNAL_NEW_DATA.format(lock_id=lock_id), events
+            )
+        self.stats.batches += 1
+        self.stats.lock_updates += len(by_lock)
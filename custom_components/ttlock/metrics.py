@@ -0,0 +1,113 @@
+"""Counters and latency histograms for the hot paths of the integration."""
+from __future__ import annotations
+
+from bisect import bisect_left
+from collections.abc import Hashable, Iterator
+from contextlib import contextmanager
+import time
+from typing import Any
+
+# Upper bounds (in seconds) of the histogram buckets, like a Prometheus histogram
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """Count observations into fixed buckets, keeping the sum and extremes."""
+
+    __slots__ = ("buckets", "counts", "count", "sum", "max", "last")
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        """Initialize an empty histogram."""
+        self.buckets = buckets
+        # One more than there are bounds, for everything above the last
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.last: float | None = None
+
+    def observe(self, value: float) -> None:
+        """Record a single observation."""
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        self.last = value
+
+    def as_dict(self) -> dict[str, Any]:
+        """Summarize with cumulative buckets, as Prometheus exposes them."""
+        cumulative: dict[str, int] = {}
+        total = 0
+        for bound, count in zip((*map(str, self.buckets), "+Inf"), self.counts):
+            total += count
+            cumulative[bound] = total
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "max": round(self.max, 6),
+            "buckets": cumulative,
+        }
+
+
+class Metrics:
+    """Named counters, gauges and histograms, each broken down by a label."""
+
+    def __init__(self) -> None:
+        """Initialize with nothing recorded."""
+        self.started = time.monotonic()
+        self.counters: dict[str, dict[Hashable, int]] = {}
+        self.gauges: dict[str, dict[Hashable, float]] = {}
+        self.histograms: dict[str, dict[Hashable, Histogram]] = {}
+
+    def inc(self, name: str, label: Hashable = None, amount: int = 1) -> None:
+        """Add to a counter."""
+        counters = self.counters.setdefault(name, {})
+        counters[label] = counters.get(label, 0) + amount
+
+    def set_gauge(self, name: str, label: Hashable, value: float) -> None:
+        """Record the current value of something that goes up and down."""
+        self.gauges.setdefault(name, {})[label] = value
+
+    def observe(self, name: str, label: Hashable, value: float) -> None:
+        """Add an observation to a histogram."""
+        histograms = self.histograms.setdefault(name, {})
+        if (histogram := histograms.get(label)) is None:
+            histogram = histograms[label] = Histogram()
+        histogram.observe(value)
+
+    def histogram(self, name: str, label: Hashable) -> Histogram | None:
+        """Return a histogram if anything has been recorded in it."""
+        return self.histograms.get(name, {}).get(label)
+
+    @contextmanager
+    def timed(self, name: str, label: Hashable = None) -> Iterator[None]:
+        """Observe how long the block takes, counting it in name_errors if it raises."""
+        start = time.monotonic()
+        try:
+            yield
+        except Exception:
+            self.inc(f"{name}_errors", label)
+            raise
+        finally:
+            self.observe(name, label, time.monotonic() - start)
+
+    def as_dict(self) -> dict[str, Any]:
+        """Everything recorded, for diagnostics."""
+        return {
+            "uptime_seconds": round(time.monotonic() - self.started, 3),
+            "counters": {
+                name: {str(label): value for label, value in counters.items()}
+                for name, counters in self.counters.items()
+            },
+            "gauges": {
+                name: {str(label): value for label, value in gauges.items()}
+                for name, gauges in self.gauges.items()
+            },
+            "histograms": {
+                name: {
+                    str(label): histogram.as_dict()
+                    for label, histogram in histograms.items()
+                }
+                for name, histograms in self.histograms.items()
+            },
+        }
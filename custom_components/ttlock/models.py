@@ -3,7 +3,7 @@
 from collections import namedtuple
 from datetime import datetime
 from enum import Enum, IntEnum, IntFlag, auto
-from typing import Optional
+from typing import Any, Optional
 
 try:
     from pydantic.v1 import BaseModel, Field, validator
@@ -24,7 +24,8 @@ class EpochMs(datetime):
     @classmethod
     def validate(cls, v):
         """Use homeassistant time helpers to parse epoch."""
-        return dt.as_local(dt.utc_from_timestamp(v / 1000))
+        # Same result as dt.as_local(dt.utc_from_timestamp(...)) in one step
+        return datetime.fromtimestamp(v / 1000, dt.get_default_time_zone())
 
 
 class OnOff(Enum):
@@ -90,6 +91,23 @@ class Lock(BaseModel):
     noKeyPwd: str = Field(alias="adminPwd")
 
 
+class LockSummary(BaseModel):
+    """The subset of lock details returned for every lock by lock/list."""
+
+    id: int = Field(..., alias="lockId")
+    name: str = Field("Lock", alias="lockAlias")
+    mac: str = Field(..., alias="lockMac")
+    battery_level: int | None = Field(None, alias="electricQuantity")
+    featureValue: str | None = None
+    # Only an explicit 0 rules out a gateway, locks that omit it stay connectable
+    has_gateway: bool = Field(True, alias="hasGateway")
+
+    @property
+    def features(self) -> "Features":
+        """Features supported by the lock."""
+        return Features.from_feature_value(self.featureValue)
+
+
 class Sensor(BaseModel):
     """sensor details."""
 
@@ -316,6 +334,11 @@ class Event:
             self._value_, EventDescription(Action.unknown, "unknown")
         )
 
+    @property
+    def value(self) -> int:
+        """The record type of this event."""
+        return self._value_
+
     @property
     def action(self) -> Action:
         """The action this event represents."""
@@ -337,16 +360,32 @@ class Event:
         if not isinstance(v, int):
             raise TypeError("int required")
 
-        if v not in cls.EVENTS:
+        if (event := _EVENT_INSTANCES.get(v)) is None:
             raise ValueError("invalid record")
 
-        return cls(v)
+        return event
 
     def __repr__(self):
         """Representation of the event."""
         return f"Event({self._info})"
 
 
+# Events carry no state of their own, one instance per record type is shared
+_EVENT_INSTANCES = {event_id: Event(event_id) for event_id in Event.EVENTS}
+
+# What each action leaves the lock and sensor in, shared so treat as read-only
+_LOCK_STATES = {
+    Action.lock: LockState(state=State.locked),
+    Action.unlock: LockState(state=State.unlocked),
+}
+_NO_LOCK_STATE = LockState(state=None)
+_SENSOR_STATES = {
+    Action.close: LockState(state=State.locked, sensorState=SensorState.closed),
+    Action.open: LockState(sensorState=SensorState.opened),
+}
+_NO_SENSOR_STATE = LockState(sensorState=None)
+
+
 class WebhookEvent(BaseModel):
     """Event from the API (via webhook)."""
 
@@ -361,23 +400,63 @@ class WebhookEvent(BaseModel):
 
     # keyboardPwd - ignore for now
 
+    @classmethod
+    def from_record(cls, record: dict[str, Any]) -> "WebhookEvent":
+        """Parse a webhook record, skipping pydantic for the usual field types.
+
+        Anything that doesn't look exactly like what TTLock sends is handed to
+        parse_obj, so it's coerced or rejected the same way as before.
+        """
+        if type(record) is not dict:
+            return cls.parse_obj(record)
+
+        lock_id = record.get("lockId")
+        mac = record.get("lockMac")
+        battery_level = record.get("electricQuantity")
+        server_date = record.get("serverDate")
+        lock_date = record.get("lockDate")
+        record_type = record.get("recordType")
+        event = _EVENT_INSTANCES.get(record_type) if type(record_type) is int else None
+        user = record.get("username")
+        success = record.get("success")
+        if (
+            type(lock_id) is not int
+            or type(mac) is not str
+            or (battery_level is not None and type(battery_level) is not int)
+            or type(server_date) is not int
+            or type(lock_date) is not int
+            or event is None
+            or (user is not None and type(user) is not str)
+            or success not in (0, 1)
+            or type(success) not in (int, bool)
+        ):
+            return cls.parse_obj(record)
+
+        tz = dt.get_default_time_zone()
+        return cls.construct(
+            id=lock_id,
+            mac=mac,
+            battery_level=battery_level,
+            server_ts=datetime.fromtimestamp(server_date / 1000, tz),
+            lock_ts=datetime.fromtimestamp(lock_date / 1000, tz),
+            event=event,
+            user=user,
+            success=bool(success),
+        )
+
     @property
     def state(self) -> LockState:
         """The end state of the lock after this event."""
-        if self.success and self.event.action == Action.lock:
-            return LockState(state=State.locked)
-        elif self.success and self.event.action == Action.unlock:
-            return LockState(state=State.unlocked)
-        return LockState(state=None)
+        if self.success:
+            return _LOCK_STATES.get(self.event.action, _NO_LOCK_STATE)
+        return _NO_LOCK_STATE
 
     @property
     def sensorState(self) -> LockState:
         """The end state of the sensor after this event."""
-        if self.success and self.event.action == Action.close:
-            return LockState(state=State.locked, sensorState=SensorState.closed)
-        elif self.success and self.event.action == Action.open:
-            return LockState(sensorState=SensorState.opened)
-        return LockState(sensorState=None)
+        if self.success:
+            return _SENSOR_STATES.get(self.event.action, _NO_SENSOR_STATE)
+        return _NO_SENSOR_STATE
 
 
 class Features(IntFlag):
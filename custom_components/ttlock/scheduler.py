@@ -0,0 +1,182 @@
+"""Concurrency control for commands relayed through TTLock gateways."""
+from __future__ import annotations
+
+import asyncio
+from collections.abc import AsyncIterator, Hashable, Mapping
+from contextlib import AsyncExitStack, asynccontextmanager
+import heapq
+import itertools
+import time
+
+from .const import DEFAULT_ACCOUNT_CONCURRENCY, DEFAULT_GATEWAY_CONCURRENCY
+from .metrics import Metrics
+
+# Locks we haven't been able to place behind a gateway share this key, which
+# keeps them serialized the same way as before gateways were known.
+UNKNOWN_GATEWAY = "unknown"
+
+# Someone is waiting on these, e.g. locking or unlocking a door
+LANE_INTERACTIVE = "interactive"
+# Admin work that can be run in bulk, e.g. passcodes and settings
+LANE_BULK = "bulk"
+# Lower goes first when both are waiting for a gateway or the account
+LANE_PRIORITY = {LANE_INTERACTIVE: 0, LANE_BULK: 1}
+
+
+class PrioritySemaphore:
+    """A semaphore that hands free slots to the most urgent waiter first.
+
+    Waiters of the same priority are served in the order they arrived.
+    """
+
+    def __init__(self, value: int) -> None:
+        """Initialize with value slots free."""
+        self._value = value
+        self._waiters: list[tuple[int, int, asyncio.Future[None]]] = []
+        self._order = itertools.count()
+
+    async def acquire(self, priority: int = 0) -> None:
+        """Take a slot, waiting behind anyone more urgent."""
+        # Slots are handed straight to waiters, so a free one means none wait
+        if self._value > 0:
+            self._value -= 1
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._order), waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if not waiter.cancelled():
+                # Handed a slot just as we were cancelled, pass it on
+                self.release()
+            raise
+
+    def release(self) -> None:
+        """Give a slot back, or to the most urgent waiter."""
+        while self._waiters:
+            *_, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._value += 1
+
+
+class GatewayScheduler:
+    """Serialize calls per gateway while independent gateways run in parallel.
+
+    Calls are made in lanes. Interactive calls go ahead of any bulk calls
+    still waiting for the same gateway or the account, and bulk calls are
+    limited so there is always room left on the account for interactive ones.
+    A call that has already started isn't interrupted.
+    """
+
+    def __init__(
+        self,
+        per_gateway: int = DEFAULT_GATEWAY_CONCURRENCY,
+        per_account: int = DEFAULT_ACCOUNT_CONCURRENCY,
+        metrics: Metrics | None = None,
+        per_bulk: int | None = None,
+    ) -> None:
+        """Initialize the scheduler, bulk calls get all but one account slot."""
+        self._metrics = metrics
+        self._per_gateway = per_gateway
+        self._account = PrioritySemaphore(per_account)
+        self._gateways: dict[Hashable, PrioritySemaphore] = {}
+        self._lock_gateway: dict[int, Hashable] = {}
+        # Leave at least one account slot for the interactive lane
+        if per_bulk is None:
+            per_bulk = per_account - 1
+        self._lanes = {
+            LANE_BULK: PrioritySemaphore(max(1, min(per_bulk, per_account - 1)))
+        }
+        self._queued = dict.fromkeys(LANE_PRIORITY, 0)
+        self._peak = dict.fromkeys(LANE_PRIORITY, 0)
+
+    def update_gateways(self, lock_gateway: Mapping[int, Hashable]) -> None:
+        """Record which gateway each lock is reached through."""
+        self._lock_gateway.update(lock_gateway)
+
+    def gateway_for(self, lock_id: int) -> Hashable:
+        """Return the gateway key used to serialize calls to a lock."""
+        return self._lock_gateway.get(lock_id, UNKNOWN_GATEWAY)
+
+    def queued(self, lane: str) -> int:
+        """Return the number of calls in lane waiting for a slot."""
+        return self._queued[lane]
+
+    def _semaphore(self, gateway: Hashable) -> PrioritySemaphore:
+        if (semaphore := self._gateways.get(gateway)) is None:
+            semaphore = self._gateways[gateway] = PrioritySemaphore(self._per_gateway)
+        return semaphore
+
+    def _set_queued(self, lane: str, change: int) -> None:
+        depth = self._queued[lane] = self._queued[lane] + change
+        self._peak[lane] = max(self._peak[lane], depth)
+        if self._metrics is not None:
+            self._metrics.set_gauge("gateway_queue_depth", lane, depth)
+            self._metrics.set_gauge("gateway_queue_peak", lane, self._peak[lane])
+
+    async def _acquire(
+        self, stack: AsyncExitStack, semaphore: PrioritySemaphore, priority: int
+    ) -> None:
+        await semaphore.acquire(priority)
+        stack.callback(semaphore.release)
+
+    @asynccontextmanager
+    async def slot(
+        self, lock_id: int, lane: str = LANE_INTERACTIVE
+    ) -> AsyncIterator[None]:
+        """Hold a slot on the gateway for lock_id (and the account) while in use."""
+        priority = LANE_PRIORITY[lane]
+        gateway = self.gateway_for(lock_id)
+        start = time.monotonic()
+        async with AsyncExitStack() as stack:
+            self._set_queued(lane, 1)
+            try:
+                # The gateway is acquired first so that a call queued behind a busy
+                # hub doesn't tie up a lane or account slot other gateways could use.
+                await self._acquire(stack, self._semaphore(gateway), priority)
+                if (limit := self._lanes.get(lane)) is not None:
+                    await self._acquire(stack, limit, priority)
+                await self._acquire(stack, self._account, priority)
+            finally:
+                self._set_queued(lane, -1)
+
+            if self._metrics is not None:
+                waited = time.monotonic() - start
+                self._metrics.observe("gateway_wait_seconds", gateway, waited)
+                self._metrics.observe("lane_wait_seconds", lane, waited)
+            yield
+
+
+class TokenBucket:
+    """Pace calls to a sustained rate while still allowing short bursts."""
+
+    def __init__(self, rate: float, capacity: float | None = None) -> None:
+        """Initialize the bucket, it starts out full."""
+        self._rate = rate
+        self._capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self._capacity
+        self._updated = time.monotonic()
+        # Waiters are served in order so a burst drains fairly
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(
+            self._capacity, self._tokens + (now - self._updated) * self._rate
+        )
+        self._updated = now
+
+    async def acquire(self) -> bool:
+        """Take a token, waiting for one if needed. Returns True if we waited."""
+        async with self._lock:
+            waited = False
+            self._refill()
+            while self._tokens < 1:
+                waited = True
+                await asyncio.sleep((1 - self._tokens) / self._rate)
+                self._refill()
+            self._tokens -= 1
+            return waited
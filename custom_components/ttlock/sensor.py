@@ -5,7 +5,12 @@ import logging
 
 from homeassistant.components.sensor import SensorDeviceClass, SensorEntity
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.const import PERCENTAGE, STATE_UNAVAILABLE
+from homeassistant.const import (
+    PERCENTAGE,
+    STATE_UNAVAILABLE,
+    EntityCategory,
+    UnitOfTime,
+)
 from homeassistant.core import HomeAssistant
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.restore_state import RestoreEntity
@@ -31,6 +36,7 @@ async def async_setup_entry(
                 LockBattery(coordinator),
                 LockOperator(coordinator),
                 LockTrigger(coordinator),
+                RefreshDuration(coordinator),
                 SensorBattery(coordinator)
                 if sensor_present(coordinator.data.sensor)
                 else None,
@@ -110,3 +116,24 @@ class SensorBattery(BaseLockEntity, SensorEntity):
             if self.coordinator.data.sensor
             else None
         )
+
+
+class RefreshDuration(BaseLockEntity, SensorEntity):
+    """How long the last refresh of the lock took, to help find slow locks."""
+
+    _attr_device_class = SensorDeviceClass.DURATION
+    _attr_native_unit_of_measurement = UnitOfTime.SECONDS
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_entity_registry_enabled_default = False
+
+    def _update_from_coordinator(self) -> None:
+        """Fetch state from the device."""
+        self._attr_name = f"{self.coordinator.data.name} Refresh Duration"
+        histogram = self.coordinator.api.metrics.histogram(
+            "refresh_seconds", self.coordinator.lock_id
+        )
+        self._attr_native_value = (
+            round(histogram.last, 3)
+            if histogram is not None and histogram.last is not None
+            else None
+        )
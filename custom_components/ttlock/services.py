@@ -1,7 +1,10 @@
 """Services for ttlock integration."""
 
-from datetime import time
+import asyncio
+from collections.abc import Awaitable, Callable
+from datetime import datetime, time
 import logging
+from typing import Any, TypeVar
 
 import voluptuous as vol
 
@@ -12,8 +15,9 @@ from homeassistant.core import (
     ServiceResponse,
     SupportsResponse,
 )
+from homeassistant.exceptions import HomeAssistantError
 import homeassistant.helpers.config_validation as cv
-from homeassistant.util.dt import as_utc
+from homeassistant.util.dt import as_utc, utcnow
 
 from .const import (
     CONF_ALL_DAY,
@@ -27,14 +31,23 @@ from .const import (
     SVC_CONFIG_AUTOLOCK,
     SVC_CONFIG_PASSAGE_MODE,
     SVC_CREATE_PASSCODE,
+    SVC_EXPORT_RECORDS,
     SVC_LIST_PASSCODES,
     SVC_LIST_RECORDS,
+    SVC_SYNC_PASSCODES,
 )
 from .coordinator import LockUpdateCoordinator, coordinator_for
-from .models import AddPasscodeConfig, OnOff, PassageModeConfig
+from .export import EXPORT_DIR, EXPORT_FORMATS, RecordFileWriter
+from .models import AddPasscodeConfig, OnOff, PassageModeConfig, Passcode, PasscodeType
 
 _LOGGER = logging.getLogger(__name__)
 
+# Upper bound on locks worked on at once by a single service call, the api
+# client still paces requests and serializes calls through each gateway.
+SERVICE_CONCURRENCY = 10
+
+_T = TypeVar("_T")
+
 _LIST_RECORDS_SCHEMA = vol.Schema(
     {
         vol.Optional("start_date"): cv.datetime,
@@ -46,6 +59,73 @@ _LIST_RECORDS_SCHEMA = vol.Schema(
     }
 )
 
+_PASSCODE_SCHEMA = vol.Schema(
+    {
+        vol.Required("passcode_name"): cv.string,
+        vol.Required("passcode"): cv.string,
+        vol.Required("start_time"): cv.datetime,
+        vol.Required("end_time"): cv.datetime,
+    }
+)
+
+
+def _unique_passcodes(passcodes: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    codes = [passcode["passcode"] for passcode in passcodes]
+    if len(codes) != len(set(codes)):
+        raise vol.Invalid("Each passcode can only be listed once")
+    return passcodes
+
+
+def _epoch_ms(value: datetime) -> int:
+    return int(as_utc(value).timestamp() * 1000)
+
+
+def _passcode_changes(
+    current: list[Passcode], desired: list[AddPasscodeConfig], remove_unlisted: bool
+) -> tuple[list[AddPasscodeConfig], list[Passcode], int, list[AddPasscodeConfig]]:
+    """Work out which passcodes to add and delete to get from current to desired.
+
+    Only temporary passcodes are ever deleted. One that differs from what is
+    wanted in name or validity (to the minute, which is all the lock keeps) is
+    deleted and added again. A wanted passcode that the lock already has as
+    another kind of passcode can't be added, it is a conflict. Returns what to
+    add, what to delete, how many are already as wanted and the conflicts.
+    """
+    wanted = {config.passcode: config for config in desired}
+    to_delete: list[Passcode] = []
+    unchanged: set[str] = set()
+    conflicts: set[str] = set()
+
+    for code in current:
+        config = wanted.get(code.passcode)
+        if code.type != PasscodeType.temporary:
+            if config is not None:
+                conflicts.add(code.passcode)
+            continue
+        if config is None:
+            if remove_unlisted:
+                to_delete.append(code)
+        elif (
+            code.name == config.passcode_name
+            and int(code.start_date.timestamp()) // 60 == config.start_minute // 60000
+            and int(code.end_date.timestamp()) // 60 == config.end_minute // 60000
+        ):
+            unchanged.add(code.passcode)
+        else:
+            to_delete.append(code)
+
+    to_add = [
+        config
+        for config in desired
+        if config.passcode not in unchanged and config.passcode not in conflicts
+    ]
+    return (
+        to_add,
+        to_delete,
+        len(unchanged),
+        [config for config in desired if config.passcode in conflicts],
+    )
+
 
 class Services:
     """Wraps service handlers."""
@@ -61,7 +141,7 @@ class Services:
             DOMAIN,
             SVC_CONFIG_PASSAGE_MODE,
             self.handle_configure_passage_mode,
-            vol.Schema(
+            schema=vol.Schema(
                 {
                     vol.Required(ATTR_ENTITY_ID): cv.entity_ids,
                     vol.Required(CONF_ENABLED): cv.boolean,
@@ -72,13 +152,14 @@ class Services:
                     vol.Optional(CONF_WEEK_DAYS, default=WEEKDAYS): cv.weekdays,
                 }
             ),
+            supports_response=SupportsResponse.OPTIONAL,
         )
 
         self.hass.services.register(
             DOMAIN,
             SVC_CREATE_PASSCODE,
             self.handle_create_passcode,
-            vol.Schema(
+            schema=vol.Schema(
                 {
                     vol.Required(ATTR_ENTITY_ID): cv.entity_ids,
                     vol.Required("passcode_name"): cv.string,
@@ -87,6 +168,7 @@ class Services:
                     vol.Required("end_time", default=time()): cv.datetime,
                 }
             ),
+            supports_response=SupportsResponse.OPTIONAL,
         )
 
         self.hass.services.register(
@@ -101,6 +183,22 @@ class Services:
             supports_response=SupportsResponse.OPTIONAL,
         )
 
+        self.hass.services.register(
+            DOMAIN,
+            SVC_SYNC_PASSCODES,
+            self.handle_sync_passcodes,
+            schema=vol.Schema(
+                {
+                    vol.Required(ATTR_ENTITY_ID): cv.entity_ids,
+                    vol.Required("passcodes"): vol.All(
+                        cv.ensure_list, [_PASSCODE_SCHEMA], _unique_passcodes
+                    ),
+                    vol.Optional("remove_unlisted", default=True): cv.boolean,
+                }
+            ),
+            supports_response=SupportsResponse.OPTIONAL,
+        )
+
         self.hass.services.register(
             DOMAIN,
             SVC_LIST_PASSCODES,
@@ -132,11 +230,26 @@ class Services:
             supports_response=SupportsResponse.ONLY,
         )
 
+        self.hass.services.register(
+            DOMAIN,
+            SVC_EXPORT_RECORDS,
+            self.handle_export_records,
+            schema=vol.Schema(
+                {
+                    vol.Required(ATTR_ENTITY_ID): cv.entity_ids,
+                    vol.Optional("start_date"): cv.datetime,
+                    vol.Optional("end_date"): cv.datetime,
+                    vol.Optional("format", default="jsonl"): vol.In(EXPORT_FORMATS),
+                }
+            ),
+            supports_response=SupportsResponse.OPTIONAL,
+        )
+
         self.hass.services.register(
             DOMAIN,
             SVC_CONFIG_AUTOLOCK,
             self.handle_configure_autolock,
-            vol.Schema(
+            schema=vol.Schema(
                 {
                     vol.Required(ATTR_ENTITY_ID): cv.entity_ids,
                     vol.Required(CONF_ENABLED): cv.boolean,
@@ -145,6 +258,7 @@ class Services:
                     ),
                 }
             ),
+            supports_response=SupportsResponse.OPTIONAL,
         )
 
     def _get_coordinators(self, call: ServiceCall) -> dict[str, LockUpdateCoordinator]:
@@ -169,13 +283,73 @@ class Services:
             }
         return {}
 
+    async def _for_each_lock(
+        self,
+        call: ServiceCall,
+        action: Callable[[LockUpdateCoordinator], Awaitable[_T]],
+    ) -> tuple[dict[str, _T], dict[str, str]]:
+        """Run action concurrently for every targeted lock.
+
+        Returns the results and the errors keyed by entity_id, a failure for one
+        lock doesn't stop the others.
+        """
+        coordinators = self._get_coordinators(call)
+        semaphore = asyncio.Semaphore(SERVICE_CONCURRENCY)
+        results: dict[str, _T] = {}
+        errors: dict[str, str] = {}
+
+        async def run(entity_id: str, coordinator: LockUpdateCoordinator) -> None:
+            async with semaphore:
+                try:
+                    results[entity_id] = await action(coordinator)
+                except Exception as err:
+                    _LOGGER.warning(
+                        "%s failed for %s: %s", call.service, entity_id, err
+                    )
+                    errors[entity_id] = str(err) or type(err).__name__
+
+        await asyncio.gather(*[run(*item) for item in coordinators.items()])
+
+        # Keep the order the entities were requested in
+        return {
+            entity_id: results[entity_id]
+            for entity_id in coordinators
+            if entity_id in results
+        }, errors
+
+    def _response(
+        self, call: ServiceCall, response: dict[str, Any], errors: dict[str, str]
+    ) -> ServiceResponse:
+        """Report errors in the response, or raise them if none was asked for."""
+        if errors:
+            if not call.return_response:
+                raise HomeAssistantError(
+                    f"{call.service} failed for "
+                    + ", ".join(
+                        f"{entity_id} ({error})" for entity_id, error in errors.items()
+                    )
+                )
+            response["errors"] = errors
+        return response
+
+    def _updated(
+        self, call: ServiceCall, results: dict[str, bool], errors: dict[str, str]
+    ) -> ServiceResponse:
+        for entity_id, ok in results.items():
+            if not ok:
+                errors[entity_id] = "Request was not accepted by the lock"
+        return self._response(
+            call,
+            {"updated": [entity_id for entity_id, ok in results.items() if ok]},
+            errors,
+        )
+
     async def handle_list_passcodes(self, call: ServiceCall) -> ServiceResponse:
         """List all passcodes for the selected locks."""
-        passcodes = {}
 
-        for entity_id, coordinator in self._get_coordinators(call).items():
+        async def list_passcodes(coordinator: LockUpdateCoordinator) -> list[dict]:
             codes = await coordinator.api.list_passcodes(coordinator.lock_id)
-            passcodes[entity_id] = [
+            return [
                 {
                     "name": code.name,
                     "passcode": code.passcode,
@@ -187,9 +361,10 @@ class Services:
                 for code in codes
             ]
 
-        return {"passcodes": passcodes}
+        passcodes, errors = await self._for_each_lock(call, list_passcodes)
+        return self._response(call, {"passcodes": passcodes}, errors)
 
-    async def handle_configure_passage_mode(self, call: ServiceCall):
+    async def handle_configure_passage_mode(self, call: ServiceCall) -> ServiceResponse:
         """Enable passage mode for the given entities."""
         start_time = call.data.get(CONF_START_TIME)
         end_time = call.data.get(CONF_END_TIME)
@@ -204,12 +379,15 @@ class Services:
             weekDays=days,
         )
 
-        for _entity_id, coordinator in self._get_coordinators(call).items():
+        async def set_passage_mode(coordinator: LockUpdateCoordinator) -> bool:
             if await coordinator.api.set_passage_mode(coordinator.lock_id, config):
-                coordinator.data.passage_mode_config = config
-                coordinator.async_update_listeners()
+                coordinator.async_update_state(passage_mode_config=config)
+                return True
+            return False
 
-    async def handle_create_passcode(self, call: ServiceCall):
+        return self._updated(call, *await self._for_each_lock(call, set_passage_mode))
+
+    async def handle_create_passcode(self, call: ServiceCall) -> ServiceResponse:
         """Create a new passcode for the given entities."""
 
         start_time_val = call.data.get("start_time")
@@ -227,28 +405,88 @@ class Services:
             endDate=end_time,
         )
 
-        for _entity_id, coordinator in self._get_coordinators(call).items():
-            await coordinator.api.add_passcode(coordinator.lock_id, config)
+        async def add_passcode(coordinator: LockUpdateCoordinator) -> bool:
+            return await coordinator.api.add_passcode(coordinator.lock_id, config)
+
+        return self._updated(call, *await self._for_each_lock(call, add_passcode))
 
     async def handle_cleanup_passcodes(self, call: ServiceCall) -> ServiceResponse:
         """Clean up expired passcodes for the given entities."""
-        removed = {}
 
-        for entity_id, coordinator in self._get_coordinators(call).items():
+        async def cleanup(coordinator: LockUpdateCoordinator) -> list[str]:
             removed_for_lock = []
-            codes = await coordinator.api.list_passcodes(coordinator.lock_id)
+            codes = await coordinator.api.list_passcodes(
+                coordinator.lock_id, fresh=True
+            )
             for code in codes:
                 if code.expired:
                     if await coordinator.api.delete_passcode(
                         coordinator.lock_id, code.id
                     ):
                         removed_for_lock.append(code.name)
-            if removed_for_lock:
-                removed[entity_id] = removed_for_lock
+            return removed_for_lock
+
+        results, errors = await self._for_each_lock(call, cleanup)
+        removed = {entity_id: names for entity_id, names in results.items() if names}
+        return self._response(call, {"removed": removed}, errors)
+
+    async def handle_sync_passcodes(self, call: ServiceCall) -> ServiceResponse:
+        """Make the temporary passcodes on the given entities match a desired set.
+
+        Passcodes already as wanted are left alone, so running it again only
+        makes the changes that are still needed.
+        """
+        desired = [
+            AddPasscodeConfig(
+                passcode=passcode["passcode"],
+                passcodeName=passcode["passcode_name"],
+                startDate=_epoch_ms(passcode["start_time"]),
+                endDate=_epoch_ms(passcode["end_time"]),
+            )
+            for passcode in call.data["passcodes"]
+        ]
+        remove_unlisted = call.data.get("remove_unlisted", True)
+
+        async def sync(coordinator: LockUpdateCoordinator) -> dict[str, Any]:
+            api, lock_id = coordinator.api, coordinator.lock_id
+            to_add, to_delete, unchanged, conflicts = _passcode_changes(
+                await api.list_passcodes(lock_id, fresh=True), desired, remove_unlisted
+            )
+            for config in conflicts:
+                _LOGGER.warning(
+                    "Passcode %s is already on %s as another kind of passcode",
+                    config.passcode_name,
+                    lock_id,
+                )
+
+            # Deletes go first, a changed passcode is deleted before it is added
+            deleted = await asyncio.gather(
+                *[api.delete_passcode(lock_id, code.id) for code in to_delete]
+            )
+            failed = [code for code, ok in zip(to_delete, deleted) if not ok]
+            # The old version of a changed passcode is still there, leave it
+            blocked = {code.passcode for code in failed}
+            to_add = [config for config in to_add if config.passcode not in blocked]
+            added = await asyncio.gather(
+                *[api.add_passcode(lock_id, config) for config in to_add]
+            )
 
-        return {"removed": removed}
+            return {
+                "added": [c.passcode_name for c, ok in zip(to_add, added) if ok],
+                "removed": [code.name for code, ok in zip(to_delete, deleted) if ok],
+                "unchanged": unchanged,
+                "conflicts": [config.passcode_name for config in conflicts],
+                "failed": [code.name for code in failed]
+                + [c.passcode_name for c, ok in zip(to_add, added) if not ok],
+            }
+
+        results, errors = await self._for_each_lock(call, sync)
+        for entity_id, result in results.items():
+            if result["failed"]:
+                errors[entity_id] = "Request was not accepted by the lock"
+        return self._response(call, {"synced": results}, errors)
 
-    async def handle_configure_autolock(self, call: ServiceCall):
+    async def handle_configure_autolock(self, call: ServiceCall) -> ServiceResponse:
         """Set the autolock seconds."""
 
         if call.data.get(CONF_ENABLED):
@@ -256,14 +494,16 @@ class Services:
         else:
             seconds = 0
 
-        for coordinator in self._get_coordinators(call).values():
+        async def set_auto_lock(coordinator: LockUpdateCoordinator) -> bool:
             if await coordinator.api.set_auto_lock(coordinator.lock_id, seconds):
-                coordinator.data.auto_lock_seconds = seconds
-                coordinator.async_update_listeners()
+                coordinator.async_update_state(auto_lock_seconds=seconds)
+                return True
+            return False
+
+        return self._updated(call, *await self._for_each_lock(call, set_auto_lock))
 
     async def handle_list_records(self, call: ServiceCall) -> ServiceResponse:
         """List records for the selected locks."""
-        records = {}
         params = {}
 
         # Convert datetime parameters to millisecond timestamps if provided
@@ -276,11 +516,11 @@ class Services:
         params["page_no"] = call.data.get("page_no", 1)
         params["page_size"] = min(call.data.get("page_size", 50), 200)
 
-        for entity_id, coordinator in self._get_coordinators(call).items():
+        async def list_records(coordinator: LockUpdateCoordinator) -> list[dict]:
             lock_records = await coordinator.api.get_lock_records(
                 coordinator.lock_id, **params
             )
-            records[entity_id] = [
+            return [
                 {
                     "id": record.id,
                     "lock_id": record.lock_id,
@@ -294,4 +534,38 @@ class Services:
                 for record in lock_records
             ]
 
-        return {"records": records}
+        records, errors = await self._for_each_lock(call, list_records)
+        return self._response(call, {"records": records}, errors)
+
+    async def handle_export_records(self, call: ServiceCall) -> ServiceResponse:
+        """Export every record in the window for the selected locks to files."""
+        params = {}
+        if start_date := call.data.get("start_date"):
+            params["start_date"] = int(as_utc(start_date).timestamp() * 1000)
+        if end_date := call.data.get("end_date"):
+            params["end_date"] = int(as_utc(end_date).timestamp() * 1000)
+
+        file_format = call.data.get("format", "jsonl")
+        stamp = utcnow().strftime("%Y%m%dT%H%M%SZ")
+
+        async def export(coordinator: LockUpdateCoordinator) -> dict[str, Any]:
+            writer = RecordFileWriter(
+                self.hass.config.path(
+                    EXPORT_DIR, f"{coordinator.lock_id}_{stamp}.{file_format}"
+                ),
+                file_format,
+            )
+            await self.hass.async_add_executor_job(writer.open)
+            try:
+                # Each page is written out before the one after it is needed,
+                # so memory use doesn't grow with the size of the export.
+                async for page in coordinator.api.iter_lock_record_pages(
+                    coordinator.lock_id, **params
+                ):
+                    await self.hass.async_add_executor_job(writer.write, page)
+            finally:
+                await self.hass.async_add_executor_job(writer.close)
+            return {"path": writer.path, "records": writer.count}
+
+        files, errors = await self._for_each_lock(call, export)
+        return self._response(call, {"files": files}, errors)
@@ -0,0 +1,130 @@
+"""Persist the last known state of each lock between restarts."""
+from __future__ import annotations
+
+from collections.abc import Callable, Iterable
+import logging
+from typing import Any
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.storage import Store
+
+from .const import DOMAIN
+from .coordinator import LockState, LockUpdateCoordinator, SensorData
+from .models import Features, PassageModeConfig
+
+_LOGGER = logging.getLogger(__name__)
+
+STORAGE_VERSION = 1
+# Webhook events can arrive in bursts, there's no need to write out every one
+SAVE_DELAY = 30
+
+
+def lock_state_to_dict(state: LockState) -> dict[str, Any]:
+    """Serialize the metadata of a lock, transient state is left out."""
+    return {
+        "name": state.name,
+        "mac": state.mac,
+        "model": state.model,
+        "battery_level": state.battery_level,
+        "hardware_version": state.hardware_version,
+        "firmware_version": state.firmware_version,
+        "features": int(state.features),
+        "lock_sound": state.lock_sound,
+        "auto_lock_seconds": state.auto_lock_seconds,
+        "passage_mode_config": (
+            state.passage_mode_config.dict(by_alias=True)
+            if state.passage_mode_config
+            else None
+        ),
+        "sensor_battery": state.sensor.battery if state.sensor else None,
+        "has_sensor": state.sensor is not None,
+    }
+
+
+def lock_state_from_dict(data: dict[str, Any]) -> LockState:
+    """Restore a lock from its serialized metadata."""
+    return LockState(
+        name=data["name"],
+        mac=data["mac"],
+        model=data.get("model"),
+        battery_level=data.get("battery_level"),
+        hardware_version=data.get("hardware_version"),
+        firmware_version=data.get("firmware_version"),
+        features=Features(data.get("features", 0)),
+        lock_sound=data.get("lock_sound"),
+        auto_lock_seconds=data.get("auto_lock_seconds"),
+        passage_mode_config=(
+            PassageModeConfig.parse_obj(config)
+            if (config := data.get("passage_mode_config"))
+            else None
+        ),
+        # last_fetched is left empty so the sensor is re-checked on the first refresh
+        sensor=(
+            SensorData(battery=data.get("sensor_battery"))
+            if data.get("has_sensor")
+            else None
+        ),
+    )
+
+
+class LockCache:
+    """Stores the metadata of every lock in a config entry."""
+
+    def __init__(self, hass: HomeAssistant, entry_id: str) -> None:
+        """Initialize the cache for a config entry."""
+        self._store: Store[dict[str, dict[str, Any]]] = Store(
+            hass, STORAGE_VERSION, f"{DOMAIN}.{entry_id}"
+        )
+        self._coordinators: list[LockUpdateCoordinator] = []
+
+    async def async_load(self) -> dict[int, LockState]:
+        """Load the cached locks, anything unreadable is treated as a cache miss."""
+        try:
+            data = await self._store.async_load() or {}
+            return {
+                int(lock_id): lock_state_from_dict(state)
+                for lock_id, state in data.items()
+            }
+        except (KeyError, TypeError, ValueError) as err:
+            _LOGGER.warning("Ignoring unreadable lock cache: %s", err)
+            return {}
+
+    @callback
+    def async_track(
+        self, coordinators: Iterable[LockUpdateCoordinator]
+    ) -> Callable[[], None]:
+        """Save the cache whenever one of the co-ordinators updates."""
+        self._coordinators = list(coordinators)
+        unsubscribe = [
+            coordinator.async_add_listener(self.async_schedule_save)
+            for coordinator in self._coordinators
+        ]
+
+        @callback
+        def _untrack() -> None:
+            while unsubscribe:
+                unsubscribe.pop()()
+
+        return _untrack
+
+    @callback
+    def async_schedule_save(self) -> None:
+        """Write the cache out after a short delay."""
+        self._store.async_delay_save(self._data_to_save, SAVE_DELAY)
+
+    def _data_to_save(self) -> dict[str, dict[str, Any]]:
+        return {
+            str(coordinator.lock_id): lock_state_to_dict(coordinator.data)
+            for coordinator in self._coordinators
+            if coordinator.data
+        }
+
+    async def async_clear(self) -> None:
+        """Forget the cached locks, so the next setup starts from the cloud."""
+        # Any save still pending writes an empty cache
+        self._coordinators = []
+        await self._store.async_remove()
+
+    async def async_remove(self) -> None:
+        """Delete the cache file."""
+        await self._store.async_remove()
@@ -37,17 +37,13 @@ class AutoLock(BaseLockEntity, SwitchEntity):
 
     _attr_device_class = SwitchDeviceClass.SWITCH
 
-    @property
-    def extra_state_attributes(self):
-        """Define any extra state sttr."""
-        attributes = {}
-        attributes["seconds"] = self.coordinator.data.auto_lock_seconds
-        return attributes
-
     def _update_from_coordinator(self) -> None:
         """Fetch state from the device."""
         self._attr_name = f"{self.coordinator.data.name} Auto Lock"
-        self._attr_is_on = self.coordinator.data.auto_lock_seconds > 0
+        self._attr_is_on = (self.coordinator.data.auto_lock_seconds or 0) > 0
+        self._attr_extra_state_attributes = {
+            "seconds": self.coordinator.data.auto_lock_seconds
+        }
 
     async def async_turn_on(self, **kwargs: Any) -> None:
         """Turn the entity on."""
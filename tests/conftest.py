@@ -15,6 +15,7 @@ from custom_components.ttlock.models import (
     Lock,
     LockRecord,
     LockState,
+    LockSummary,
     PassageModeConfig,
     Sensor,
 )
@@ -160,8 +161,8 @@ def mock_api_responses(monkeypatch, mock_data_factory):
     def create_mock_responses(scenario: str = "default"):
         mock_data = mock_data_factory(scenario)
 
-        async def mock_get_locks(*args, **kwargs):
-            return [mock_data.lock.id]
+        async def mock_list_locks(*args, **kwargs):
+            return [LockSummary.parse_obj(mock_data.lock.dict(by_alias=True))]
 
         async def mock_get_lock(*args, **kwargs):
             return mock_data.lock
@@ -179,7 +180,7 @@ def mock_api_responses(monkeypatch, mock_data_factory):
             return mock_data.records
 
         monkeypatch.setattr(
-            "custom_components.ttlock.api.TTLockApi.get_locks", mock_get_locks
+            "custom_components.ttlock.api.TTLockApi.list_locks", mock_list_locks
         )
         monkeypatch.setattr(
             "custom_components.ttlock.api.TTLockApi.get_lock", mock_get_lock
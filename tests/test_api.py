@@ -0,0 +1,512 @@
+"""Test the TTLock API client."""
+import asyncio
+import json
+import time
+from typing import Any
+
+from aiohttp import ClientResponseError
+import pytest
+
+from custom_components.ttlock import api as api_module
+from custom_components.ttlock.api import RequestFailed, TTLockApi
+from custom_components.ttlock.scheduler import LANE_BULK, LANE_INTERACTIVE
+
+from .const import BASIC_LOCK_DETAILS, WEBHOOK_UNLOCK_10AM_UTC
+
+
+class FakeResponse:
+    """Just enough of aiohttp.ClientResponse for _parse_resp."""
+
+    def __init__(self, body: Any, status: int = 200) -> None:
+        self.status = status
+        self._body = json.dumps(body).encode()
+        self.reads = 0
+        self.decodes = 0
+
+    async def read(self) -> bytes:
+        self.reads += 1
+        return self._body
+
+    async def text(self) -> str:
+        return self._body.decode()
+
+    async def json(self) -> Any:
+        self.decodes += 1
+        return json.loads(self._body)
+
+    def raise_for_status(self) -> None:
+        if self.status >= 400:
+            raise ClientResponseError(None, (), status=self.status)
+
+
+class FakeSession:
+    """Replays a list of responses for successive requests."""
+
+    def __init__(self, *responses: FakeResponse) -> None:
+        self.responses = list(responses)
+        self.calls = 0
+
+    async def _next(self, *args, **kwargs) -> FakeResponse:
+        self.calls += 1
+        return self.responses.pop(0)
+
+    get = post = _next
+
+
+class PagedSession:
+    """Serves pages of a list of items, tracking how many are in flight."""
+
+    def __init__(self, items: int, page_size: int, with_page_count=True) -> None:
+        self.items = list(range(items))
+        self.page_size = page_size
+        self.with_page_count = with_page_count
+        self.requested: list[int] = []
+        self.active = self.peak = 0
+
+    async def get(self, url, params, **kwargs) -> FakeResponse:
+        page_no = params["pageNo"]
+        self.requested.append(page_no)
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(0.001)
+        self.active -= 1
+
+        start = (page_no - 1) * self.page_size
+        body = {
+            "list": [{"id": id} for id in self.items[start : start + self.page_size]]
+        }
+        if self.with_page_count:
+            body["pages"] = -(-len(self.items) // self.page_size)
+            body["total"] = len(self.items)
+        return FakeResponse(body)
+
+
+@pytest.fixture
+def retrying_api(monkeypatch):
+    """Return a factory for an api client with no retry delay."""
+    monkeypatch.setattr(api_module, "RETRY_BACKOFF_BASE", 0)
+
+    def _factory(*responses: FakeResponse) -> TTLockApi:
+        client = TTLockApi(FakeSession(*responses), None, requests_per_second=1000)
+
+        async def _add_auth(**kwargs):
+            return kwargs
+
+        monkeypatch.setattr(client, "_add_auth", _add_auth)
+        return client
+
+    return _factory
+
+
+async def _legacy_parse_resp(resp: FakeResponse) -> Any:
+    """Response handling as it was before decoding was done once."""
+    await resp.json()  # decoded for the debug log
+    resp.raise_for_status()
+    res = await resp.json()
+    if res.get("errcode", 0) != 0:
+        raise RequestFailed(f"API returned: {res}")
+    return await resp.json()
+
+
+LOCK_LIST = {
+    "list": [{**BASIC_LOCK_DETAILS, "lockId": id} for id in range(1000)],
+    "pageNo": 1,
+    "pageSize": 1000,
+    "pages": 1,
+    "total": 1000,
+}
+
+LOCK_RECORDS = {
+    "list": [
+        {**WEBHOOK_UNLOCK_10AM_UTC, "recordId": id, "keyboardPwd": "123456"}
+        for id in range(200)
+    ],
+    "pageNo": 1,
+    "pageSize": 200,
+    "pages": 1,
+    "total": 200,
+}
+
+
+class TestRetries:
+    async def test_transient_errcode_is_retried(self, retrying_api):
+        api = retrying_api(FakeResponse({"errcode": -3003}), FakeResponse({"ok": 1}))
+
+        assert await api.get("lock/queryOpenState", lockId=1) == {"ok": 1}
+        assert api.stats.retried == 1
+        assert api.stats.dropped == 0
+
+    async def test_server_error_is_retried_for_get(self, retrying_api):
+        api = retrying_api(FakeResponse({}, status=502), FakeResponse({"ok": 1}))
+
+        assert await api.get("lock/detail", lockId=1) == {"ok": 1}
+        assert api.stats.retried == 1
+
+    async def test_server_error_is_not_retried_for_post(self, retrying_api):
+        api = retrying_api(FakeResponse({}, status=502), FakeResponse({"ok": 1}))
+
+        with pytest.raises(ClientResponseError):
+            await api.post("keyboardPwd/add", lockId=1)
+        assert api.stats.retried == 0
+
+    async def test_server_error_is_not_retried_for_commands(self, retrying_api):
+        api = retrying_api(FakeResponse({}, status=502), FakeResponse({"ok": 1}))
+
+        with pytest.raises(ClientResponseError):
+            await api.get("lock/unlock", lockId=1)
+        assert api._web_session.calls == 1
+        assert api.stats.retried == 0
+
+    async def test_server_errcode_is_not_retried_for_post(self, retrying_api):
+        api = retrying_api(FakeResponse({"errcode": 90000}), FakeResponse({"ok": 1}))
+
+        with pytest.raises(RequestFailed):
+            await api.post("keyboardPwd/add", lockId=1)
+        assert api._web_session.calls == 1
+        assert api.stats.retried == 0
+
+    async def test_server_errcode_is_not_retried_for_commands(self, retrying_api):
+        api = retrying_api(FakeResponse({"errcode": 90000}), FakeResponse({"ok": 1}))
+
+        with pytest.raises(RequestFailed):
+            await api.get("lock/unlock", lockId=1)
+        assert api._web_session.calls == 1
+        assert api.stats.retried == 0
+
+    async def test_busy_gateway_is_retried_for_commands(self, retrying_api):
+        api = retrying_api(FakeResponse({"errcode": -3003}), FakeResponse({"ok": 1}))
+
+        assert await api.get("lock/unlock", lockId=1) == {"ok": 1}
+        assert api.stats.retried == 1
+
+    async def test_permanent_errcode_is_not_retried(self, retrying_api):
+        api = retrying_api(FakeResponse({"errcode": -4043}))
+
+        with pytest.raises(RequestFailed) as exc:
+            await api.get("lock/unlock", lockId=1)
+        assert exc.value.errcode == -4043
+        assert api.stats.retried == 0
+
+    async def test_gives_up_after_max_attempts(self, retrying_api):
+        api = retrying_api(
+            *[FakeResponse({"errcode": 90000})] * api_module.MAX_ATTEMPTS
+        )
+
+        with pytest.raises(RequestFailed):
+            await api.get("lock/detail", lockId=1)
+        assert api._web_session.calls == api_module.MAX_ATTEMPTS
+        assert api.stats.retried == api_module.MAX_ATTEMPTS - 1
+        assert api.stats.dropped == 1
+
+    async def test_retry_budget_limits_retries(self, retrying_api):
+        api = retrying_api(FakeResponse({"errcode": 90000}))
+        api._retry_budget = 0
+
+        with pytest.raises(RequestFailed):
+            await api.get("lock/detail", lockId=1)
+        assert api.stats.retried == 0
+        assert api.stats.dropped == 1
+
+
+def _records_page(page_no: int, pages: int, size: int = 2) -> FakeResponse:
+    start = (page_no - 1) * size
+    return FakeResponse(
+        {
+            "list": [
+                {**WEBHOOK_UNLOCK_10AM_UTC, "recordId": id}
+                for id in range(start, start + size)
+            ],
+            "pageNo": page_no,
+            "pageSize": size,
+            "pages": pages,
+            "total": pages * size,
+        }
+    )
+
+
+class SlowSession:
+    """Answers every request after a short delay, counting them."""
+
+    def __init__(self) -> None:
+        self.calls: list[str] = []
+
+    async def get(self, url, params, **kwargs) -> FakeResponse:
+        self.calls.append(url)
+        await asyncio.sleep(0.01)
+        return FakeResponse({"lockId": params.get("lockId"), "state": 1})
+
+
+class TestCoalescing:
+    async def test_identical_reads_share_a_request(self, retrying_api):
+        api = retrying_api()
+        api._web_session = session = SlowSession()
+
+        results = await asyncio.gather(
+            *[api.get("lock/getPassageModeConfig", lockId=1) for _ in range(3)]
+        )
+
+        assert len(session.calls) == 1
+        assert results[0] is results[1] is results[2]
+        assert api.stats.coalesced == 2
+
+    async def test_different_params_are_not_shared(self, retrying_api):
+        api = retrying_api()
+        api._web_session = session = SlowSession()
+
+        await asyncio.gather(
+            api.get("lock/detail", lockId=1), api.get("lock/detail", lockId=2)
+        )
+
+        assert len(session.calls) == 2
+
+    async def test_commands_are_never_shared(self, retrying_api):
+        api = retrying_api()
+        api._web_session = session = SlowSession()
+
+        await asyncio.gather(api.get("lock/unlock", lockId=1), api.unlock(1))
+
+        assert len(session.calls) == 2
+        assert api.stats.coalesced == 0
+
+    async def test_state_reads_waiting_on_the_gateway_are_shared(self, retrying_api):
+        api = retrying_api()
+        api._web_session = session = SlowSession()
+
+        async with api.scheduler.slot(1):
+            reads = asyncio.gather(*[api.get_lock_state(1) for _ in range(3)])
+            await asyncio.sleep(0)
+        await reads
+
+        assert len(session.calls) == 1
+        assert api.stats.coalesced == 2
+
+
+class TestResponseCache:
+    async def test_slow_changing_reads_are_reused(self, retrying_api):
+        api = retrying_api()
+        api._web_session = session = SlowSession()
+
+        first = await api.get("lock/getPassageModeConfig", lockId=1)
+        second = await api.get("lock/getPassageModeConfig", lockId=1)
+
+        assert second is first
+        assert len(session.calls) == 1
+        assert (api.stats.cache_hits, api.stats.cache_misses) == (1, 1)
+
+    async def test_other_reads_are_not_cached(self, retrying_api):
+        api = retrying_api()
+        api._web_session = session = SlowSession()
+
+        await api.get("doorSensor/query", lockId=1)
+        await api.get("doorSensor/query", lockId=1)
+
+        assert len(session.calls) == 2
+        assert api.stats.cache_misses == 0
+
+    async def test_expired_reads_are_fetched_again(self, retrying_api, monkeypatch):
+        monkeypatch.setitem(api_module.CACHE_TTL, "lock/detail", 0)
+        api = retrying_api()
+        api._web_session = session = SlowSession()
+
+        await api.get("lock/detail", lockId=1)
+        await api.get("lock/detail", lockId=1)
+
+        assert len(session.calls) == 2
+
+    async def test_fresh_passcode_listing_skips_the_cache(self, retrying_api):
+        api = retrying_api(*[FakeResponse({"list": [], "pages": 1})] * 3)
+
+        await api.list_passcodes(1)
+        await api.list_passcodes(1)
+        await api.list_passcodes(1, fresh=True)
+
+        assert api._web_session.calls == 2
+
+    async def test_commands_invalidate_their_lock(self, retrying_api):
+        api = retrying_api(FakeResponse({"errcode": 0}))
+        session = api._web_session
+        api._web_session = SlowSession()
+        api._web_session.post = session.post
+
+        await api.get("lock/detail", lockId=1)
+        await api.get("lock/detail", lockId=2)
+        await api.set_auto_lock(1, 30)
+        await api.get("lock/detail", lockId=1)
+        await api.get("lock/detail", lockId=2)
+
+        assert api._web_session.calls.count(api.BASE + "lock/detail") == 3
+
+    async def test_failed_commands_keep_the_cache(self, retrying_api):
+        api = retrying_api(FakeResponse({"errcode": -1}))
+        session = api._web_session
+        api._web_session = SlowSession()
+        api._web_session.post = session.post
+
+        await api.get("lock/listKeyboardPwd", lockId=1)
+        with pytest.raises(RequestFailed):
+            await api.delete_passcode(1, 5)
+        await api.get("lock/listKeyboardPwd", lockId=1)
+
+        assert len(api._web_session.calls) == 1
+
+    async def test_read_in_flight_during_a_command_is_not_cached(self, retrying_api):
+        api = retrying_api(FakeResponse({"errcode": 0}))
+        session = api._web_session
+        api._web_session = SlowSession()
+        api._web_session.post = session.post
+
+        read = asyncio.ensure_future(api.get("lock/getPassageModeConfig", lockId=1))
+        await asyncio.sleep(0)
+        await api.post("lock/configPassageMode", lockId=1)
+        await read
+        await api.get("lock/getPassageModeConfig", lockId=1)
+
+        assert len(api._web_session.calls) == 2
+
+
+class TestLanes:
+    async def test_state_polls_use_the_bulk_lane(self, retrying_api):
+        api = retrying_api(FakeResponse({"state": 1}), FakeResponse({"state": 1}))
+        lanes = []
+        slot = api.scheduler.slot
+
+        def recording_slot(lock_id, lane=LANE_INTERACTIVE):
+            lanes.append(lane)
+            return slot(lock_id, lane)
+
+        api.scheduler.slot = recording_slot
+
+        await api.get_lock_state(1)
+        await api.get_lock_state(1, LANE_INTERACTIVE)
+
+        assert lanes == [LANE_BULK, LANE_INTERACTIVE]
+
+
+class TestMetrics:
+    async def test_requests_are_timed_per_path(self, retrying_api):
+        api = retrying_api(FakeResponse({"ok": 1}), FakeResponse({"errcode": -1}))
+
+        await api.get("lock/queryOpenState", lockId=1)
+        with pytest.raises(RequestFailed):
+            await api.post("keyboardPwd/add", lockId=1)
+
+        assert api.metrics.histogram("api_request_seconds", "lock/queryOpenState")
+        assert api.metrics.counters["api_request_seconds_errors"] == {
+            "keyboardPwd/add": 1
+        }
+
+    async def test_gateway_wait_is_recorded(self, retrying_api):
+        api = retrying_api(FakeResponse({"state": 1}))
+        api.scheduler.update_gateways({1: 100})
+
+        await api.get_lock_state(1)
+
+        assert api.metrics.histogram("gateway_wait_seconds", 100).count == 1
+
+
+class TestRecordPages:
+    async def test_walks_every_page(self, retrying_api):
+        api = retrying_api(*[_records_page(n, pages=3) for n in (1, 2, 3)])
+
+        ids = [
+            record.id
+            async for page in api.iter_lock_record_pages(1, page_size=2)
+            for record in page
+        ]
+
+        assert ids == list(range(6))
+        assert api._web_session.calls == 3
+
+    async def test_next_page_is_prefetched(self, retrying_api):
+        api = retrying_api(*[_records_page(n, pages=2) for n in (1, 2)])
+        pages = api.iter_lock_record_pages(1, page_size=2)
+
+        await pages.__anext__()
+        # One hop for the prefetch task, one for the request it shares
+        for _ in range(2):
+            await asyncio.sleep(0)
+        assert api._web_session.calls == 2
+
+        await pages.aclose()
+
+    async def test_short_page_ends_without_page_count(self, retrying_api):
+        api = retrying_api(FakeResponse({"list": [WEBHOOK_UNLOCK_10AM_UTC]}))
+
+        pages = [page async for page in api.iter_lock_record_pages(1, page_size=2)]
+
+        assert len(pages) == 1
+        assert api._web_session.calls == 1
+
+
+class TestGetAllPages:
+    async def test_pages_are_joined_in_order(self, retrying_api):
+        api = retrying_api()
+        api._web_session = session = PagedSession(items=25, page_size=3)
+
+        items = await api.get_all_pages("lock/list", page_size=3)
+
+        assert [item["id"] for item in items] == list(range(25))
+        assert sorted(session.requested) == list(range(1, 10))
+
+    async def test_concurrent_pages_are_bounded(self, retrying_api):
+        api = retrying_api()
+        api._web_session = session = PagedSession(items=100, page_size=5)
+
+        await api.get_all_pages("lock/list", page_size=5)
+
+        assert 1 < session.peak <= api_module.PAGE_PREFETCH
+
+    async def test_pages_without_count_stop_at_short_page(self, retrying_api):
+        api = retrying_api()
+        api._web_session = session = PagedSession(
+            items=7, page_size=3, with_page_count=False
+        )
+
+        items = await api.get_all_pages("lock/listKeyboardPwd", page_size=3, lockId=1)
+
+        assert len(items) == 7
+        assert session.requested == [1, 2, 3]
+
+
+class TestParseResp:
+    async def test_body_is_decoded_once(self):
+        api = TTLockApi(None, None)
+        resp = FakeResponse({"list": []})
+
+        assert await api._parse_resp(resp, "test") == {"list": []}
+        assert resp.reads == 1
+        assert resp.decodes == 0
+
+    async def test_errcode_raises(self):
+        api = TTLockApi(None, None)
+
+        with pytest.raises(RequestFailed):
+            await api._parse_resp(FakeResponse({"errcode": 1}), "test")
+
+    async def test_http_error_raises(self):
+        api = TTLockApi(None, None)
+
+        with pytest.raises(ClientResponseError):
+            await api._parse_resp(FakeResponse({}, status=500), "test")
+
+    @pytest.mark.parametrize(
+        "payload", [LOCK_LIST, LOCK_RECORDS], ids=["lock/list", "lockRecord/list"]
+    )
+    async def test_benchmark(self, payload, record_property):
+        api = TTLockApi(None, None)
+        rounds = 20
+
+        start = time.process_time()
+        for _ in range(rounds):
+            await _legacy_parse_resp(FakeResponse(payload))
+        legacy = (time.process_time() - start) / rounds
+
+        start = time.process_time()
+        for _ in range(rounds):
+            await api._parse_resp(FakeResponse(payload), "bench")
+        current = (time.process_time() - start) / rounds
+
+        record_property("legacy_cpu_ms", round(legacy * 1000, 3))
+        record_property("current_cpu_ms", round(current * 1000, 3))
+        record_property("saved_cpu_ms", round((legacy - current) * 1000, 3))
+        assert current < legacy
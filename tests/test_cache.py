@@ -0,0 +1,95 @@
+"""Test the request cache helpers."""
+import asyncio
+
+import pytest
+
+from custom_components.ttlock.cache import SingleFlight, TTLCache
+
+
+class TestSingleFlight:
+    async def test_concurrent_calls_share_one_result(self):
+        flights = SingleFlight()
+        calls = 0
+
+        async def call():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return calls
+
+        results = await asyncio.gather(*[flights.run("key", call) for _ in range(5)])
+
+        assert results == [1] * 5
+        assert "key" not in flights
+
+    async def test_later_calls_are_not_shared(self):
+        flights = SingleFlight()
+
+        async def call():
+            return object()
+
+        first = await flights.run("key", call)
+
+        assert await flights.run("key", call) is not first
+
+    async def test_errors_reach_every_caller(self):
+        flights = SingleFlight()
+
+        async def call():
+            await asyncio.sleep(0)
+            raise ValueError
+
+        results = await asyncio.gather(
+            flights.run("key", call), flights.run("key", call), return_exceptions=True
+        )
+
+        assert [type(result) for result in results] == [ValueError, ValueError]
+
+    async def test_cancelled_caller_leaves_call_running(self):
+        flights = SingleFlight()
+        release = asyncio.Event()
+
+        async def call():
+            await release.wait()
+            return "done"
+
+        first = asyncio.ensure_future(flights.run("key", call))
+        second = asyncio.ensure_future(flights.run("key", call))
+        await asyncio.sleep(0)
+        first.cancel()
+        release.set()
+
+        assert await second == "done"
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+
+class TestTTLCache:
+    def test_value_is_kept_until_it_expires(self, freezer):
+        cache = TTLCache()
+        cache.set("group", "key", "value", ttl=60, generation=0)
+
+        assert cache.get("group", "key") == "value"
+        freezer.tick(61)
+        assert cache.get("group", "key") is None
+
+    def test_invalidate_drops_the_whole_group(self):
+        cache = TTLCache()
+        cache.set("group", 1, "a", ttl=60, generation=0)
+        cache.set("group", 2, "b", ttl=60, generation=0)
+        cache.set("other", 1, "c", ttl=60, generation=0)
+
+        cache.invalidate("group")
+
+        assert cache.get("group", 1) is None
+        assert cache.get("group", 2) is None
+        assert cache.get("other", 1) == "c"
+
+    def test_value_fetched_before_invalidation_is_not_stored(self):
+        cache = TTLCache()
+        generation = cache.generation("group")
+
+        cache.invalidate("group")
+        cache.set("group", "key", "stale", ttl=60, generation=generation)
+
+        assert cache.get("group", "key") is None
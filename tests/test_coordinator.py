@@ -2,13 +2,39 @@
 
 
 import asyncio
-from datetime import timedelta
+from copy import deepcopy
+from dataclasses import FrozenInstanceError, replace
+from datetime import datetime, timedelta
+import time
+import timeit
+import tracemalloc
+from unittest.mock import patch
 
 import dateparser
 import pytest
-
-from custom_components.ttlock.coordinator import LockState, LockUpdateCoordinator
-from custom_components.ttlock.models import PassageModeConfig, WebhookEvent
+from pytest_homeassistant_custom_component.common import async_fire_time_changed
+
+from custom_components.ttlock import models
+from custom_components.ttlock.api import RequestFailed
+from custom_components.ttlock.coordinator import (
+    LOCK_UPDATE_INTERVAL,
+    PUSH_HEALTHY_UPDATE_INTERVAL,
+    UNKNOWN_STATE_UPDATE_INTERVAL,
+    UPDATE_INTERVAL_SPREAD,
+    WEBHOOK_DEDUP_WINDOW,
+    AccountUpdateCoordinator,
+    EntityIndex,
+    LockState,
+    LockUpdateCoordinator,
+    SensorData,
+    coordinator_for,
+)
+from custom_components.ttlock.models import (
+    Features,
+    PassageModeConfig,
+    State,
+    WebhookEvent,
+)
 from homeassistant.util import dt
 
 from .const import (
@@ -46,8 +72,11 @@ class TestLockState:
             ],
         )
         def test_is_true_during_set_passage_mode_times(self, lock_state, time):
-            lock_state.passage_mode_config = PassageModeConfig.parse_obj(
-                PASSAGE_MODE_6_TO_6_7_DAYS
+            lock_state = replace(
+                lock_state,
+                passage_mode_config=PassageModeConfig.parse_obj(
+                    PASSAGE_MODE_6_TO_6_7_DAYS
+                ),
             )
             assert lock_state.passage_mode_active(ts(time)) is True
 
@@ -61,8 +90,11 @@ class TestLockState:
             ],
         )
         def test_is_false_outside_set_passage_mode_times(self, lock_state, time):
-            lock_state.passage_mode_config = PassageModeConfig.parse_obj(
-                PASSAGE_MODE_6_TO_6_7_DAYS
+            lock_state = replace(
+                lock_state,
+                passage_mode_config=PassageModeConfig.parse_obj(
+                    PASSAGE_MODE_6_TO_6_7_DAYS
+                ),
             )
             assert lock_state.passage_mode_active(ts(time)) is False
 
@@ -86,8 +118,11 @@ class TestLockState:
             ],
         )
         def test_is_auto_lock_outside_set_passage_mode_times(self, lock_state, time):
-            lock_state.passage_mode_config = PassageModeConfig.parse_obj(
-                PASSAGE_MODE_6_TO_6_7_DAYS
+            lock_state = replace(
+                lock_state,
+                passage_mode_config=PassageModeConfig.parse_obj(
+                    PASSAGE_MODE_6_TO_6_7_DAYS
+                ),
             )
             assert lock_state.auto_lock_delay(ts(time)) == lock_state.auto_lock_seconds
 
@@ -100,8 +135,11 @@ class TestLockState:
             ],
         )
         def test_is_none_during_set_passage_mode_times(self, lock_state, time):
-            lock_state.passage_mode_config = PassageModeConfig.parse_obj(
-                PASSAGE_MODE_6_TO_6_7_DAYS
+            lock_state = replace(
+                lock_state,
+                passage_mode_config=PassageModeConfig.parse_obj(
+                    PASSAGE_MODE_6_TO_6_7_DAYS
+                ),
             )
             assert lock_state.auto_lock_delay(ts(time)) is None
 
@@ -114,11 +152,125 @@ class TestLockState:
             ],
         )
         def test_is_none_when_passage_mode_is_all_day(self, lock_state, time):
-            lock_state.passage_mode_config = PassageModeConfig.parse_obj(
-                PASSAGE_MODE_ALL_DAY_WEEKDAYS
+            lock_state = replace(
+                lock_state,
+                passage_mode_config=PassageModeConfig.parse_obj(
+                    PASSAGE_MODE_ALL_DAY_WEEKDAYS
+                ),
             )
             assert lock_state.auto_lock_delay(ts(time)) is None
 
+    class TestNextPassageModeChange:
+        # 2024-01-03 is a Wednesday
+        @pytest.mark.parametrize(
+            ("now", "expected"),
+            [
+                (datetime(2024, 1, 3, 10, 0), datetime(2024, 1, 3, 18, 0)),
+                (datetime(2024, 1, 3, 5, 59), datetime(2024, 1, 3, 6, 0)),
+                (datetime(2024, 1, 3, 18, 0), datetime(2024, 1, 4, 6, 0)),
+            ],
+        )
+        def test_daily_schedule(self, lock_state, now, expected):
+            lock_state = replace(
+                lock_state,
+                passage_mode_config=PassageModeConfig.parse_obj(
+                    PASSAGE_MODE_6_TO_6_7_DAYS
+                ),
+            )
+            assert lock_state.next_passage_mode_change(now) == expected
+
+        @pytest.mark.parametrize(
+            ("now", "expected"),
+            [
+                (datetime(2024, 1, 5, 15, 0), datetime(2024, 1, 6, 0, 0)),
+                (datetime(2024, 1, 6, 12, 0), datetime(2024, 1, 8, 0, 0)),
+            ],
+        )
+        def test_all_day_on_weekdays(self, lock_state, now, expected):
+            lock_state = replace(
+                lock_state,
+                passage_mode_config=PassageModeConfig.parse_obj(
+                    PASSAGE_MODE_ALL_DAY_WEEKDAYS
+                ),
+            )
+            assert lock_state.next_passage_mode_change(now) == expected
+
+        def test_none_without_passage_mode(self, lock_state):
+            assert lock_state.next_passage_mode_change() is None
+
+        def test_none_when_always_on(self, lock_state):
+            lock_state = replace(
+                lock_state,
+                passage_mode_config=PassageModeConfig.parse_obj(
+                    {**PASSAGE_MODE_ALL_DAY_WEEKDAYS, "weekDays": list(range(1, 8))}
+                ),
+            )
+            assert lock_state.next_passage_mode_change() is None
+
+
+class FakeEntity:
+    def __init__(self, entity_id: str, unique_id: str) -> None:
+        self.entity_id = entity_id
+        self.unique_id = unique_id
+
+
+class TestEntityIndex:
+    def test_lookup_by_entity_and_unique_id(self):
+        index = EntityIndex()
+        coordinator = object()
+        entity = FakeEntity("lock.front_door", "ttlock-1-lock")
+
+        index.add(entity, coordinator)
+
+        assert index.get("lock.front_door") is coordinator
+        assert index.get_by_unique_id("ttlock-1-lock") is coordinator
+
+        index.remove(entity)
+
+        assert index.get("lock.front_door") is None
+        assert index.get_by_unique_id("ttlock-1-lock") is None
+        assert len(index) == 0
+
+    async def test_entities_are_indexed_while_loaded(
+        self, hass, component_setup, mock_api_responses
+    ):
+        mock_api_responses("default")
+        coordinator = await component_setup()
+        entity_ids = [entity.entity_id for entity in coordinator.entities]
+
+        assert len(entity_ids) == 7
+        assert all(coordinator_for(hass, id) is coordinator for id in entity_ids)
+
+        entry = hass.config_entries.async_entries()[-1]
+        assert await hass.config_entries.async_unload(entry.entry_id)
+
+        assert coordinator.entities == []
+        assert all(coordinator_for(hass, id) is None for id in entity_ids)
+
+    def test_benchmark_lookup_cost_is_flat(self, record_property):
+        def per_lookup(locks: int) -> float:
+            index = EntityIndex()
+            for lock in range(locks):
+                coordinator = object()
+                for n in range(8):
+                    index.add(FakeEntity(f"e.{lock}_{n}", f"u-{lock}-{n}"), coordinator)
+            targets = [f"e.{lock}_0" for lock in range(0, locks, max(1, locks // 100))]
+
+            def lookup():
+                for entity_id in targets:
+                    index.get(entity_id)
+
+            return min(timeit.repeat(lookup, number=200, repeat=5)) / (
+                200 * len(targets)
+            )
+
+        costs = {locks: per_lookup(locks) for locks in (10, 100, 1000)}
+        for locks, cost in costs.items():
+            record_property(f"lookup_ns_{locks}_locks", round(cost * 1e9, 1))
+
+        # a linear scan would be ~100x slower at 1000 locks than at 10
+        assert costs[1000] < costs[10] * 10
+
 
 class TestLockUpdateCoordinator:
     class TestAsyncRefresh:
@@ -136,6 +288,18 @@ class TestLockUpdateCoordinator:
             assert coordinator.data.last_reason is None
             assert coordinator.data.features is not None
 
+        async def test_refresh_duration_is_recorded(
+            self, coordinator: LockUpdateCoordinator, mock_api_responses
+        ):
+            mock_api_responses("default")
+            await coordinator.async_refresh()
+
+            histogram = coordinator.api.metrics.histogram(
+                "refresh_seconds", coordinator.lock_id
+            )
+            assert histogram.count == 1
+            assert histogram.last is not None
+
         async def test_coordinator_loads_sensor_data(
             self, coordinator: LockUpdateCoordinator, mock_api_responses
         ):
@@ -178,11 +342,11 @@ class TestLockUpdateCoordinator:
         ):
             mock_api_responses("default")
             await coordinator.async_refresh()
-            coordinator.data.locked = False
+            coordinator.async_update_state(locked=False)
 
             event = WebhookEvent.parse_obj(WEBHOOK_LOCK_10AM_UTC)
 
-            coordinator._process_webhook_data(event)
+            coordinator._process_webhook_events([event])
 
             assert coordinator.data.locked is True
             assert coordinator.data.last_user == "test"
@@ -193,11 +357,10 @@ class TestLockUpdateCoordinator:
         ):
             mock_api_responses("default")
             await coordinator.async_refresh()
-            coordinator.data.locked = True
-            coordinator.data.auto_lock_seconds = -1
+            coordinator.async_update_state(locked=True, auto_lock_seconds=-1)
             event = WebhookEvent.parse_obj(WEBHOOK_UNLOCK_10AM_UTC)
 
-            coordinator._process_webhook_data(event)
+            coordinator._process_webhook_events([event])
 
             assert coordinator.data.locked is False
             assert coordinator.data.last_user == "test"
@@ -208,17 +371,19 @@ class TestLockUpdateCoordinator:
         ):
             mock_api_responses("default")
             await coordinator.async_refresh()
-            coordinator.data.locked = True
-            coordinator.data.auto_lock_seconds = 1
-            coordinator.data.passage_mode_config = PassageModeConfig.parse_obj(
-                PASSAGE_MODE_6_TO_6_7_DAYS
+            coordinator.async_update_state(
+                locked=True,
+                auto_lock_seconds=1,
+                passage_mode_config=PassageModeConfig.parse_obj(
+                    PASSAGE_MODE_6_TO_6_7_DAYS
+                ),
             )
 
             event = WebhookEvent.parse_obj(WEBHOOK_UNLOCK_10AM_UTC)
 
             assert coordinator.data.auto_lock_delay(event.lock_ts) == 1
 
-            coordinator._process_webhook_data(event)
+            coordinator._process_webhook_events([event])
 
             assert coordinator.data.locked is False
             assert coordinator.data.last_user == "test"
@@ -236,12 +401,11 @@ class TestLockUpdateCoordinator:
             mock_api_responses("with_sensor")
             await coordinator.async_refresh()
 
-            coordinator.data.locked = True
-            coordinator.data.auto_lock_seconds = -1
+            coordinator.async_update_state(locked=True, auto_lock_seconds=-1)
             coordinator.data.sensor.opened is False
 
             event = WebhookEvent.parse_obj(WEBHOOK_SENSOR_OPEN)
-            coordinator._process_webhook_data(event)
+            coordinator._process_webhook_events([event])
 
             assert coordinator.data.locked is True
             assert coordinator.data.sensor.opened is True
@@ -252,13 +416,492 @@ class TestLockUpdateCoordinator:
             mock_api_responses("with_sensor")
             await coordinator.async_refresh()
 
-            coordinator.data.locked = False
-            coordinator.data.auto_lock_seconds = -1
+            coordinator.async_update_state(locked=False, auto_lock_seconds=-1)
             coordinator.data.sensor.opened is True
 
             event = WebhookEvent.parse_obj(WEBHOOK_SENSOR_CLOSE)
-            coordinator._process_webhook_data(event)
+            coordinator._process_webhook_events([event])
 
             assert coordinator.data.locked is True
             assert coordinator.data.sensor.opened is False
             assert coordinator.data.last_reason == "Door Closed"
+
+    class TestWebhookOrdering:
+        def _event(self, record: dict, seconds: int = 0) -> WebhookEvent:
+            ts = WEBHOOK_UNLOCK_10AM_UTC["lockDate"] + seconds * 1000
+            return WebhookEvent.parse_obj({**record, "lockDate": ts, "serverDate": ts})
+
+        @pytest.fixture
+        async def updates(self, coordinator, mock_api_responses):
+            mock_api_responses("default")
+            await coordinator.async_refresh()
+            coordinator.async_update_state(locked=True, auto_lock_seconds=-1)
+            updates = []
+            coordinator.async_add_listener(lambda: updates.append(1))
+            yield updates
+            await coordinator.async_shutdown()
+
+        async def test_repeated_event_is_applied_once(
+            self, coordinator: LockUpdateCoordinator, updates
+        ):
+            coordinator._process_webhook_events(
+                [self._event(WEBHOOK_UNLOCK_10AM_UTC)] * 2
+            )
+            coordinator._process_webhook_events([self._event(WEBHOOK_UNLOCK_10AM_UTC)])
+
+            assert coordinator.data.locked is False
+            assert updates == [1]
+
+        async def test_older_event_does_not_undo_a_newer_one(
+            self, coordinator: LockUpdateCoordinator, updates
+        ):
+            coordinator._process_webhook_events(
+                [self._event(WEBHOOK_LOCK_10AM_UTC, seconds=10)]
+            )
+            coordinator._process_webhook_events([self._event(WEBHOOK_UNLOCK_10AM_UTC)])
+
+            assert coordinator.data.locked is True
+            assert coordinator.data.last_reason == "lock by lock key"
+            assert updates == [1]
+
+        async def test_events_at_the_same_time_are_all_applied(
+            self, coordinator: LockUpdateCoordinator, updates
+        ):
+            coordinator._process_webhook_events([self._event(WEBHOOK_UNLOCK_10AM_UTC)])
+            coordinator._process_webhook_events([self._event(WEBHOOK_LOCK_10AM_UTC)])
+
+            assert coordinator.data.locked is True
+            assert updates == [1, 1]
+
+        async def test_window_is_bounded(
+            self, coordinator: LockUpdateCoordinator, updates
+        ):
+            coordinator._process_webhook_events(
+                [
+                    self._event(WEBHOOK_UNLOCK_10AM_UTC, seconds=n)
+                    for n in range(WEBHOOK_DEDUP_WINDOW * 2)
+                ]
+            )
+
+            assert len(coordinator._recent_events) == WEBHOOK_DEDUP_WINDOW
+
+    class TestOptimisticActions:
+        @pytest.fixture
+        async def optimistic(self, coordinator, mock_api_responses, monkeypatch):
+            mock_api_responses("default")
+            await coordinator.async_refresh()
+            coordinator.async_update_state(locked=False, auto_lock_seconds=-1)
+            coordinator.optimistic = True
+            monkeypatch.setattr(
+                "custom_components.ttlock.coordinator.OPTIMISTIC_CONFIRM_TIMEOUT",
+                timedelta(seconds=0.01),
+            )
+            yield coordinator
+            await coordinator.async_shutdown()
+
+        async def _settle(self, coordinator):
+            if task := coordinator._optimistic_task:
+                await task
+
+        async def test_state_changes_before_the_cloud_answers(self, optimistic):
+            sent = asyncio.Event()
+
+            async def lock(api, lock_id):
+                await sent.wait()
+                return True
+
+            with patch("custom_components.ttlock.api.TTLockApi.lock", lock):
+                await optimistic.lock()
+                assert optimistic.data.locked is True
+                assert optimistic.data.action_pending is False
+
+                optimistic._process_webhook_events(
+                    [WebhookEvent.parse_obj(WEBHOOK_LOCK_10AM_UTC)]
+                )
+                sent.set()
+                await self._settle(optimistic)
+
+            assert optimistic.data.locked is True
+            assert optimistic.data.last_reason == "lock by lock key"
+
+        async def test_webhook_confirms_without_a_query(self, optimistic):
+            with patch(
+                "custom_components.ttlock.api.TTLockApi.lock", return_value=True
+            ), patch(
+                "custom_components.ttlock.api.TTLockApi.get_lock_state"
+            ) as get_lock_state:
+                await optimistic.lock()
+                optimistic._process_webhook_events(
+                    [WebhookEvent.parse_obj(WEBHOOK_LOCK_10AM_UTC)]
+                )
+                await self._settle(optimistic)
+
+            assert not get_lock_state.called
+            assert optimistic.data.locked is True
+
+        async def test_failed_command_rolls_back(self, optimistic):
+            with patch(
+                "custom_components.ttlock.api.TTLockApi.lock",
+                side_effect=RequestFailed("busy"),
+            ):
+                await optimistic.lock()
+                await self._settle(optimistic)
+
+            assert optimistic.data.locked is False
+            assert optimistic.data.last_reason == "Lock failed"
+
+        async def test_state_is_queried_without_a_webhook(self, optimistic):
+            # The mocked lock reports it is unlocked
+            with patch(
+                "custom_components.ttlock.api.TTLockApi.lock", return_value=True
+            ):
+                await optimistic.lock()
+                await self._settle(optimistic)
+
+            assert optimistic.data.locked is False
+            assert optimistic.data.last_reason == "Lock not confirmed"
+
+        async def test_queried_state_can_confirm(self, optimistic):
+            with patch(
+                "custom_components.ttlock.api.TTLockApi.unlock", return_value=True
+            ):
+                optimistic.async_update_state(locked=True)
+                await optimistic.unlock()
+                await self._settle(optimistic)
+
+            assert optimistic.data.locked is False
+            assert optimistic.data.last_reason is None
+
+        async def test_newer_action_supersedes(self, optimistic):
+            with patch(
+                "custom_components.ttlock.api.TTLockApi.lock", return_value=True
+            ), patch(
+                "custom_components.ttlock.api.TTLockApi.unlock", return_value=False
+            ), patch(
+                "custom_components.ttlock.api.TTLockApi.get_lock_state"
+            ) as get_lock_state:
+                await optimistic.lock()
+                first = optimistic._optimistic_task
+                await optimistic.unlock()
+                await self._settle(optimistic)
+                await asyncio.gather(first, return_exceptions=True)
+
+            # The lock was never waited on, only the unlock was rolled back
+            assert not get_lock_state.called
+            assert optimistic._optimistic_task is None
+            # Back to the lock the lock took, not what was known before either
+            assert optimistic.data.locked is True
+            assert optimistic.data.last_reason == "Unlock failed"
+
+        async def test_superseded_command_in_flight_is_queried(self, optimistic):
+            async def lock(api, lock_id):
+                await asyncio.Event().wait()
+
+            with patch("custom_components.ttlock.api.TTLockApi.lock", lock), patch(
+                "custom_components.ttlock.api.TTLockApi.unlock", return_value=False
+            ), patch(
+                "custom_components.ttlock.api.TTLockApi.get_lock_state",
+                return_value=models.LockState(state=State.locked.value),
+            ):
+                await optimistic.lock()
+                await optimistic.unlock()
+                await self._settle(optimistic)
+
+            # Whether the lock got through isn't known, the lock says it did
+            assert optimistic.data.locked is True
+            assert optimistic.data.last_reason == "Unlock failed"
+
+    class TestAutoLockTimer:
+        @pytest.fixture
+        async def unlocked(self, hass, coordinator, mock_api_responses):
+            mock_api_responses("default")
+            await coordinator.async_refresh()
+            coordinator.async_update_state(
+                locked=True, auto_lock_seconds=5, passage_mode_config=None
+            )
+            auto_locks = []
+            coordinator.async_add_listener(
+                lambda: auto_locks.append(1)
+                if coordinator.data.last_reason == "Auto Lock"
+                else None
+            )
+            yield auto_locks
+            await coordinator.async_shutdown()
+
+        async def test_repeated_unlocks_lock_once(
+            self, hass, coordinator: LockUpdateCoordinator, unlocked
+        ):
+            for _ in range(3):
+                coordinator._process_webhook_events(
+                    [WebhookEvent.parse_obj(WEBHOOK_UNLOCK_10AM_UTC)]
+                )
+
+            async_fire_time_changed(hass, dt.utcnow() + timedelta(seconds=10))
+            await hass.async_block_till_done()
+
+            assert coordinator.data.locked is True
+            assert unlocked == [1]
+
+        async def test_lock_event_cancels_auto_lock(
+            self, hass, coordinator: LockUpdateCoordinator, unlocked
+        ):
+            coordinator._process_webhook_events(
+                [WebhookEvent.parse_obj(WEBHOOK_UNLOCK_10AM_UTC)]
+            )
+            coordinator._process_webhook_events(
+                [WebhookEvent.parse_obj(WEBHOOK_LOCK_10AM_UTC)]
+            )
+
+            async_fire_time_changed(hass, dt.utcnow() + timedelta(seconds=10))
+            await hass.async_block_till_done()
+
+            assert unlocked == []
+            assert coordinator.data.last_reason == "lock by lock key"
+
+        async def test_shutdown_cancels_auto_lock(
+            self, hass, coordinator: LockUpdateCoordinator, unlocked
+        ):
+            coordinator._process_webhook_events(
+                [WebhookEvent.parse_obj(WEBHOOK_UNLOCK_10AM_UTC)]
+            )
+
+            await coordinator.async_shutdown()
+            async_fire_time_changed(hass, dt.utcnow() + timedelta(seconds=10))
+            await hass.async_block_till_done()
+
+            assert unlocked == []
+            assert coordinator.data.locked is False
+
+    class TestAdaptiveInterval:
+        def _scaled(self, coordinator, interval):
+            return interval * coordinator._interval_scale
+
+        async def test_unknown_state_polls_often(
+            self, coordinator: LockUpdateCoordinator, mock_api_responses
+        ):
+            mock_api_responses("default")
+            with patch(
+                "custom_components.ttlock.api.TTLockApi.get_lock_state",
+                side_effect=RequestFailed("offline"),
+            ):
+                await coordinator.async_refresh()
+
+            assert coordinator.data.locked is None
+            assert coordinator.update_interval == self._scaled(
+                coordinator, UNKNOWN_STATE_UPDATE_INTERVAL
+            )
+
+        async def test_new_lock_polls_often(self, coordinator: LockUpdateCoordinator):
+            assert coordinator.update_interval == self._scaled(
+                coordinator, UNKNOWN_STATE_UPDATE_INTERVAL
+            )
+
+        async def test_restored_state_sets_the_interval(
+            self, coordinator: LockUpdateCoordinator
+        ):
+            coordinator.async_restore(
+                LockState(name="Front Door", mac="00:00:00:00:00:01", locked=True)
+            )
+
+            assert coordinator.data.locked is True
+            assert coordinator.update_interval == self._scaled(
+                coordinator, LOCK_UPDATE_INTERVAL
+            )
+
+        async def test_failed_refresh_polls_often(
+            self, coordinator: LockUpdateCoordinator
+        ):
+            with patch(
+                "custom_components.ttlock.api.TTLockApi.get_lock",
+                side_effect=RequestFailed("offline"),
+            ):
+                await coordinator.async_refresh()
+
+            assert coordinator.update_interval == self._scaled(
+                coordinator, UNKNOWN_STATE_UPDATE_INTERVAL
+            )
+
+        async def test_without_push_polls_normally(
+            self, coordinator: LockUpdateCoordinator, mock_api_responses
+        ):
+            mock_api_responses("default")
+            await coordinator.async_refresh()
+
+            assert coordinator.update_interval == self._scaled(
+                coordinator, LOCK_UPDATE_INTERVAL
+            )
+
+        async def test_healthy_push_polls_rarely(self, hass, api, mock_api_responses):
+            mock_api_responses("default")
+            account = AccountUpdateCoordinator(hass, api)
+            coordinator = LockUpdateCoordinator(hass, api, 7252408, account)
+            await coordinator.async_refresh()
+
+            account.async_push_received()
+            coordinator._process_webhook_events(
+                [WebhookEvent.parse_obj(WEBHOOK_LOCK_10AM_UTC)]
+            )
+
+            assert coordinator.update_interval == self._scaled(
+                coordinator, PUSH_HEALTHY_UPDATE_INTERVAL
+            )
+            await coordinator.async_shutdown()
+
+        async def test_stale_push_is_not_healthy(self, hass, api, freezer):
+            account = AccountUpdateCoordinator(hass, api)
+            account.async_push_received()
+            assert account.push_healthy
+
+            freezer.tick(timedelta(days=1))
+
+            assert not account.push_healthy
+
+        async def test_locks_are_spread_out(self, hass, api):
+            scales = {
+                LockUpdateCoordinator(hass, api, lock_id)._interval_scale
+                for lock_id in range(100)
+            }
+
+            assert len(scales) == 100
+            assert all(abs(scale - 1) <= UPDATE_INTERVAL_SPREAD / 2 for scale in scales)
+            assert (
+                LockUpdateCoordinator(hass, api, 42)._interval_scale
+                == LockUpdateCoordinator(hass, api, 42)._interval_scale
+            )
+
+    class TestPassageModeTimer:
+        async def test_listeners_are_woken_at_the_boundary(
+            self, hass, coordinator: LockUpdateCoordinator, mock_api_responses, freezer
+        ):
+            freezer.move_to(dt.now().replace(hour=5, minute=59, second=30))
+            mock_api_responses("default")
+            await coordinator.async_refresh()
+            seen = []
+            unsubscribe = coordinator.async_add_listener(
+                lambda: seen.append(coordinator.data.passage_mode_active())
+            )
+            assert coordinator.data.passage_mode_active() is False
+
+            freezer.tick(timedelta(seconds=30))
+            async_fire_time_changed(hass)
+            await hass.async_block_till_done()
+
+            assert seen == [True]
+            unsubscribe()
+            await coordinator.async_shutdown()
+
+        async def test_no_timer_without_listeners(
+            self, coordinator: LockUpdateCoordinator, mock_api_responses
+        ):
+            mock_api_responses("default")
+            await coordinator.async_refresh()
+
+            assert coordinator._passage_mode_cancel is None
+
+    class TestProcessAccountData:
+        async def test_account_refresh_updates_shared_fields(
+            self, component_setup, mock_api_responses
+        ):
+            mock_api_responses("default")
+            coordinator = await component_setup()
+            summary = coordinator.account.data[coordinator.lock_id]
+
+            with patch("custom_components.ttlock.api.TTLockApi.get_lock") as get_lock:
+                coordinator.account.async_set_updated_data(
+                    {
+                        coordinator.lock_id: summary.copy(
+                            update={"name": "Back Door", "battery_level": 12}
+                        )
+                    }
+                )
+
+            assert not get_lock.called
+            assert coordinator.data.name == "Back Door"
+            assert coordinator.data.battery_level == 12
+
+        async def test_lock_refresh_keeps_shared_fields(
+            self, component_setup, mock_api_responses
+        ):
+            mock_api_responses("default")
+            coordinator = await component_setup()
+            coordinator.async_update_state(name="Back Door", battery_level=12)
+
+            await coordinator.async_refresh()
+
+            assert coordinator.data.name == "Back Door"
+            assert coordinator.data.battery_level == 12
+
+        async def test_unknown_lock_is_ignored(
+            self, component_setup, mock_api_responses
+        ):
+            mock_api_responses("default")
+            coordinator = await component_setup()
+            name = coordinator.data.name
+
+            coordinator.account.async_set_updated_data({})
+
+            assert coordinator.data.name == name
+
+    class TestStateUpdates:
+        def test_state_is_immutable(self, lock_state):
+            with pytest.raises(FrozenInstanceError):
+                lock_state.locked = True
+
+        async def test_update_shares_unchanged_fields(
+            self, coordinator: LockUpdateCoordinator, mock_api_responses
+        ):
+            mock_api_responses("with_sensor")
+            await coordinator.async_refresh()
+            before = coordinator.data
+
+            coordinator._process_webhook_events(
+                [WebhookEvent.parse_obj(WEBHOOK_LOCK_10AM_UTC)]
+            )
+
+            assert coordinator.data is not before
+            assert coordinator.data.sensor is before.sensor
+            assert coordinator.data.passage_mode_config is before.passage_mode_config
+
+        def test_benchmark_event_allocations(self, record_property):
+            state = LockState(
+                name="Front Door",
+                mac=BASIC_LOCK_DETAILS["lockMac"],
+                features=Features.from_feature_value(
+                    BASIC_LOCK_DETAILS["featureValue"]
+                ),
+                sensor=SensorData(opened=False, battery=90, last_fetched=dt.now()),
+                passage_mode_config=PassageModeConfig.parse_obj(
+                    PASSAGE_MODE_6_TO_6_7_DAYS
+                ),
+            )
+            changes = {
+                "battery_level": 80,
+                "locked": True,
+                "last_user": "test",
+                "last_reason": "lock by lock key",
+            }
+            events = 5000
+
+            def measure(apply) -> tuple[float, float]:
+                # Keep every state alive so what each event allocated is visible
+                states = []
+                tracemalloc.start()
+                start = time.perf_counter()
+                for _ in range(events):
+                    states.append(apply(state))
+                elapsed = time.perf_counter() - start
+                allocated, _ = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                return allocated / events, elapsed / events
+
+            # What every event used to do: deepcopy then change a few fields
+            legacy_bytes, legacy_s = measure(
+                lambda state: replace(deepcopy(state), **changes)
+            )
+            current_bytes, current_s = measure(lambda state: replace(state, **changes))
+
+            record_property("legacy_bytes_per_event", round(legacy_bytes))
+            record_property("current_bytes_per_event", round(current_bytes))
+            record_property("legacy_us_per_event", round(legacy_s * 1e6, 2))
+            record_property("current_us_per_event", round(current_s * 1e6, 2))
+            assert current_bytes < legacy_bytes / 2
@@ -0,0 +1,62 @@
+"""Test the webhook queue."""
+from custom_components.ttlock.const import SIGNAL_NEW_DATA
+from custom_components.ttlock.ingest import WebhookQueue
+from custom_components.ttlock.models import WebhookEvent
+from homeassistant.core import callback
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
+
+from .const import WEBHOOK_LOCK_10AM_UTC, WEBHOOK_UNLOCK_10AM_UTC
+
+
+def _event(lock_id: int, record: dict = WEBHOOK_UNLOCK_10AM_UTC) -> WebhookEvent:
+    return WebhookEvent.parse_obj({**record, "lockId": lock_id})
+
+
+def _listen(hass, lock_id: int) -> list[list[WebhookEvent]]:
+    batches: list[list[WebhookEvent]] = []
+    async_dispatcher_connect(
+        hass,
+        SIGNAL_NEW_DATA.format(lock_id=lock_id),
+        callback(lambda events: batches.append(events)),
+    )
+    return batches
+
+
+class TestWebhookQueue:
+    async def test_events_are_grouped_per_lock_in_order(self, hass):
+        queue = WebhookQueue(hass)
+        first, second = _listen(hass, 1), _listen(hass, 2)
+        unlock, lock = _event(1), _event(1, WEBHOOK_LOCK_10AM_UTC)
+
+        queue.async_put([unlock, _event(2)])
+        queue.async_put([lock])
+        queue.async_process()
+        await hass.async_block_till_done()
+
+        assert first == [[unlock, lock]]
+        assert len(second) == 1
+        assert queue.stats.batches == 1
+        assert queue.stats.lock_updates == 2
+
+    async def test_request_that_does_not_fit_is_dropped_whole(self, hass):
+        queue = WebhookQueue(hass, maxsize=3)
+
+        assert queue.async_put([_event(1), _event(1)])
+        assert not queue.async_put([_event(1), _event(1)])
+
+        assert queue.depth == 2
+        assert queue.stats.received == 2
+        assert queue.stats.dropped == 2
+        assert queue.stats.overflows == 1
+
+    async def test_consumer_drains_the_queue(self, hass):
+        queue = WebhookQueue(hass)
+        batches = _listen(hass, 1)
+        task = hass.async_create_background_task(queue.run(), "test queue")
+
+        queue.async_put([_event(1)])
+        await hass.async_block_till_done()
+
+        assert len(batches) == 1
+        assert queue.depth == 0
+        task.cancel()
@@ -1,10 +1,44 @@
 """Test ttlock setup process."""
 
+from datetime import timedelta
+from http import HTTPStatus
+import json
+import time
 from unittest.mock import patch
 
-from custom_components.ttlock.const import DOMAIN
+from aiohttp import ClientError
+from multidict import MultiDict
+import pytest
+from pytest_homeassistant_custom_component.common import (
+    MockConfigEntry,
+    async_fire_time_changed,
+)
+
+from custom_components.ttlock import WebhookHandler
+from custom_components.ttlock.api import TTLockApi
+from custom_components.ttlock.const import (
+    CONF_OPTIMISTIC,
+    CONF_WEBHOOK_STATUS,
+    DOMAIN,
+    TT_LOCKS,
+    TT_WEBHOOK_QUEUE,
+)
+from custom_components.ttlock.coordinator import (
+    STARTUP_WINDOW_MAX,
+    LockUpdateCoordinator,
+    lock_phase,
+    startup_window,
+)
+from custom_components.ttlock.ingest import WebhookQueue
+from custom_components.ttlock.metrics import Metrics
+from custom_components.ttlock.models import WebhookEvent
 from homeassistant.config_entries import ConfigEntryState
+from homeassistant.core import callback
+from homeassistant.helpers import device_registry as dr
 from homeassistant.helpers.network import NoURLAvailableError
+from homeassistant.util import dt
+
+from .const import BASIC_LOCK_DETAILS, WEBHOOK_UNLOCK_10AM_UTC
 
 
 async def test_setup_unload_and_reload_entry(hass, component_setup, mock_api_responses):
@@ -30,3 +64,191 @@ async def test_no_url(hass, component_setup, mock_api_responses):
     with patch("homeassistant.helpers.issue_registry.async_create_issue") as mock:
         assert await component_setup()
         assert mock.assert_called
+
+
+async def test_setup_is_retried_when_metadata_fails(
+    hass, component_setup, config_entry, mock_api_responses
+):
+    mock_api_responses("default")
+
+    with patch(
+        "custom_components.ttlock.coordinator.LockUpdateCoordinator.async_load_metadata",
+        side_effect=ClientError("offline"),
+    ), pytest.raises(KeyError):
+        # No locks are stored when setup doesn't finish
+        await component_setup()
+
+    assert config_entry.state is ConfigEntryState.SETUP_RETRY
+
+
+async def test_only_options_changes_reload(
+    hass, component_setup, config_entry, mock_api_responses
+):
+    mock_api_responses("default")
+    await component_setup()
+
+    with patch.object(
+        hass.config_entries,
+        "async_reload",
+        wraps=hass.config_entries.async_reload,
+    ) as reload:
+        hass.config_entries.async_update_entry(
+            config_entry,
+            data={
+                **config_entry.data,
+                "token": {**config_entry.data["token"], "access_token": "new"},
+            },
+        )
+        await hass.async_block_till_done()
+        assert not reload.called
+
+        hass.config_entries.async_update_entry(
+            config_entry, options={**config_entry.options, CONF_OPTIMISTIC: True}
+        )
+        await hass.async_block_till_done()
+        assert reload.call_args.args == (config_entry.entry_id,)
+
+    assert config_entry.state is ConfigEntryState.LOADED
+
+
+async def test_setup_only_waits_for_metadata(hass, component_setup, mock_api_responses):
+    """Test lock state is refreshed after setup rather than during it."""
+    mock_api_responses("default")
+
+    with patch(
+        "custom_components.ttlock.api.TTLockApi.get_lock_state",
+        wraps=TTLockApi.get_lock_state,
+        autospec=True,
+    ) as get_lock_state:
+        coordinator = await component_setup()
+        assert not get_lock_state.called
+        assert coordinator.data.name == BASIC_LOCK_DETAILS["lockAlias"]
+        assert coordinator.data.locked is None
+
+        async_fire_time_changed(
+            hass, dt.utcnow() + timedelta(seconds=startup_window(1))
+        )
+        await hass.async_block_till_done()
+
+    assert get_lock_state.called
+    assert coordinator.data.locked is False
+
+
+async def test_first_refresh_fills_in_the_device(
+    hass, component_setup, mock_api_responses
+):
+    mock_api_responses("default")
+    coordinator = await component_setup()
+    registry = dr.async_get(hass)
+    device = registry.async_get_device(identifiers={(DOMAIN, coordinator.data.mac)})
+    assert device.model is None
+
+    async_fire_time_changed(hass, dt.utcnow() + timedelta(seconds=startup_window(1)))
+    await hass.async_block_till_done()
+
+    device = registry.async_get(device.id)
+    assert device.model == BASIC_LOCK_DETAILS["modelNum"]
+    assert device.sw_version == BASIC_LOCK_DETAILS["firmwareRevision"]
+    assert device.hw_version == BASIC_LOCK_DETAILS["hardwareRevision"]
+
+
+def test_startup_offsets_fill_the_window():
+    offsets = sorted(lock_phase(lock_id) for lock_id in range(1000))
+
+    assert 0 <= offsets[0] < 0.01
+    assert 0.99 < offsets[-1] < 1
+    assert startup_window(1000) == STARTUP_WINDOW_MAX
+
+
+class CountingCoordinator(LockUpdateCoordinator):
+    """Counts the webhook events delivered to it."""
+
+    delivered = 0
+    batches = 0
+
+    @callback
+    def _process_webhook_events(self, events: list[WebhookEvent]):
+        CountingCoordinator.delivered += len(events)
+        CountingCoordinator.batches += 1
+        assert all(event.id == self.lock_id for event in events)
+
+
+class FakeRequest:
+    def __init__(self, records: list[dict]) -> None:
+        self._data = MultiDict(records=json.dumps(records))
+
+    async def post(self) -> MultiDict:
+        return self._data
+
+
+async def test_webhook_benchmark_only_wakes_target_lock(hass, record_property):
+    """Replay a 1,000 record batch against 500 co-ordinators."""
+    locks = 500
+    coordinators = [CountingCoordinator(hass, None, id) for id in range(locks)]
+    records = [{**WEBHOOK_UNLOCK_10AM_UTC, "lockId": n % locks} for n in range(1000)]
+    entry = MockConfigEntry(domain=DOMAIN, data={CONF_WEBHOOK_STATUS: True})
+    queue = WebhookQueue(hass)
+    CountingCoordinator.delivered = CountingCoordinator.batches = 0
+
+    start = time.perf_counter()
+    await WebhookHandler(hass, entry, queue, Metrics()).handle_webhook(
+        hass, "webhook-id", FakeRequest(records)
+    )
+    acked = time.perf_counter() - start
+    queue.async_process()
+    elapsed = time.perf_counter() - start
+
+    record_property("ack_ms", round(acked * 1000, 2))
+    record_property("batch_ms", round(elapsed * 1000, 2))
+    assert CountingCoordinator.delivered == len(records)
+    # Two events for each lock, delivered together
+    assert CountingCoordinator.batches == locks
+
+    for coordinator in coordinators:
+        await coordinator.async_shutdown()
+
+
+async def test_webhook_is_refused_when_the_queue_is_full(hass):
+    entry = MockConfigEntry(domain=DOMAIN, data={CONF_WEBHOOK_STATUS: True})
+    queue = WebhookQueue(hass, maxsize=1)
+    handler = WebhookHandler(hass, entry, queue, Metrics())
+    request = FakeRequest([WEBHOOK_UNLOCK_10AM_UTC])
+
+    assert await handler.handle_webhook(hass, "webhook-id", request) is None
+    response = await handler.handle_webhook(hass, "webhook-id", request)
+
+    assert response.status == HTTPStatus.SERVICE_UNAVAILABLE
+    assert queue.depth == 1
+    assert queue.stats.dropped == 1
+
+
+async def test_webhook_parse_failures_are_counted(hass):
+    entry = MockConfigEntry(domain=DOMAIN, data={CONF_WEBHOOK_STATUS: True})
+    metrics = Metrics()
+    handler = WebhookHandler(hass, entry, WebhookQueue(hass), metrics)
+
+    await handler.handle_webhook(hass, "webhook-id", FakeRequest([{"lockId": 1}]))
+
+    assert metrics.counters["webhook_parse_failures"] == {None: 1}
+    assert "webhook_records" not in metrics.counters
+
+
+async def test_webhook_events_reach_the_lock(
+    hass, component_setup, config_entry, mock_api_responses
+):
+    mock_api_responses("default")
+    coordinator = await component_setup()
+    coordinator.async_update_state(locked=True, auto_lock_seconds=-1)
+    queue = hass.data[DOMAIN][config_entry.entry_id][TT_WEBHOOK_QUEUE]
+
+    # The first webhook also confirms the setup in the entry's data
+    await WebhookHandler(hass, config_entry, queue, Metrics()).handle_webhook(
+        hass, "webhook-id", FakeRequest([WEBHOOK_UNLOCK_10AM_UTC])
+    )
+    assert coordinator.data.locked is True
+    await hass.async_block_till_done()
+
+    assert coordinator.data.locked is False
+    assert queue.stats.batches == 1
+    assert config_entry.data[CONF_WEBHOOK_STATUS]
+    assert coordinator is hass.data[DOMAIN][config_entry.entry_id][TT_LOCKS][0]
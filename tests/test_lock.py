@@ -1,3 +1,6 @@
+from unittest.mock import patch
+
+from custom_components.ttlock.lock import Lock
 from homeassistant.core import HomeAssistant
 
 
@@ -6,3 +9,45 @@ async def test_lock_states(hass: HomeAssistant, mock_api_responses, component_se
     mock_api_responses("default")
     coordinator = await component_setup()
     assert not coordinator.data.locked
+
+
+async def test_burst_of_updates_is_written_once(
+    hass: HomeAssistant, mock_api_responses, component_setup
+):
+    mock_api_responses("default")
+    coordinator = await component_setup()
+    await hass.async_block_till_done()
+    lock = next(entity for entity in coordinator.entities if isinstance(entity, Lock))
+
+    with patch.object(lock, "async_write_ha_state") as write:
+        coordinator.async_update_state(locked=True)
+        coordinator.async_update_state(locked=False)
+        coordinator.async_update_state(locked=True)
+        await hass.async_block_till_done()
+
+    assert write.call_count == 1
+    assert lock.is_locked is True
+
+
+async def test_unchanged_entities_are_not_written(
+    hass: HomeAssistant, mock_api_responses, component_setup
+):
+    mock_api_responses("default")
+    coordinator = await component_setup()
+    coordinator.async_update_state(locked=True)
+    await hass.async_block_till_done()
+
+    with patch(
+        "custom_components.ttlock.entity.BaseLockEntity.async_write_ha_state",
+        autospec=True,
+    ) as write:
+        coordinator.async_update_state(hardware_version="2.0")
+        await hass.async_block_till_done()
+        assert write.call_count == 0
+
+        coordinator.async_update_state(battery_level=1)
+        await hass.async_block_till_done()
+
+    assert [type(call.args[0]).__name__ for call in write.call_args_list] == [
+        "LockBattery"
+    ]
@@ -0,0 +1,54 @@
+"""Test the metrics registry."""
+import pytest
+
+from custom_components.ttlock.metrics import Histogram, Metrics
+
+
+class TestHistogram:
+    def test_buckets_are_cumulative(self):
+        histogram = Histogram(buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value)
+
+        summary = histogram.as_dict()
+
+        assert summary["buckets"] == {"0.1": 2, "1.0": 3, "+Inf": 4}
+        assert summary["count"] == 4
+        assert summary["sum"] == 2.65
+        assert summary["max"] == 2.0
+        assert histogram.last == 2.0
+
+
+class TestMetrics:
+    def test_counters_are_kept_per_label(self):
+        metrics = Metrics()
+
+        metrics.inc("requests", "lock/detail")
+        metrics.inc("requests", "lock/detail")
+        metrics.inc("requests", "lock/list", amount=3)
+
+        assert metrics.as_dict()["counters"] == {
+            "requests": {"lock/detail": 2, "lock/list": 3}
+        }
+
+    def test_timed_records_duration_and_errors(self):
+        metrics = Metrics()
+
+        with metrics.timed("refresh_seconds", 1):
+            pass
+        with pytest.raises(ValueError), metrics.timed("refresh_seconds", 1):
+            raise ValueError
+
+        assert metrics.histogram("refresh_seconds", 1).count == 2
+        assert metrics.counters["refresh_seconds_errors"] == {1: 1}
+
+    def test_missing_histogram(self):
+        assert Metrics().histogram("refresh_seconds", 1) is None
+
+    def test_gauges_keep_the_latest_value(self):
+        metrics = Metrics()
+
+        metrics.set_gauge("gateway_queue_depth", "bulk", 5)
+        metrics.set_gauge("gateway_queue_depth", "bulk", 2)
+
+        assert metrics.as_dict()["gauges"] == {"gateway_queue_depth": {"bulk": 2}}
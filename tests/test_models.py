@@ -1,4 +1,5 @@
 from datetime import datetime, timedelta
+import time
 
 import pytest
 
@@ -11,9 +12,18 @@ from custom_components.ttlock.models import (
     EpochMs,
     Features,
     Lock,
+    LockSummary,
     OnOff,
     PassageModeConfig,
     Passcode,
+    WebhookEvent,
+)
+
+from .const import (
+    WEBHOOK_LOCK_10AM_UTC,
+    WEBHOOK_SENSOR_CLOSE,
+    WEBHOOK_SENSOR_OPEN,
+    WEBHOOK_UNLOCK_10AM_UTC,
 )
 
 
@@ -182,3 +192,90 @@ class TestLock:
             }
         )
         assert lock.lockSound == expected
+
+
+class TestLockSummary:
+    @pytest.mark.parametrize(
+        ("value", "expected"),
+        [({}, True), ({"hasGateway": 1}, True), ({"hasGateway": 0}, False)],
+    )
+    def test_only_an_explicit_0_means_no_gateway(self, value, expected):
+        lock = LockSummary.parse_obj({"lockId": 123, "lockMac": "AA", **value})
+        assert lock.has_gateway is expected
+
+
+def _same_event(a: WebhookEvent, b: WebhookEvent) -> bool:
+    return (
+        a.dict() == b.dict()
+        and a.event.value == b.event.value
+        and a.lock_ts.tzinfo == b.lock_ts.tzinfo
+        and a.state == b.state
+        and a.sensorState == b.sensorState
+    )
+
+
+class TestWebhookEventFromRecord:
+    @pytest.mark.parametrize(
+        "record",
+        [
+            WEBHOOK_LOCK_10AM_UTC,
+            WEBHOOK_UNLOCK_10AM_UTC,
+            WEBHOOK_SENSOR_OPEN,
+            WEBHOOK_SENSOR_CLOSE,
+            {**WEBHOOK_UNLOCK_10AM_UTC, "success": 0},
+            {**WEBHOOK_UNLOCK_10AM_UTC, "success": True},
+            {**WEBHOOK_UNLOCK_10AM_UTC, "electricQuantity": None},
+            {**WEBHOOK_UNLOCK_10AM_UTC, "recordType": 29, "keyboardPwd": "123"},
+            {k: v for k, v in WEBHOOK_UNLOCK_10AM_UTC.items() if k != "username"},
+            # Not the usual types, these go through pydantic
+            {
+                **WEBHOOK_UNLOCK_10AM_UTC,
+                "lockId": str(WEBHOOK_UNLOCK_10AM_UTC["lockId"]),
+            },
+            {**WEBHOOK_UNLOCK_10AM_UTC, "success": "1"},
+            {**WEBHOOK_UNLOCK_10AM_UTC, "lockDate": 1682244497000.5},
+        ],
+    )
+    async def test_same_as_parse_obj(self, hass, record):
+        await hass.config.async_set_time_zone("Pacific/Auckland")
+
+        assert _same_event(
+            WebhookEvent.from_record(record), WebhookEvent.parse_obj(record)
+        )
+
+    @pytest.mark.parametrize(
+        "record",
+        [
+            {**WEBHOOK_UNLOCK_10AM_UTC, "recordType": 9999},
+            {**WEBHOOK_UNLOCK_10AM_UTC, "recordType": "7"},
+            {**WEBHOOK_UNLOCK_10AM_UTC, "lockId": "front door"},
+            {**WEBHOOK_UNLOCK_10AM_UTC, "success": 2},
+            {k: v for k, v in WEBHOOK_UNLOCK_10AM_UTC.items() if k != "lockDate"},
+            "not a record",
+        ],
+    )
+    def test_invalid_records_are_rejected(self, record):
+        with pytest.raises(ValueError):
+            WebhookEvent.parse_obj(record)
+        with pytest.raises(ValueError):
+            WebhookEvent.from_record(record)
+
+    def test_benchmark(self, record_property):
+        records = [
+            {**WEBHOOK_UNLOCK_10AM_UTC, "lockId": n, "lockDate": 1682244497000 + n}
+            for n in range(2000)
+        ]
+
+        def rate(parse) -> float:
+            start = time.process_time()
+            for record in records:
+                event = parse(record)
+                event.state, event.sensorState
+            return len(records) / (time.process_time() - start)
+
+        legacy = rate(WebhookEvent.parse_obj)
+        current = rate(WebhookEvent.from_record)
+
+        record_property("parse_obj_records_per_sec", round(legacy))
+        record_property("from_record_records_per_sec", round(current))
+        assert current > legacy
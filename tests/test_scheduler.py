@@ -0,0 +1,194 @@
+"""Test the gateway scheduler."""
+import asyncio
+import time
+
+from custom_components.ttlock.metrics import Metrics
+from custom_components.ttlock.scheduler import (
+    LANE_BULK,
+    LANE_INTERACTIVE,
+    GatewayScheduler,
+    PrioritySemaphore,
+    TokenBucket,
+)
+
+
+async def _run(
+    scheduler: GatewayScheduler,
+    lock_id: int,
+    active: dict,
+    peaks: dict,
+    lane: str = LANE_INTERACTIVE,
+):
+    gateway = scheduler.gateway_for(lock_id)
+    async with scheduler.slot(lock_id, lane):
+        active[gateway] = active.get(gateway, 0) + 1
+        active["account"] = active.get("account", 0) + 1
+        peaks[gateway] = max(peaks.get(gateway, 0), active[gateway])
+        peaks["account"] = max(peaks.get("account", 0), active["account"])
+        await asyncio.sleep(0.01)
+        active[gateway] -= 1
+        active["account"] -= 1
+
+
+class TestGatewayScheduler:
+    async def test_locks_behind_one_gateway_are_serialized(self):
+        scheduler = GatewayScheduler(per_gateway=1, per_account=10)
+        scheduler.update_gateways({1: 100, 2: 100, 3: 100})
+        active, peaks = {}, {}
+
+        await asyncio.gather(*[_run(scheduler, id, active, peaks) for id in (1, 2, 3)])
+
+        assert peaks[100] == 1
+
+    async def test_independent_gateways_run_in_parallel(self):
+        scheduler = GatewayScheduler(per_gateway=1, per_account=10)
+        scheduler.update_gateways({1: 100, 2: 200, 3: 300})
+        active, peaks = {}, {}
+
+        await asyncio.gather(*[_run(scheduler, id, active, peaks) for id in (1, 2, 3)])
+
+        assert peaks["account"] == 3
+
+    async def test_account_limit_applies_across_gateways(self):
+        scheduler = GatewayScheduler(per_gateway=1, per_account=2)
+        scheduler.update_gateways({id: id * 100 for id in range(1, 6)})
+        active, peaks = {}, {}
+
+        await asyncio.gather(
+            *[_run(scheduler, id, active, peaks) for id in range(1, 6)]
+        )
+
+        assert peaks["account"] == 2
+
+    async def test_unknown_locks_share_a_gateway(self):
+        scheduler = GatewayScheduler(per_gateway=1, per_account=10)
+
+        assert scheduler.gateway_for(1) == scheduler.gateway_for(2)
+
+    async def test_interactive_calls_go_ahead_of_queued_bulk_calls(self):
+        scheduler = GatewayScheduler(per_gateway=1, per_account=10, per_bulk=10)
+        order = []
+
+        async def call(name, lane):
+            async with scheduler.slot(1, lane):
+                order.append(name)
+                await asyncio.sleep(0.01)
+
+        bulk = [asyncio.create_task(call(f"delete {n}", LANE_BULK)) for n in range(3)]
+        await asyncio.sleep(0)
+        await asyncio.gather(call("unlock", LANE_INTERACTIVE), *bulk)
+
+        # The delete already running finishes, the unlock is next
+        assert order == ["delete 0", "unlock", "delete 1", "delete 2"]
+
+    async def test_bulk_lane_leaves_room_for_interactive_calls(self):
+        scheduler = GatewayScheduler(per_gateway=1, per_account=4, per_bulk=10)
+        scheduler.update_gateways({id: id * 100 for id in range(1, 7)})
+        active, peaks = {}, {}
+
+        await asyncio.gather(
+            *[_run(scheduler, id, active, peaks, LANE_BULK) for id in range(1, 7)]
+        )
+
+        assert peaks["account"] == 3
+
+    async def test_bulk_lane_defaults_to_all_but_one_account_slot(self):
+        scheduler = GatewayScheduler(per_gateway=1, per_account=4)
+        scheduler.update_gateways({id: id * 100 for id in range(1, 7)})
+        active, peaks = {}, {}
+
+        await asyncio.gather(
+            *[_run(scheduler, id, active, peaks, LANE_BULK) for id in range(1, 7)]
+        )
+
+        assert peaks["account"] == 3
+
+    async def test_bulk_calls_on_a_busy_gateway_dont_block_idle_ones(self):
+        scheduler = GatewayScheduler(per_gateway=1, per_account=10, per_bulk=2)
+        scheduler.update_gateways({1: 100, 2: 100, 3: 100, 4: 400})
+        busy = asyncio.Event()
+        started = []
+
+        async def call(lock_id):
+            async with scheduler.slot(lock_id, LANE_BULK):
+                started.append(lock_id)
+                if lock_id == 1:
+                    await busy.wait()
+
+        queued = [asyncio.create_task(call(id)) for id in (1, 2, 3)]
+        await asyncio.sleep(0)
+        await asyncio.wait_for(call(4), 1)
+        assert started == [1, 4]
+
+        busy.set()
+        await asyncio.gather(*queued)
+        assert started == [1, 4, 2, 3]
+
+    async def test_queue_depth_is_recorded_per_lane(self):
+        metrics = Metrics()
+        scheduler = GatewayScheduler(per_gateway=1, per_account=10, metrics=metrics)
+        active, peaks = {}, {}
+
+        calls = [
+            asyncio.create_task(_run(scheduler, 1, active, peaks, LANE_BULK))
+            for _ in range(3)
+        ]
+        await asyncio.sleep(0)
+        assert scheduler.queued(LANE_BULK) == 2
+        await asyncio.gather(*calls)
+
+        gauges = metrics.as_dict()["gauges"]
+        assert gauges["gateway_queue_depth"] == {"bulk": 0}
+        assert gauges["gateway_queue_peak"] == {"bulk": 2}
+        assert metrics.histogram("lane_wait_seconds", LANE_BULK).count == 3
+
+
+class TestPrioritySemaphore:
+    async def test_most_urgent_waiter_is_served_first(self):
+        semaphore = PrioritySemaphore(1)
+        await semaphore.acquire()
+        order = []
+
+        async def wait(name, priority):
+            await semaphore.acquire(priority)
+            order.append(name)
+            semaphore.release()
+
+        waiters = [
+            asyncio.create_task(wait(name, priority))
+            for name, priority in (("low 1", 1), ("high", 0), ("low 2", 1))
+        ]
+        await asyncio.sleep(0)
+        semaphore.release()
+        await asyncio.gather(*waiters)
+
+        assert order == ["high", "low 1", "low 2"]
+
+    async def test_cancelled_waiter_does_not_keep_a_slot(self):
+        semaphore = PrioritySemaphore(1)
+        await semaphore.acquire()
+        cancelled = asyncio.create_task(semaphore.acquire())
+        await asyncio.sleep(0)
+
+        # Handed the slot, then cancelled before it could run
+        semaphore.release()
+        cancelled.cancel()
+        await asyncio.gather(cancelled, return_exceptions=True)
+
+        await asyncio.wait_for(semaphore.acquire(), 1)
+
+
+class TestTokenBucket:
+    async def test_burst_up_to_capacity_is_not_throttled(self):
+        bucket = TokenBucket(rate=100, capacity=5)
+
+        assert [await bucket.acquire() for _ in range(5)] == [False] * 5
+
+    async def test_requests_beyond_capacity_are_paced(self):
+        bucket = TokenBucket(rate=50, capacity=1)
+
+        start = time.monotonic()
+        results = [await bucket.acquire() for _ in range(4)]
+
+        assert results == [False, True, True, True]
+        assert time.monotonic() - start >= 3 / 50 * 0.9
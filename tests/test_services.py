@@ -3,14 +3,18 @@ from datetime import timedelta
 from unittest.mock import call, patch
 
 import pytest
+import voluptuous as vol
 
+from custom_components.ttlock.api import RequestFailed
 from custom_components.ttlock.const import (
     DOMAIN,
     SVC_CLEANUP_PASSCODES,
     SVC_CONFIG_AUTOLOCK,
     SVC_CREATE_PASSCODE,
+    SVC_EXPORT_RECORDS,
     SVC_LIST_PASSCODES,
     SVC_LIST_RECORDS,
+    SVC_SYNC_PASSCODES,
 )
 from custom_components.ttlock.models import (
     AddPasscodeConfig,
@@ -21,6 +25,7 @@ from custom_components.ttlock.models import (
 )
 from homeassistant.const import ATTR_ENTITY_ID
 from homeassistant.core import HomeAssistant
+from homeassistant.exceptions import HomeAssistantError
 from homeassistant.util import dt
 
 
@@ -135,6 +140,32 @@ class Test_list_passcodes:
 
         assert response == {"passcodes": {entity_id: []}}
 
+    async def test_list_passcodes_reports_failures(
+        self, hass: HomeAssistant, component_setup, mock_api_responses
+    ):
+        """Test a failing lock is reported rather than failing the call."""
+        mock_api_responses("default")
+        coordinator = await component_setup()
+        entity_id = coordinator.entities[0].entity_id
+
+        with patch(
+            "custom_components.ttlock.api.TTLockApi.list_passcodes",
+            side_effect=RequestFailed("API returned: offline"),
+        ):
+            response = await hass.services.async_call(
+                DOMAIN,
+                SVC_LIST_PASSCODES,
+                {ATTR_ENTITY_ID: entity_id},
+                blocking=True,
+                return_response=True,
+            )
+            await hass.async_block_till_done()
+
+        assert response == {
+            "passcodes": {},
+            "errors": {entity_id: "API returned: offline"},
+        }
+
 
 class Test_list_records:
     async def test_list_records(
@@ -284,6 +315,62 @@ class Test_list_records:
             assert kwargs["page_size"] == 100
 
 
+class Test_export_records:
+    @pytest.mark.parametrize("file_format", ("jsonl", "csv"))
+    async def test_export_records(
+        self,
+        hass: HomeAssistant,
+        component_setup,
+        mock_api_responses,
+        tmp_path,
+        file_format,
+    ):
+        """Test every page is written to the export file."""
+        mock_api_responses("default")
+        coordinator = await component_setup()
+        entity_id = coordinator.entities[0].entity_id
+        hass.config.config_dir = str(tmp_path)
+
+        def record(id: int) -> LockRecord:
+            return LockRecord(
+                recordId=id,
+                lockId=coordinator.lock_id,
+                recordType=RecordType.PASSWORD_UNLOCK,
+                success=True,
+                lockDate=int(dt.now().timestamp() * 1000),
+                serverDate=int(dt.now().timestamp() * 1000),
+            )
+
+        async def pages(lock_id, **kwargs):
+            yield [record(1), record(2)]
+            yield [record(3)]
+
+        with patch(
+            "custom_components.ttlock.api.TTLockApi.iter_lock_record_pages",
+            side_effect=pages,
+        ):
+            response = await hass.services.async_call(
+                DOMAIN,
+                SVC_EXPORT_RECORDS,
+                {ATTR_ENTITY_ID: entity_id, "format": file_format},
+                blocking=True,
+                return_response=True,
+            )
+            await hass.async_block_till_done()
+
+        export = response["files"][entity_id]
+        assert export["records"] == 3
+        assert export["path"].startswith(str(tmp_path / "ttlock_exports"))
+        assert export["path"].endswith(f".{file_format}")
+
+        with open(export["path"], encoding="utf-8") as file:
+            lines = file.read().splitlines()
+        if file_format == "csv":
+            assert lines[0].startswith("id,lock_id,record_type")
+            lines = lines[1:]
+        assert len(lines) == 3
+
+
 class Test_create_passcode:
     async def test_can_create_passcode(
         self, hass: HomeAssistant, component_setup, mock_api_responses
@@ -323,6 +410,30 @@ class Test_create_passcode:
                 )
             ]
 
+    async def test_failure_is_raised_without_a_response(
+        self, hass: HomeAssistant, component_setup, mock_api_responses
+    ):
+        mock_api_responses("default")
+        coordinator = await component_setup()
+        entity_id = coordinator.entities[0].entity_id
+
+        with patch(
+            "custom_components.ttlock.api.TTLockApi.add_passcode",
+            side_effect=RequestFailed("API returned: offline"),
+        ), pytest.raises(HomeAssistantError, match=entity_id):
+            await hass.services.async_call(
+                DOMAIN,
+                SVC_CREATE_PASSCODE,
+                {
+                    ATTR_ENTITY_ID: entity_id,
+                    "passcode_name": "Test User",
+                    "passcode": 1234,
+                    "start_time": dt.now(),
+                    "end_time": dt.now() + timedelta(days=1),
+                },
+                blocking=True,
+            )
+
 
 class Test_cleanup_passcodes:
     @pytest.mark.parametrize("return_response", (True, False))
@@ -384,3 +495,175 @@ class Test_cleanup_passcodes:
             assert mock.call_args_list == [call(coordinator.lock_id, 123)]
 
         assert response == {"removed": {entity_id: ["Test"]}}
+
+
+class Test_sync_passcodes:
+    START = dt.now().replace(second=0, microsecond=0)
+    END = START + timedelta(days=7)
+
+    def _existing(self, id, name, passcode, end=END, type=PasscodeType.temporary):
+        return Passcode(
+            keyboardPwdId=id,
+            keyboardPwdType=type,
+            keyboardPwdName=name,
+            keyboardPwd=passcode,
+            startDate=int(self.START.timestamp() * 1000),
+            endDate=int(end.timestamp() * 1000),
+        )
+
+    def _wanted(self, name, passcode):
+        return {
+            "passcode_name": name,
+            "passcode": passcode,
+            "start_time": self.START,
+            "end_time": self.END,
+        }
+
+    async def _sync(self, hass, entity_id, existing, passcodes, **data):
+        with patch(
+            "custom_components.ttlock.api.TTLockApi.list_passcodes",
+            return_value=existing,
+        ), patch(
+            "custom_components.ttlock.api.TTLockApi.add_passcode", return_value=True
+        ) as add, patch(
+            "custom_components.ttlock.api.TTLockApi.delete_passcode",
+            return_value=True,
+        ) as delete:
+            response = await hass.services.async_call(
+                DOMAIN,
+                SVC_SYNC_PASSCODES,
+                {ATTR_ENTITY_ID: entity_id, "passcodes": passcodes, **data},
+                blocking=True,
+                return_response=True,
+            )
+        return response, add, delete
+
+    async def test_only_the_differences_are_applied(
+        self, hass: HomeAssistant, component_setup, mock_api_responses
+    ):
+        mock_api_responses("default")
+        coordinator = await component_setup()
+        entity_id = coordinator.entities[0].entity_id
+        existing = [
+            self._existing(1, "Kept", "1111"),
+            self._existing(2, "Extended", "2222", end=self.END - timedelta(days=1)),
+            self._existing(3, "Old guest", "3333"),
+            self._existing(4, "Owner", "4444", type=PasscodeType.permanent),
+        ]
+
+        response, add, delete = await self._sync(
+            hass,
+            entity_id,
+            existing,
+            [
+                self._wanted("Kept", "1111"),
+                self._wanted("Extended", "2222"),
+                self._wanted("New guest", "5555"),
+            ],
+        )
+
+        assert sorted(call.args[1] for call in delete.call_args_list) == [2, 3]
+        assert [call.args[1].passcode for call in add.call_args_list] == [
+            "2222",
+            "5555",
+        ]
+        assert response == {
+            "synced": {
+                entity_id: {
+                    "added": ["Extended", "New guest"],
+                    "removed": ["Extended", "Old guest"],
+                    "unchanged": 1,
+                    "conflicts": [],
+                    "failed": [],
+                }
+            }
+        }
+
+    async def test_running_again_changes_nothing(
+        self, hass: HomeAssistant, component_setup, mock_api_responses
+    ):
+        mock_api_responses("default")
+        coordinator = await component_setup()
+        entity_id = coordinator.entities[0].entity_id
+
+        response, add, delete = await self._sync(
+            hass,
+            entity_id,
+            [self._existing(1, "Guest", "1111")],
+            [self._wanted("Guest", "1111")],
+        )
+
+        assert not add.called
+        assert not delete.called
+        assert response["synced"][entity_id]["unchanged"] == 1
+
+    async def test_listing_is_not_served_from_the_cache(
+        self, hass: HomeAssistant, component_setup, mock_api_responses
+    ):
+        mock_api_responses("default")
+        coordinator = await component_setup()
+        entity_id = coordinator.entities[0].entity_id
+
+        with patch(
+            "custom_components.ttlock.api.TTLockApi.list_passcodes", return_value=[]
+        ) as list_passcodes:
+            await hass.services.async_call(
+                DOMAIN,
+                SVC_SYNC_PASSCODES,
+                {ATTR_ENTITY_ID: entity_id, "passcodes": []},
+                blocking=True,
+            )
+
+        assert list_passcodes.call_args.kwargs == {"fresh": True}
+
+    async def test_other_kinds_of_passcode_are_conflicts(
+        self, hass: HomeAssistant, component_setup, mock_api_responses
+    ):
+        mock_api_responses("default")
+        coordinator = await component_setup()
+        entity_id = coordinator.entities[0].entity_id
+
+        response, add, delete = await self._sync(
+            hass,
+            entity_id,
+            [self._existing(1, "Owner", "1111", type=PasscodeType.permanent)],
+            [self._wanted("Guest", "1111")],
+        )
+
+        assert not add.called
+        assert not delete.called
+        assert response["synced"][entity_id]["conflicts"] == ["Guest"]
+        assert "errors" not in response
+
+    async def test_unlisted_passcodes_can_be_kept(
+        self, hass: HomeAssistant, component_setup, mock_api_responses
+    ):
+        mock_api_responses("default")
+        coordinator = await component_setup()
+        entity_id = coordinator.entities[0].entity_id
+
+        _, add, delete = await self._sync(
+            hass,
+            entity_id,
+            [self._existing(1, "Other guest", "1111")],
+            [self._wanted("Guest", "2222")],
+            remove_unlisted=False,
+        )
+
+        assert not delete.called
+        assert add.call_count == 1
+
+    async def test_passcodes_must_be_unique(
+        self, hass: HomeAssistant, component_setup, mock_api_responses
+    ):
+        mock_api_responses("default")
+        coordinator = await component_setup()
+        entity_id = coordinator.entities[0].entity_id
+
+        with pytest.raises(vol.Invalid):
+            await self._sync(
+                hass,
+                entity_id,
+                [],
+                [self._wanted("Guest", "1111"), self._wanted("Other", "1111")],
+            )
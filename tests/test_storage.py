@@ -0,0 +1,220 @@
+"""Test the persistent lock cache."""
+from contextlib import suppress
+from datetime import timedelta
+from unittest.mock import patch
+
+from pytest_homeassistant_custom_component.common import async_fire_time_changed
+
+from custom_components.ttlock.api import RequestFailed
+from custom_components.ttlock.const import DOMAIN, TT_LOCKS
+from custom_components.ttlock.coordinator import (
+    STARTUP_WINDOW_MAX,
+    LockState,
+    SensorData,
+)
+from custom_components.ttlock.models import Features, PassageModeConfig
+from custom_components.ttlock.storage import (
+    STORAGE_VERSION,
+    lock_state_from_dict,
+    lock_state_to_dict,
+)
+from homeassistant.config_entries import ConfigEntryState
+from homeassistant.util import dt
+
+from .const import BASIC_LOCK_DETAILS, PASSAGE_MODE_6_TO_6_7_DAYS
+
+LOCK_ID = BASIC_LOCK_DETAILS["lockId"]
+
+
+def _cached_state(**kwargs) -> LockState:
+    return LockState(
+        **{
+            "name": "Cached Door",
+            "mac": BASIC_LOCK_DETAILS["lockMac"],
+            "model": "SN9206_PV53",
+            "features": Features.from_feature_value(BASIC_LOCK_DETAILS["featureValue"]),
+            "passage_mode_config": PassageModeConfig.parse_obj(
+                PASSAGE_MODE_6_TO_6_7_DAYS
+            ),
+            **kwargs,
+        }
+    )
+
+
+def _store(hass_storage, config_entry, *states: tuple[int, LockState]) -> None:
+    hass_storage[f"{DOMAIN}.{config_entry.entry_id}"] = {
+        "version": STORAGE_VERSION,
+        "key": f"{DOMAIN}.{config_entry.entry_id}",
+        "data": {str(id): lock_state_to_dict(state) for id, state in states},
+    }
+
+
+class TestSerialization:
+    def test_round_trip_keeps_metadata(self):
+        state = _cached_state(
+            battery_level=80, lock_sound=True, sensor=SensorData(battery=55)
+        )
+
+        restored = lock_state_from_dict(lock_state_to_dict(state))
+
+        assert restored.name == state.name
+        assert restored.features == state.features
+        assert restored.passage_mode_config == state.passage_mode_config
+        assert restored.sensor == SensorData(battery=55)
+
+    def test_transient_state_is_not_restored(self):
+        state = _cached_state(locked=True, last_user="someone")
+
+        restored = lock_state_from_dict(lock_state_to_dict(state))
+
+        assert restored.locked is None
+        assert restored.last_user is None
+
+
+class TestStartup:
+    async def test_entities_come_from_cache_when_cloud_is_down(
+        self, hass, component_setup, config_entry, hass_storage
+    ):
+        _store(hass_storage, config_entry, (LOCK_ID, _cached_state()))
+
+        with patch(
+            "custom_components.ttlock.api.TTLockApi.list_locks",
+            side_effect=RequestFailed("offline"),
+        ) as list_locks:
+            coordinator = await component_setup()
+            await hass.async_block_till_done()
+
+        assert config_entry.state is ConfigEntryState.LOADED
+        assert list_locks.called
+        assert coordinator.data.name == "Cached Door"
+        assert coordinator.last_update_success
+        assert hass.states.get(coordinator.entities[0].entity_id)
+
+    async def test_cloud_refresh_reconciles_cached_locks(
+        self, hass, component_setup, config_entry, hass_storage, mock_api_responses
+    ):
+        mock_api_responses("default")
+        _store(hass_storage, config_entry, (LOCK_ID, _cached_state()))
+
+        coordinator = await component_setup()
+        await hass.async_block_till_done()
+        async_fire_time_changed(
+            hass, dt.utcnow() + timedelta(seconds=STARTUP_WINDOW_MAX)
+        )
+        await hass.async_block_till_done()
+
+        assert coordinator.data.name == BASIC_LOCK_DETAILS["lockAlias"]
+        assert coordinator.data.locked is False
+
+    async def test_locks_are_refreshed_after_an_outage_at_boot(
+        self, hass, component_setup, config_entry, hass_storage, mock_api_responses
+    ):
+        mock_api_responses("default")
+        _store(hass_storage, config_entry, (LOCK_ID, _cached_state()))
+
+        with patch(
+            "custom_components.ttlock.api.TTLockApi.list_locks",
+            side_effect=RequestFailed("offline"),
+        ):
+            coordinator = await component_setup()
+            await hass.async_block_till_done()
+        async_fire_time_changed(
+            hass, dt.utcnow() + timedelta(seconds=STARTUP_WINDOW_MAX)
+        )
+        await hass.async_block_till_done()
+
+        assert coordinator.data.locked is False
+
+    async def test_changed_lock_set_reloads(
+        self, hass, component_setup, config_entry, hass_storage, mock_api_responses
+    ):
+        mock_api_responses("default")
+        _store(
+            hass_storage,
+            config_entry,
+            (LOCK_ID, _cached_state()),
+            (1234, _cached_state(name="Gone", mac="00:00:00:00:00:01")),
+        )
+
+        with patch(
+            "homeassistant.config_entries.ConfigEntries.async_schedule_reload"
+        ) as reload:
+            await component_setup()
+            await hass.async_block_till_done()
+
+        assert reload.call_args.args == (config_entry.entry_id,)
+
+    async def test_reload_after_a_changed_lock_set_settles(
+        self,
+        hass,
+        component_setup,
+        config_entry,
+        hass_storage,
+        mock_api_responses,
+        monkeypatch,
+    ):
+        mock_api_responses("default")
+        monkeypatch.setattr("custom_components.ttlock.storage.SAVE_DELAY", 0)
+        _store(
+            hass_storage,
+            config_entry,
+            (LOCK_ID, _cached_state()),
+            (1234, _cached_state(name="Gone", mac="00:00:00:00:00:01")),
+        )
+
+        with patch.object(
+            hass.config_entries,
+            "async_schedule_reload",
+            wraps=hass.config_entries.async_schedule_reload,
+        ) as reload, suppress(KeyError):
+            # The reload can get in before setup has handed back its first lock
+            await component_setup()
+        await hass.async_block_till_done()
+        async_fire_time_changed(hass)
+        await hass.async_block_till_done()
+
+        assert reload.call_count == 1
+        assert config_entry.state is ConfigEntryState.LOADED
+        locks = hass.data[DOMAIN][config_entry.entry_id][TT_LOCKS]
+        assert [coordinator.lock_id for coordinator in locks] == [LOCK_ID]
+        stored = hass_storage[f"{DOMAIN}.{config_entry.entry_id}"]["data"]
+        assert list(stored) == [str(LOCK_ID)]
+
+    async def test_first_setup_saves_the_cache(
+        self,
+        hass,
+        component_setup,
+        config_entry,
+        hass_storage,
+        mock_api_responses,
+        monkeypatch,
+    ):
+        mock_api_responses("default")
+        monkeypatch.setattr("custom_components.ttlock.storage.SAVE_DELAY", 0)
+
+        await component_setup()
+        async_fire_time_changed(
+            hass, dt.utcnow() + timedelta(seconds=STARTUP_WINDOW_MAX)
+        )
+        await hass.async_block_till_done()
+        async_fire_time_changed(hass)
+        await hass.async_block_till_done()
+
+        stored = hass_storage[f"{DOMAIN}.{config_entry.entry_id}"]["data"]
+        assert list(stored) == [str(LOCK_ID)]
+        assert stored[str(LOCK_ID)]["name"] == BASIC_LOCK_DETAILS["lockAlias"]
+        assert stored[str(LOCK_ID)]["model"] == BASIC_LOCK_DETAILS["modelNum"]
+        assert len(hass.data[DOMAIN][config_entry.entry_id][TT_LOCKS]) == 1
+
+    async def test_cache_is_removed_with_the_entry(
+        self, hass, component_setup, config_entry, hass_storage, mock_api_responses
+    ):
+        mock_api_responses("default")
+        _store(hass_storage, config_entry, (LOCK_ID, _cached_state()))
+        await component_setup()
+        await hass.async_block_till_done()
+
+        await hass.config_entries.async_remove(config_entry.entry_id)
+        await hass.async_block_till_done()
+
+        assert f"{DOMAIN}.{config_entry.entry_id}" not in hass_storage